@@ -3,7 +3,9 @@
 from .base import TTSAdapter, VoiceItem, BackendStatus
 from .qwen_adapter import QwenTTSAdapter
 from .indextts_adapter import IndexTTSAdapter
+from .pool import ReplicaPool
 from .factory import AdapterFactory
+from .health import BackendUnavailableError, health_monitor
 
 __all__ = [
     "TTSAdapter",
@@ -11,5 +13,8 @@ __all__ = [
     "BackendStatus",
     "QwenTTSAdapter",
     "IndexTTSAdapter",
+    "ReplicaPool",
     "AdapterFactory",
+    "BackendUnavailableError",
+    "health_monitor",
 ]
@@ -1,8 +1,9 @@
 """TTS 适配器抽象基类"""
 
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
+import httpx
 from pydantic import BaseModel, Field
 
 
@@ -27,9 +28,48 @@ class BackendStatus(BaseModel):
 class TTSAdapter(ABC):
     """TTS 后端适配器抽象基类"""
 
-    def __init__(self, base_url: str, timeout: float = 60.0):
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 60.0,
+        limits: Optional[httpx.Limits] = None,
+        probe_timeout: float = 5.0,
+    ):
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
+        # 聚合查询（状态、音色列表）时等待本后端的最长时间
+        self.probe_timeout = probe_timeout
+        self.limits = limits or httpx.Limits(
+            max_connections=20,
+            max_keepalive_connections=10,
+            keepalive_expiry=30.0,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        共享的连接池客户端
+
+        正常情况下由应用生命周期通过 open() 创建；未启动时（如脚本、测试）
+        首次访问会惰性创建
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+            )
+        return self._client
+
+    async def open(self) -> None:
+        """创建连接池"""
+        _ = self.client
+
+    async def aclose(self) -> None:
+        """关闭连接池"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
 
     @property
     @abstractmethod
@@ -74,9 +114,36 @@ class TTSAdapter(ABC):
         """
         pass
 
+    async def stream_speech(
+        self,
+        text: str,
+        voice: str,
+        **kwargs
+    ) -> AsyncIterator[bytes]:
+        """
+        流式生成语音
+
+        默认实现退化为一次性返回 generate_speech 的结果，
+        支持流式输出的后端应覆盖此方法，边接收边转发音频分块
+
+        Args:
+            text: 待合成文本
+            voice: 音色 ID
+            **kwargs: 其他参数
+
+        Yields:
+            音频二进制分块
+        """
+        yield await self.generate_speech(text=text, voice=voice, **kwargs)
+
     @abstractmethod
     async def list_voices(self) -> List[VoiceItem]:
-        """获取音色列表"""
+        """
+        获取音色列表
+
+        后端不可达或返回错误时抛出异常，不返回空列表，
+        以便调用方区分"没有音色"与"获取失败"并保留已缓存的目录
+        """
         pass
 
     @abstractmethod
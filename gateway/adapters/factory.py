@@ -2,10 +2,14 @@
 
 import logging
 import os
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Type
+
+import httpx
 
 from gateway.config import settings
 from .base import TTSAdapter
+from .health import health_monitor
+from .pool import ReplicaPool
 from .qwen_adapter import QwenTTSAdapter
 from .indextts_adapter import IndexTTSAdapter
 from .mock_adapter import mock_qwen_adapter, mock_indextts_adapter
@@ -48,22 +52,57 @@ class AdapterFactory:
             # 初始化真实适配器
             # 初始化 Qwen3-TTS 适配器
             if settings.qwen3_tts_enabled:
-                cls._adapters["qwen3-tts"] = QwenTTSAdapter(
-                    base_url=settings.qwen3_tts_url,
+                urls = settings.qwen3_tts_urls or [settings.qwen3_tts_url]
+                cls._adapters["qwen3-tts"] = cls._build_adapter(
+                    QwenTTSAdapter,
+                    urls=urls,
+                    weights=settings.qwen3_tts_weights,
+                    policy=settings.qwen3_tts_balance_policy,
                     timeout=settings.qwen3_tts_timeout,
+                    limits=httpx.Limits(
+                        max_connections=settings.qwen3_tts_max_connections,
+                        max_keepalive_connections=settings.qwen3_tts_max_keepalive_connections,
+                        keepalive_expiry=settings.qwen3_tts_keepalive_expiry,
+                    ),
+                    probe_timeout=settings.qwen3_tts_probe_timeout,
                 )
-                logger.info(f"Registered adapter: qwen3-tts ({settings.qwen3_tts_url})")
+                logger.info(f"Registered adapter: qwen3-tts ({', '.join(urls)})")
 
             # 初始化 IndexTTS 适配器
             if settings.indextts_enabled:
-                cls._adapters["indextts-2.0"] = IndexTTSAdapter(
-                    base_url=settings.indextts_url,
+                urls = settings.indextts_urls or [settings.indextts_url]
+                cls._adapters["indextts-2.0"] = cls._build_adapter(
+                    IndexTTSAdapter,
+                    urls=urls,
+                    weights=settings.indextts_weights,
+                    policy=settings.indextts_balance_policy,
                     timeout=settings.indextts_timeout,
+                    limits=httpx.Limits(
+                        max_connections=settings.indextts_max_connections,
+                        max_keepalive_connections=settings.indextts_max_keepalive_connections,
+                        keepalive_expiry=settings.indextts_keepalive_expiry,
+                    ),
+                    probe_timeout=settings.indextts_probe_timeout,
                 )
-                logger.info(f"Registered adapter: indextts-2.0 ({settings.indextts_url})")
+                logger.info(f"Registered adapter: indextts-2.0 ({', '.join(urls)})")
 
         cls._initialized = True
 
+    @staticmethod
+    def _build_adapter(
+        adapter_class: Type[TTSAdapter],
+        urls: List[str],
+        weights: List[float],
+        policy: str,
+        **kwargs,
+    ) -> TTSAdapter:
+        """创建适配器，配置了多个 URL 时组成副本池"""
+        if len(urls) == 1:
+            return adapter_class(base_url=urls[0], **kwargs)
+
+        replicas = [adapter_class(base_url=url, **kwargs) for url in urls]
+        return ReplicaPool(replicas, weights=weights, policy=policy)
+
     @classmethod
     def register(cls, backend_id: str, adapter: TTSAdapter) -> None:
         """注册适配器"""
@@ -91,6 +130,16 @@ class AdapterFactory:
             cls.initialize()
         return list(cls._adapters.keys())
 
+    @classmethod
+    def get_available(cls, backend_id: str) -> Optional[TTSAdapter]:
+        """获取适配器，后端已熔断时返回 None（只读，不占用半开状态的试探机会）"""
+        if not cls._initialized:
+            cls.initialize()
+        adapter = cls._adapters.get(backend_id)
+        if adapter and health_monitor.available(backend_id):
+            return adapter
+        return None
+
     @classmethod
     async def auto_select(cls, **kwargs) -> Optional[TTSAdapter]:
         """
@@ -101,13 +150,22 @@ class AdapterFactory:
         2. emotion_mode 非 preset -> indextts
         3. 语言非中英 -> qwen3-tts
         4. 默认 -> indextts
+
+        已熔断的后端以及 exclude 中的后端会被跳过，按后续策略继续选择
         """
         if not cls._initialized:
             cls.initialize()
 
+        exclude = kwargs.get("exclude") or ()
+
+        def candidate(backend_id: str) -> Optional[TTSAdapter]:
+            if backend_id in exclude:
+                return None
+            return cls.get_available(backend_id)
+
         # 策略 1: 有参考音频 ID -> 使用 Qwen3-TTS
         if kwargs.get("ref_audio_id"):
-            adapter = cls._adapters.get("qwen3-tts")
+            adapter = candidate("qwen3-tts")
             if adapter:
                 logger.debug("Auto-selected qwen3-tts (ref_audio_id provided)")
                 return adapter
@@ -115,7 +173,7 @@ class AdapterFactory:
         # 策略 2: 情感模式非 preset -> 使用 IndexTTS
         emotion_mode = kwargs.get("emotion_mode", "preset")
         if emotion_mode != "preset":
-            adapter = cls._adapters.get("indextts-2.0")
+            adapter = candidate("indextts-2.0")
             if adapter:
                 logger.debug(f"Auto-selected indextts-2.0 (emotion_mode={emotion_mode})")
                 return adapter
@@ -123,19 +181,19 @@ class AdapterFactory:
         # 策略 3: 语言非中英 -> 使用 Qwen3-TTS（多语言支持更好）
         language = kwargs.get("language", "Chinese")
         if language not in ("Chinese", "English"):
-            adapter = cls._adapters.get("qwen3-tts")
+            adapter = candidate("qwen3-tts")
             if adapter:
                 logger.debug(f"Auto-selected qwen3-tts (language={language})")
                 return adapter
 
         # 策略 4: 默认使用 IndexTTS
-        adapter = cls._adapters.get("indextts-2.0")
+        adapter = candidate("indextts-2.0")
         if adapter:
             logger.debug("Auto-selected indextts-2.0 (default)")
             return adapter
 
         # 如果 IndexTTS 不可用，尝试 Qwen3-TTS
-        adapter = cls._adapters.get("qwen3-tts")
+        adapter = candidate("qwen3-tts")
         if adapter:
             logger.debug("Auto-selected qwen3-tts (fallback)")
             return adapter
@@ -145,20 +203,49 @@ class AdapterFactory:
 
     @classmethod
     async def get_healthy_adapter(cls, backend_id: str) -> Optional[TTSAdapter]:
-        """获取健康的适配器（检查状态）"""
+        """
+        获取健康的适配器（使用健康监控缓存的状态）
+
+        只查询熔断器状态，不占用半开状态的试探机会，试探留给实际发送的请求
+        """
         adapter = cls.get(backend_id)
         if not adapter:
             return None
 
-        status = await adapter.get_status()
-        if status.online and status.model_loaded:
+        health = await health_monitor.get_status(adapter)
+        if (
+            health.status is not None
+            and health.status.online
+            and health.status.model_loaded
+            and health_monitor.available(backend_id)
+        ):
             return adapter
 
-        logger.warning(f"Adapter {backend_id} is not healthy: {status}")
+        logger.warning(f"Adapter {backend_id} is not healthy: {health.describe()}")
         return None
 
+    @classmethod
+    async def startup(cls) -> None:
+        """初始化适配器并打开各自的连接池"""
+        cls.initialize()
+        for adapter in cls._adapters.values():
+            await adapter.open()
+        await health_monitor.start(cls.get_all)
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        """关闭所有连接池并重置工厂"""
+        await health_monitor.stop()
+        for backend_id, adapter in cls._adapters.items():
+            try:
+                await adapter.aclose()
+            except Exception as e:
+                logger.warning(f"Failed to close adapter {backend_id}: {e}")
+        cls.reset()
+
     @classmethod
     def reset(cls) -> None:
         """重置工厂状态（主要用于测试）"""
         cls._adapters.clear()
         cls._initialized = False
+        health_monitor.reset()
@@ -0,0 +1,238 @@
+"""后端健康监控与熔断"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from gateway.config import settings
+from gateway.utils.concurrency import fan_out
+from gateway.utils.metrics import track_backend_call
+from .base import BackendStatus, TTSAdapter
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class BackendUnavailableError(Exception):
+    """后端熔断中或不可用"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    单个后端的熔断器
+
+    - closed: 正常放行，连续失败达到阈值后打开
+    - open: 拒绝请求，经过恢复时间后进入半开
+    - half_open: 每个恢复周期只放行一次试探，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, failure_threshold: int = 3, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self._next_trial_at = 0.0
+
+    def available(self) -> bool:
+        """是否会放行请求（只读，不占用半开状态的试探机会）"""
+        return self.state == CIRCUIT_CLOSED or time.monotonic() >= self._next_trial_at
+
+    def allow_request(self) -> bool:
+        """
+        放行请求
+
+        半开状态下会占用本周期的试探机会，只应在确定要向后端发送请求时调用；
+        仅查询状态时使用 available()
+        """
+        if not self.available():
+            return False
+        if self.state != CIRCUIT_CLOSED:
+            self.state = CIRCUIT_HALF_OPEN
+            self._next_trial_at = time.monotonic() + self.recovery_timeout
+        return True
+
+    def record_success(self) -> None:
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = CIRCUIT_OPEN
+            self._next_trial_at = time.monotonic() + self.recovery_timeout
+
+
+class BackendHealth:
+    """单个后端最近一次探测的结果"""
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.status: Optional[BackendStatus] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[datetime] = None
+
+    @property
+    def probed(self) -> bool:
+        return self.checked_at is not None
+
+    def describe(self) -> dict:
+        """转换为 API 响应中的状态字段"""
+        if self.status is None:
+            status, model_loaded = "error", False
+        else:
+            status = "online" if self.status.online else "offline"
+            model_loaded = self.status.model_loaded
+
+        return {
+            "status": status,
+            "model_loaded": model_loaded,
+            "error": self.error if self.status is None else self.status.error,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "circuit": self.breaker.state,
+        }
+
+
+class HealthMonitor:
+    """
+    后端健康监控
+
+    后台定时探测所有后端并缓存最新状态，探测结果与合成请求的连接失败
+    共同驱动每个后端的熔断器；路由时据此跳过已熔断的后端
+    """
+
+    def __init__(
+        self,
+        interval: float = 10.0,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30.0,
+    ):
+        self.interval = interval
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._health: Dict[str, BackendHealth] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, backend_id: str) -> BackendHealth:
+        """获取后端的健康记录（不存在时创建）"""
+        health = self._health.get(backend_id)
+        if health is None:
+            health = BackendHealth(CircuitBreaker(self.failure_threshold, self.recovery_timeout))
+            self._health[backend_id] = health
+        return health
+
+    def available(self, backend_id: str) -> bool:
+        """熔断器是否会放行该后端的请求（只读）"""
+        return self.get(backend_id).breaker.available()
+
+    def allow_request(self, backend_id: str) -> bool:
+        """熔断器是否放行该后端的请求（占用半开状态的试探机会）"""
+        return self.get(backend_id).breaker.allow_request()
+
+    def record_success(self, backend_id: str) -> None:
+        self.get(backend_id).breaker.record_success()
+
+    def record_failure(self, backend_id: str) -> None:
+        breaker = self.get(backend_id).breaker
+        was_open = breaker.state == CIRCUIT_OPEN
+        breaker.record_failure()
+        if breaker.state == CIRCUIT_OPEN and not was_open:
+            logger.warning(f"Circuit opened for {backend_id} after {breaker.failures} failures")
+
+    async def probe(self, adapter: TTSAdapter) -> BackendHealth:
+        """立即探测单个后端并更新缓存"""
+        results = await self.probe_all({adapter.backend_id: adapter})
+        return results[adapter.backend_id]
+
+    async def probe_all(self, adapters: Dict[str, TTSAdapter]) -> Dict[str, BackendHealth]:
+        """并发探测所有后端并更新缓存"""
+        results = await fan_out(
+            adapters,
+            lambda adapter: track_backend_call(adapter.backend_id, "status", adapter.get_status()),
+            timeout=lambda adapter: adapter.probe_timeout,
+        )
+
+        now = datetime.now(timezone.utc)
+        for backend_id, result in results.items():
+            health = self.get(backend_id)
+            health.checked_at = now
+            if isinstance(result, Exception):
+                health.status = None
+                health.error = str(result) or type(result).__name__
+            else:
+                health.status = result
+                health.error = None
+
+            if health.status is not None and health.status.online:
+                self.record_success(backend_id)
+            else:
+                self.record_failure(backend_id)
+
+        return {backend_id: self._health[backend_id] for backend_id in results}
+
+    async def get_status(self, adapter: TTSAdapter) -> BackendHealth:
+        """获取后端状态：后台监控运行中时返回缓存，否则实时探测"""
+        statuses = await self.get_statuses({adapter.backend_id: adapter})
+        return statuses[adapter.backend_id]
+
+    async def get_statuses(self, adapters: Dict[str, TTSAdapter]) -> Dict[str, BackendHealth]:
+        """批量获取后端状态，只实时探测没有缓存结果的后端"""
+        if self.running:
+            missing = {
+                backend_id: adapter
+                for backend_id, adapter in adapters.items()
+                if not self.get(backend_id).probed
+            }
+        else:
+            missing = adapters
+
+        if missing:
+            await self.probe_all(missing)
+        return {backend_id: self.get(backend_id) for backend_id in adapters}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, get_adapters: Callable[[], Dict[str, TTSAdapter]]) -> None:
+        """启动后台探测任务"""
+        if self.interval <= 0 or self.running:
+            return
+        self._task = asyncio.create_task(self._probe_loop(get_adapters))
+
+    async def stop(self) -> None:
+        """停止后台探测任务"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def reset(self) -> None:
+        """清空健康记录（主要用于测试）"""
+        self._health.clear()
+
+    async def _probe_loop(self, get_adapters: Callable[[], Dict[str, TTSAdapter]]) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.probe_all(get_adapters())
+            except Exception as e:
+                logger.warning(f"Health probe failed: {e}")
+
+
+# 单例实例
+health_monitor = HealthMonitor(
+    interval=settings.health_check_interval,
+    failure_threshold=settings.circuit_failure_threshold,
+    recovery_timeout=settings.circuit_recovery_timeout,
+)
@@ -1,7 +1,7 @@
 """IndexTTS 后端适配器"""
 
 import logging
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
 import httpx
 
@@ -36,35 +36,26 @@ class IndexTTSAdapter(TTSAdapter):
     async def get_status(self) -> BackendStatus:
         """获取后端状态"""
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/")
-                if response.status_code == 200:
-                    data = response.json()
-                    return BackendStatus(
-                        online=True,
-                        model_loaded=data.get("status") == "running",
-                        model_name=data.get("service"),
-                    )
+            response = await self.client.get(
+                f"{self.base_url}/", timeout=10.0
+            )
+            if response.status_code == 200:
+                data = response.json()
                 return BackendStatus(
-                    online=False,
-                    error=f"HTTP {response.status_code}"
+                    online=True,
+                    model_loaded=data.get("status") == "running",
+                    model_name=data.get("service"),
                 )
+            return BackendStatus(
+                online=False,
+                error=f"HTTP {response.status_code}"
+            )
         except Exception as e:
             logger.warning(f"IndexTTS status check failed: {e}")
             return BackendStatus(online=False, error=str(e))
 
-    async def generate_speech(
-        self,
-        text: str,
-        voice: str,
-        **kwargs
-    ) -> bytes:
-        """
-        生成语音
-
-        IndexTTS 使用 JSON 请求，直接返回音频流
-        """
-        # 构建请求体
+    def _build_request_body(self, text: str, voice: str, **kwargs) -> dict:
+        """构建 IndexTTS 合成请求体"""
         request_body = {
             "input": text,
             "voice": voice,
@@ -100,25 +91,76 @@ class IndexTTSAdapter(TTSAdapter):
             if kwargs.get("emo_text"):
                 request_body["emo_text"] = kwargs["emo_text"]
 
+        return request_body
+
+    def _http_error(self, e: httpx.HTTPStatusError) -> Exception:
+        """将 HTTP 错误转换为带错误详情的异常"""
+        logger.error(f"IndexTTS HTTP error: {e}")
+        # 尝试解析错误详情
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/v1/audio/speech",
-                    json=request_body,
-                )
+            error_detail = e.response.json().get("detail", str(e))
+        except Exception:
+            error_detail = str(e)
+        return Exception(f"IndexTTS 请求失败: {error_detail}")
+
+    async def generate_speech(
+        self,
+        text: str,
+        voice: str,
+        **kwargs
+    ) -> bytes:
+        """
+        生成语音
+
+        IndexTTS 使用 JSON 请求，直接返回音频流
+        """
+        request_body = self._build_request_body(text, voice, **kwargs)
+
+        try:
+            response = await self.client.post(
+                f"{self.base_url}/v1/audio/speech",
+                json=request_body,
+            )
+            response.raise_for_status()
+
+            # IndexTTS 直接返回音频流
+            return response.content
+
+        except httpx.HTTPStatusError as e:
+            raise self._http_error(e) from e
+        except Exception as e:
+            logger.error(f"IndexTTS error: {e}")
+            raise
+
+    async def stream_speech(
+        self,
+        text: str,
+        voice: str,
+        **kwargs
+    ) -> AsyncIterator[bytes]:
+        """
+        流式生成语音
+
+        通过 client.stream() 边接收边转发 IndexTTS 的音频分块
+        """
+        request_body = self._build_request_body(text, voice, **kwargs)
+
+        try:
+            async with self.client.stream(
+                "POST",
+                f"{self.base_url}/v1/audio/speech",
+                json=request_body,
+            ) as response:
+                if response.is_error:
+                    # 读取错误响应体以便解析错误详情
+                    await response.aread()
                 response.raise_for_status()
 
-                # IndexTTS 直接返回音频流
-                return response.content
+                async for chunk in response.aiter_bytes():
+                    yield chunk
 
         except httpx.HTTPStatusError as e:
-            logger.error(f"IndexTTS HTTP error: {e}")
-            # 尝试解析错误详情
-            try:
-                error_detail = e.response.json().get("detail", str(e))
-            except Exception:
-                error_detail = str(e)
-            raise Exception(f"IndexTTS 请求失败: {error_detail}")
+            raise self._http_error(e) from e
         except Exception as e:
             logger.error(f"IndexTTS error: {e}")
             raise
@@ -126,26 +168,27 @@ class IndexTTSAdapter(TTSAdapter):
     async def list_voices(self) -> List[VoiceItem]:
         """获取音色列表"""
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/v1/voices")
-                response.raise_for_status()
+            response = await self.client.get(
+                f"{self.base_url}/v1/voices", timeout=10.0
+            )
+            response.raise_for_status()
 
-                data = response.json()
-                voices = []
+            data = response.json()
+            voices = []
 
-                for voice in data.get("voices", []):
-                    voices.append(VoiceItem(
-                        id=voice.get("id"),
-                        name=voice.get("name", voice.get("id")),
-                        emotions=voice.get("emotions", ["default"]),
-                        has_default=voice.get("has_default", False),
-                    ))
+            for voice in data.get("voices", []):
+                voices.append(VoiceItem(
+                    id=voice.get("id"),
+                    name=voice.get("name", voice.get("id")),
+                    emotions=voice.get("emotions", ["default"]),
+                    has_default=voice.get("has_default", False),
+                ))
 
-                return voices
+            return voices
 
         except Exception as e:
             logger.error(f"Failed to list IndexTTS voices: {e}")
-            return []
+            raise
 
     async def upload_voice(
         self,
@@ -162,29 +205,29 @@ class IndexTTSAdapter(TTSAdapter):
         emotion = kwargs.get("emotion", "default")
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                files = {
-                    "file": (filename, file_content, "audio/wav")
-                }
-                params = {
-                    "voice_id": voice_id,
-                    "emotion": emotion,
-                }
-
-                response = await client.post(
-                    f"{self.base_url}/v1/voices/upload",
-                    files=files,
-                    params=params,
-                )
-                response.raise_for_status()
+            files = {
+                "file": (filename, file_content, "audio/wav")
+            }
+            params = {
+                "voice_id": voice_id,
+                "emotion": emotion,
+            }
 
-                result = response.json()
-                return {
-                    "success": result.get("success", False),
-                    "message": result.get("message", ""),
-                    "voice_id": result.get("voice_id"),
-                    "emotion": result.get("emotion"),
-                }
+            response = await self.client.post(
+                f"{self.base_url}/v1/voices/upload",
+                files=files,
+                params=params,
+                timeout=30.0,
+            )
+            response.raise_for_status()
+
+            result = response.json()
+            return {
+                "success": result.get("success", False),
+                "message": result.get("message", ""),
+                "voice_id": result.get("voice_id"),
+                "emotion": result.get("emotion"),
+            }
 
         except Exception as e:
             logger.error(f"Failed to upload voice to IndexTTS: {e}")
@@ -61,14 +61,8 @@ class MockAdapter(TTSAdapter):
         # 计算音频时长（基于文本长度）
         duration = max(0.5, min(len(text) * 0.1, 10.0))  # 0.5-10 秒
 
-        # 生成测试音频
-        response_format = kwargs.get("response_format", "mp3")
-
-        if response_format == "wav":
-            return self._generate_wav(duration)
-        else:
-            # 默认返回 MP3（这里用 WAV 代替，实际可以用 pydub 转换）
-            return self._generate_wav(duration)
+        # 与真实后端一样输出 WAV，其他格式由网关转码
+        return self._generate_wav(duration)
 
     async def list_voices(self) -> List[VoiceItem]:
         """返回预设的音色列表"""
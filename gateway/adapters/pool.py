@@ -0,0 +1,251 @@
+"""同类型后端的多副本负载均衡"""
+
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, List, Optional
+
+import httpx
+
+from gateway.utils.concurrency import fan_out
+from .base import BackendStatus, TTSAdapter, VoiceItem
+
+logger = logging.getLogger(__name__)
+
+# 选择策略
+POLICY_LEAST_OUTSTANDING = "least_outstanding"
+POLICY_P2C = "p2c"
+POLICY_WEIGHTED_ROUND_ROBIN = "weighted_round_robin"
+POLICIES = (POLICY_LEAST_OUTSTANDING, POLICY_P2C, POLICY_WEIGHTED_ROUND_ROBIN)
+
+# 延迟 EWMA 的平滑系数
+_LATENCY_ALPHA = 0.3
+
+
+class Replica:
+    """单个副本及其负载统计"""
+
+    def __init__(self, adapter: TTSAdapter, weight: float = 1.0):
+        self.adapter = adapter
+        self.weight = weight
+        # 进行中的请求数
+        self.outstanding = 0
+        # 请求耗时的指数加权平均（秒）
+        self.latency = 0.0
+        # 最近一次探测或请求是否正常
+        self.healthy = True
+        # 平滑加权轮询的当前权重
+        self.current_weight = 0.0
+
+    def observe(self, elapsed: float) -> None:
+        if self.latency == 0.0:
+            self.latency = elapsed
+        else:
+            self.latency += _LATENCY_ALPHA * (elapsed - self.latency)
+
+    def load(self) -> tuple:
+        """用于比较负载：先比进行中的请求数（按权重折算），再比延迟"""
+        return self.outstanding / self.weight, self.latency
+
+
+class ReplicaPool(TTSAdapter):
+    """
+    副本池适配器
+
+    对外表现为一个普通适配器，内部将请求分发到同一后端类型的多个副本：
+    - least_outstanding: 进行中请求最少的副本
+    - p2c: 随机取两个副本，选负载较低者
+    - weighted_round_robin: 按权重平滑轮询
+
+    合成请求只发往一个副本；上传音色会同步到所有副本，保证任意副本都能使用该音色
+    """
+
+    def __init__(
+        self,
+        replicas: List[TTSAdapter],
+        weights: Optional[List[float]] = None,
+        policy: str = POLICY_LEAST_OUTSTANDING,
+    ):
+        if not replicas:
+            raise ValueError("副本池至少需要一个副本")
+        if policy not in POLICIES:
+            raise ValueError(f"未知的负载均衡策略: {policy}")
+
+        first = replicas[0]
+        super().__init__(
+            base_url=first.base_url,
+            timeout=first.timeout,
+            limits=first.limits,
+            probe_timeout=first.probe_timeout,
+        )
+        weights = weights or []
+        self.replicas = [
+            Replica(adapter, weights[i] if i < len(weights) and weights[i] > 0 else 1.0)
+            for i, adapter in enumerate(replicas)
+        ]
+        self.policy = policy
+
+    @property
+    def backend_id(self) -> str:
+        return self.replicas[0].adapter.backend_id
+
+    @property
+    def backend_name(self) -> str:
+        return self.replicas[0].adapter.backend_name
+
+    @property
+    def features(self) -> List[str]:
+        return self.replicas[0].adapter.features
+
+    async def open(self) -> None:
+        for replica in self.replicas:
+            await replica.adapter.open()
+
+    async def aclose(self) -> None:
+        for replica in self.replicas:
+            await replica.adapter.aclose()
+
+    def _by_index(self) -> dict:
+        return {str(i): replica for i, replica in enumerate(self.replicas)}
+
+    def select(self) -> Replica:
+        """按策略选择副本，优先选择健康的副本"""
+        candidates = [r for r in self.replicas if r.healthy] or self.replicas
+        if len(candidates) == 1:
+            return candidates[0]
+
+        if self.policy == POLICY_P2C:
+            first, second = random.sample(candidates, 2)
+            return first if first.load() <= second.load() else second
+
+        if self.policy == POLICY_WEIGHTED_ROUND_ROBIN:
+            total = sum(r.weight for r in candidates)
+            for replica in candidates:
+                replica.current_weight += replica.weight
+            chosen = max(candidates, key=lambda r: r.current_weight)
+            chosen.current_weight -= total
+            return chosen
+
+        return min(candidates, key=Replica.load)
+
+    @contextmanager
+    def _track(self, replica: Replica) -> Iterator[None]:
+        """记录请求的进行中计数与耗时，连接失败时标记副本不健康"""
+        replica.outstanding += 1
+        started = time.monotonic()
+        try:
+            yield
+        except httpx.TransportError:
+            replica.healthy = False
+            raise
+        else:
+            replica.healthy = True
+            replica.observe(time.monotonic() - started)
+        finally:
+            replica.outstanding -= 1
+
+    async def generate_speech(self, text: str, voice: str, **kwargs) -> bytes:
+        replica = self.select()
+        with self._track(replica):
+            return await replica.adapter.generate_speech(text=text, voice=voice, **kwargs)
+
+    async def stream_speech(self, text: str, voice: str, **kwargs) -> AsyncIterator[bytes]:
+        replica = self.select()
+        with self._track(replica):
+            async for chunk in replica.adapter.stream_speech(text=text, voice=voice, **kwargs):
+                yield chunk
+
+    async def get_status(self) -> BackendStatus:
+        """并发探测所有副本，任一副本在线即视为在线"""
+        results = await fan_out(
+            self._by_index(),
+            lambda replica: replica.adapter.get_status(),
+            timeout=self.probe_timeout,
+        )
+
+        online = []
+        errors = []
+        for replica, status in zip(self.replicas, results.values()):
+            url = replica.adapter.base_url
+            if isinstance(status, Exception):
+                replica.healthy = False
+                errors.append(f"{url}: {status}")
+                continue
+            replica.healthy = status.online
+            if status.online:
+                online.append(status)
+            elif status.error:
+                errors.append(f"{url}: {status.error}")
+
+        if not online:
+            return BackendStatus(online=False, error="; ".join(errors) or None)
+
+        loaded = [status for status in online if status.model_loaded]
+        reference = loaded[0] if loaded else online[0]
+        return BackendStatus(
+            online=True,
+            model_loaded=bool(loaded),
+            model_name=reference.model_name,
+            device=reference.device,
+            error="; ".join(errors) or None,
+        )
+
+    async def list_voices(self) -> List[VoiceItem]:
+        """音色在各副本间同步，从负载最低的健康副本读取"""
+        replica = self.select()
+        with self._track(replica):
+            return await replica.adapter.list_voices()
+
+    async def upload_voice(
+        self,
+        file_content: bytes,
+        filename: str,
+        voice_id: str,
+        **kwargs
+    ) -> dict:
+        """
+        上传到所有副本，全部成功且各副本返回相同的音色 ID 才算成功
+
+        合成请求可能被调度到任意副本，各副本上的音色 ID 不一致时
+        无法用同一个 ID 合成，因此视为上传失败
+        """
+        results = await fan_out(
+            self._by_index(),
+            lambda replica: replica.adapter.upload_voice(
+                file_content=file_content,
+                filename=filename,
+                voice_id=voice_id,
+                **kwargs
+            ),
+        )
+
+        failures = []
+        succeeded = []
+        for replica, result in zip(self.replicas, results.values()):
+            url = replica.adapter.base_url
+            if isinstance(result, Exception):
+                failures.append(f"{url}: {result}")
+            elif not result.get("success"):
+                failures.append(f"{url}: {result.get('message')}")
+            else:
+                succeeded.append((url, result))
+
+        voice_ids = {result.get("voice_id", voice_id) for _, result in succeeded}
+        if not failures and len(voice_ids) > 1:
+            failures = [f"{url}: voice_id={result.get('voice_id', voice_id)}" for url, result in succeeded]
+            logger.warning(f"Replicas of {self.backend_id} returned different voice ids: {failures}")
+            return {
+                "success": False,
+                "voice_id": voice_id,
+                "message": "各副本返回的音色 ID 不一致: " + "; ".join(failures),
+            }
+
+        if failures:
+            logger.warning(f"Voice upload failed on some replicas of {self.backend_id}: {failures}")
+            return {
+                "success": False,
+                "voice_id": succeeded[0][1].get("voice_id", voice_id) if succeeded else voice_id,
+                "message": "部分副本上传失败: " + "; ".join(failures),
+            }
+        return succeeded[0][1]
@@ -1,7 +1,7 @@
 """Qwen3-TTS 后端适配器"""
 
 import logging
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
 import httpx
 
@@ -32,24 +32,55 @@ class QwenTTSAdapter(TTSAdapter):
     async def get_status(self) -> BackendStatus:
         """获取后端状态"""
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/api/status")
-                if response.status_code == 200:
-                    data = response.json()
-                    return BackendStatus(
-                        online=True,
-                        model_loaded=data.get("model_loaded", False),
-                        model_name=data.get("model_name"),
-                        device=data.get("device"),
-                    )
+            response = await self.client.get(
+                f"{self.base_url}/api/status", timeout=10.0
+            )
+            if response.status_code == 200:
+                data = response.json()
                 return BackendStatus(
-                    online=False,
-                    error=f"HTTP {response.status_code}"
+                    online=True,
+                    model_loaded=data.get("model_loaded", False),
+                    model_name=data.get("model_name"),
+                    device=data.get("device"),
                 )
+            return BackendStatus(
+                online=False,
+                error=f"HTTP {response.status_code}"
+            )
         except Exception as e:
             logger.warning(f"Qwen3-TTS status check failed: {e}")
             return BackendStatus(online=False, error=str(e))
 
+    async def _request_audio_url(self, text: str, voice: str, **kwargs) -> str:
+        """提交合成任务，返回生成音频的下载地址"""
+        ref_audio_id = kwargs.get("ref_audio_id") or voice
+        language = kwargs.get("language", "Chinese")
+
+        # 构建 FormData
+        form_data = {
+            "text": text,
+            "language": language,
+            "ref_audio_id": ref_audio_id,
+        }
+
+        # 调用 TTS API
+        response = await self.client.post(
+            f"{self.base_url}/api/tts",
+            data=form_data,
+        )
+        response.raise_for_status()
+
+        result = response.json()
+        if not result.get("success"):
+            raise Exception(result.get("message", "TTS 生成失败"))
+
+        # 获取音频 URL
+        audio_url = result.get("audio_url")
+        if not audio_url:
+            raise Exception("未返回音频 URL")
+
+        return f"{self.base_url}{audio_url}"
+
     async def generate_speech(
         self,
         text: str,
@@ -61,45 +92,44 @@ class QwenTTSAdapter(TTSAdapter):
 
         Qwen3-TTS 使用 FormData 提交，需要 ref_audio_id
         """
-        ref_audio_id = kwargs.get("ref_audio_id") or voice
-        language = kwargs.get("language", "Chinese")
+        try:
+            audio_url = await self._request_audio_url(text, voice, **kwargs)
 
-        # 构建 FormData
-        form_data = {
-            "text": text,
-            "language": language,
-            "ref_audio_id": ref_audio_id,
-        }
+            # 下载音频
+            audio_response = await self.client.get(audio_url)
+            audio_response.raise_for_status()
 
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                # 调用 TTS API
-                response = await client.post(
-                    f"{self.base_url}/api/tts",
-                    data=form_data,
-                )
-                response.raise_for_status()
+            return audio_response.content
 
-                result = response.json()
-                if not result.get("success"):
-                    raise Exception(result.get("message", "TTS 生成失败"))
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Qwen3-TTS HTTP error: {e}")
+            raise Exception(f"Qwen3-TTS 请求失败: {e.response.status_code}") from e
+        except Exception as e:
+            logger.error(f"Qwen3-TTS error: {e}")
+            raise
 
-                # 获取音频 URL 并下载
-                audio_url = result.get("audio_url")
-                if not audio_url:
-                    raise Exception("未返回音频 URL")
+    async def stream_speech(
+        self,
+        text: str,
+        voice: str,
+        **kwargs
+    ) -> AsyncIterator[bytes]:
+        """
+        流式生成语音
 
-                # 下载音频
-                audio_response = await client.get(
-                    f"{self.base_url}{audio_url}"
-                )
-                audio_response.raise_for_status()
+        合成完成后以 client.stream() 分块转发音频下载
+        """
+        try:
+            audio_url = await self._request_audio_url(text, voice, **kwargs)
 
-                return audio_response.content
+            async with self.client.stream("GET", audio_url) as audio_response:
+                audio_response.raise_for_status()
+                async for chunk in audio_response.aiter_bytes():
+                    yield chunk
 
         except httpx.HTTPStatusError as e:
             logger.error(f"Qwen3-TTS HTTP error: {e}")
-            raise Exception(f"Qwen3-TTS 请求失败: {e.response.status_code}")
+            raise Exception(f"Qwen3-TTS 请求失败: {e.response.status_code}") from e
         except Exception as e:
             logger.error(f"Qwen3-TTS error: {e}")
             raise
@@ -107,27 +137,28 @@ class QwenTTSAdapter(TTSAdapter):
     async def list_voices(self) -> List[VoiceItem]:
         """获取音色列表（参考音频）"""
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/api/ref_audios")
-                response.raise_for_status()
+            response = await self.client.get(
+                f"{self.base_url}/api/ref_audios", timeout=10.0
+            )
+            response.raise_for_status()
 
-                data = response.json()
-                voices = []
+            data = response.json()
+            voices = []
 
-                for audio in data.get("audios", []):
-                    voices.append(VoiceItem(
-                        id=audio.get("id"),
-                        name=audio.get("filename", audio.get("id")),
-                        ref_text=audio.get("ref_text"),
-                        emotions=["default"],
-                        has_default=True,
-                    ))
+            for audio in data.get("audios", []):
+                voices.append(VoiceItem(
+                    id=audio.get("id"),
+                    name=audio.get("filename", audio.get("id")),
+                    ref_text=audio.get("ref_text"),
+                    emotions=["default"],
+                    has_default=True,
+                ))
 
-                return voices
+            return voices
 
         except Exception as e:
             logger.error(f"Failed to list Qwen3-TTS voices: {e}")
-            return []
+            raise
 
     async def upload_voice(
         self,
@@ -149,27 +180,27 @@ class QwenTTSAdapter(TTSAdapter):
             }
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                files = {
-                    "file": (filename, file_content, "audio/wav")
-                }
-                data = {
-                    "ref_text": ref_text
-                }
-
-                response = await client.post(
-                    f"{self.base_url}/api/upload_ref_audio",
-                    files=files,
-                    data=data,
-                )
-                response.raise_for_status()
-
-                result = response.json()
-                return {
-                    "success": result.get("success", False),
-                    "message": result.get("message", ""),
-                    "voice_id": result.get("ref_id"),
-                }
+            files = {
+                "file": (filename, file_content, "audio/wav")
+            }
+            data = {
+                "ref_text": ref_text
+            }
+
+            response = await self.client.post(
+                f"{self.base_url}/api/upload_ref_audio",
+                files=files,
+                data=data,
+                timeout=30.0,
+            )
+            response.raise_for_status()
+
+            result = response.json()
+            return {
+                "success": result.get("success", False),
+                "message": result.get("message", ""),
+                "voice_id": result.get("ref_id"),
+            }
 
         except Exception as e:
             logger.error(f"Failed to upload voice to Qwen3-TTS: {e}")
@@ -1,21 +1,51 @@
 """音频生成 API 路由"""
 
+import base64
+import json
 import logging
+import uuid
+from typing import AsyncIterator, List, Optional
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
-from gateway.schemas.request import TTSRequest
+from gateway.adapters import BackendUnavailableError
+from gateway.config import settings
+from gateway.schemas.request import BatchTTSRequest, TTSRequest
 from gateway.schemas.response import TTSResponse
-from gateway.services.tts_service import tts_service
+from gateway.services.audio_store import audio_store
+from gateway.services.job_service import (
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    Job,
+    job_service,
+)
+from gateway.services.metadata_service import metadata_service
+from gateway.services.quota_service import QuotaCharge, QuotaExceededError, quota_service
+from gateway.services.tts_service import UnknownModelError, tts_service
+from gateway.utils.transcode import UnsupportedFormatError, check_format, media_type
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 任务状态对应的提示信息
+_JOB_MESSAGES = {
+    JOB_QUEUED: "任务排队中",
+    JOB_RUNNING: "任务执行中",
+    JOB_SUCCEEDED: "合成完成",
+    JOB_FAILED: "合成失败",
+}
+
 
 @router.post("/audio/speech")
-async def create_speech(request: TTSRequest):
+async def create_speech(
+    request: TTSRequest,
+    raw_request: Request,
+    cache_control: Optional[str] = Header(default=None, alias="Cache-Control"),
+):
     """
     语音合成接口 (OpenAI 兼容)
 
@@ -25,7 +55,7 @@ async def create_speech(request: TTSRequest):
     - model: 模型选择 ("qwen3-tts", "indextts-2.0", "auto")
     - input: 待合成的文本
     - voice: 音色 ID
-    - response_format: 输出格式 (wav/mp3)
+    - response_format: 输出格式 (wav/mp3/opus/aac/flac/pcm)，压缩格式需要服务端安装 ffmpeg
     - speed: 语速 (0.5-2.0)
 
     Qwen3-TTS 专用参数：
@@ -37,41 +67,291 @@ async def create_speech(request: TTSRequest):
     - temperature, top_p, top_k: 采样参数
     - emotion_mode: 情感控制模式
     - emo_vector: 8维情感向量
+
+    保存选项：
+    - save_audio: 同时保存到服务端音频存储
+    - save_name: 保存名称，需要携带 X-Private-Key，之后只能用同一密钥访问；
+      未指定时自动生成不可猜测的名称。响应头 X-Audio-Name 返回该名称，
+      合成结束后可通过 GET /audio/files/{save_name} 重复下载
+
+    请求头 Cache-Control: no-cache / no-store 可跳过合成结果缓存
+
+    启用合成配额时按输入字数扣除，响应头 X-Quota-Cost / X-Quota-Remaining-* 返回本次消耗与剩余额度
     """
+    use_cache = _allow_cache(cache_control)
+    audio_name = request.save_name
+    request = _scope_save_name(raw_request, request)
+    charge = await _charge_quota(raw_request, [request])
+
+    # 音频 ID 由内容决定，流式响应开始时尚未可知，因此通过名称引用
+    if request.save_audio and not request.save_name:
+        audio_name = uuid.uuid4().hex
+        request = request.model_copy(update={"save_name": audio_name})
+
     try:
-        audio_data, metadata = await tts_service.generate_speech(request)
+        audio_stream, metadata = await tts_service.stream_speech(
+            request, use_cache=use_cache
+        )
 
-        # 确定 MIME 类型
-        if request.response_format == "mp3":
-            media_type = "audio/mpeg"
-        else:
-            media_type = "audio/wav"
+        headers = {
+            "Content-Disposition": f"attachment; filename=speech.{request.response_format}",
+            "X-Model-Used": metadata.get("model_used", "unknown"),
+            "X-Cache": metadata.get("cache", "BYPASS"),
+        }
+        if request.save_audio:
+            headers["X-Audio-Name"] = audio_name
+        headers.update(charge.headers())
 
-        # 返回音频流
+        # 返回音频流（边合成边转发）
         return StreamingResponse(
-            iter([audio_data]),
-            media_type=media_type,
-            headers={
-                "Content-Disposition": f"attachment; filename=speech.{request.response_format}",
-                "X-Model-Used": metadata.get("model_used", "unknown"),
-            }
+            audio_stream,
+            media_type=media_type(request.response_format),
+            headers=headers,
         )
 
+    except (UnsupportedFormatError, UnknownModelError) as e:
+        await quota_service.refund(charge)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BackendUnavailableError as e:
+        logger.warning(f"Speech generation rejected: {e}")
+        await quota_service.refund(charge)
+        retry_after = getattr(e, "retry_after", None)
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(retry_after)} if retry_after else None,
+        )
     except Exception as e:
         logger.error(f"Speech generation failed: {e}")
+        await quota_service.refund(charge)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/audio/speech/json", response_model=TTSResponse)
-async def create_speech_json(request: TTSRequest):
+@router.post("/audio/speech/batch")
+async def create_speech_batch(
+    batch: BatchTTSRequest,
+    raw_request: Request,
+    cache_control: Optional[str] = Header(default=None, alias="Cache-Control"),
+):
     """
-    语音合成接口 (JSON 响应)
+    批量语音合成接口
 
-    生成语音并返回 JSON 元数据（音频需要单独下载）
+    并发合成多条请求，按完成顺序以 NDJSON 流式返回，每行一条结果：
+    - 成功: {"index", "success": true, "model_used", "cache", "response_format", "audio"}，
+      audio 为 base64 编码的音频；条目设置了 save_audio 时附带 audio_id 与 audio_url
+    - 失败: {"index", "success": false, "status", "error"}，单条失败不影响其他条目
 
-    注意：此接口暂不支持，请使用 POST /audio/speech
+    参数：
+    - items: TTSRequest 列表，字段与 POST /audio/speech 相同
+    - concurrency: 同时合成的条数，不超过服务端上限
+
+    启用合成配额时在开始合成前按全部条目的字数一次扣除，额度不足时整个请求返回 429；
+    失败的条目在结果返回时退还其配额，客户端中途断开时退还尚未完成的条目
     """
-    raise HTTPException(
-        status_code=501,
-        detail="JSON response mode not implemented. Use POST /v1/audio/speech for streaming response."
+    if len(batch.items) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"批量请求最多 {settings.batch_max_items} 条，当前 {len(batch.items)} 条",
+        )
+
+    items = [_scope_save_name(raw_request, item) for item in batch.items]
+    charge = await _charge_quota(raw_request, items)
+    concurrency = min(batch.concurrency or settings.batch_concurrency, settings.batch_concurrency)
+    results = tts_service.generate_batch(
+        items, concurrency=concurrency, use_cache=_allow_cache(cache_control)
     )
+
+    async def _lines() -> AsyncIterator[bytes]:
+        pending = set(range(len(items)))
+        try:
+            async for index, result in results:
+                pending.discard(index)
+                if isinstance(result, Exception):
+                    await quota_service.refund(charge, quota_service.cost(items[index]))
+                yield _batch_line(index, result, items[index])
+        finally:
+            if pending:
+                await quota_service.refund(charge, sum(quota_service.cost(items[i]) for i in pending))
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson", headers=charge.headers())
+
+
+def _batch_line(index: int, result, request: TTSRequest) -> bytes:
+    """批量结果中的一行"""
+    if isinstance(result, Exception):
+        item = {
+            "index": index,
+            "success": False,
+            "status": _error_status(result),
+            "error": str(result),
+        }
+    else:
+        audio, metadata = result
+        item = {
+            "index": index,
+            "success": True,
+            "model_used": metadata.get("model_used", "unknown"),
+            "cache": metadata.get("cache", "BYPASS"),
+            "response_format": request.response_format,
+            "audio": base64.b64encode(audio).decode("ascii"),
+        }
+        if "audio_id" in metadata:
+            item["audio_id"] = metadata["audio_id"]
+            item["audio_url"] = f"/v1/audio/files/{metadata['audio_id']}"
+    return (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@router.post("/audio/speech/json", response_model=TTSResponse, status_code=202)
+async def create_speech_json(request: TTSRequest, raw_request: Request, response: Response):
+    """
+    异步语音合成接口
+
+    立即返回任务 ID，合成在后台执行；通过 GET /audio/jobs/{job_id} 查询进度，
+    完成后从 audio_url 下载音频。适合长文本，避免长时间占用连接
+    """
+    try:
+        check_format(request.response_format)
+    except UnsupportedFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    request = _scope_save_name(raw_request, request)
+    charge = await _charge_quota(raw_request, [request])
+    try:
+        job = await job_service.submit(request, charge)
+    except BackendUnavailableError as e:
+        await quota_service.refund(charge)
+        retry_after = getattr(e, "retry_after", None)
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(retry_after)} if retry_after else None,
+        )
+    except RuntimeError as e:
+        await quota_service.refund(charge)
+        raise HTTPException(status_code=503, detail=str(e))
+
+    response.headers.update(charge.headers())
+    return _job_response(job)
+
+
+@router.get("/audio/jobs/{job_id}", response_model=TTSResponse)
+async def get_speech_job(job_id: str):
+    """查询异步合成任务状态"""
+    job = await job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在或已过期: {job_id}")
+    return _job_response(job)
+
+
+@router.api_route("/audio/files/{audio_ref}", methods=["GET", "HEAD"])
+async def get_audio_file(
+    audio_ref: str,
+    raw_request: Request,
+    if_none_match: Optional[str] = Header(default=None, alias="If-None-Match"),
+):
+    """
+    下载已保存的音频
+
+    audio_ref 可以是音频 ID，也可以是合成时的名称：通过 save_name 指定的名称
+    需要携带保存时使用的 X-Private-Key，自动生成的名称无需密钥。
+    支持 Range 断点续传；ETag 即内容哈希，If-None-Match 命中时返回 304
+    """
+    record = None
+    private_key = raw_request.headers.get("X-Private-Key")
+    if private_key:
+        record = audio_store.resolve(_scoped_name(private_key, audio_ref))
+    if record is None:
+        record = audio_store.resolve(audio_ref)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"音频不存在: {audio_ref}")
+
+    etag = f'"{record.audio_id}"'
+    headers = {
+        "ETag": etag,
+        # 按 ID 访问的内容永不变化；名称可能被重新指向，需要每次验证
+        "Cache-Control": (
+            "public, max-age=31536000, immutable"
+            if audio_ref == record.audio_id else "no-cache"
+        ),
+    }
+    if audio_ref != record.audio_id:
+        # 同一名称在不同密钥下指向不同的音频
+        headers["Vary"] = "X-Private-Key"
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        audio_store.path(record),
+        media_type=media_type(record.fmt),
+        filename=f"speech.{record.fmt}",
+        headers=headers,
+    )
+
+
+def _job_response(job: Job) -> TTSResponse:
+    return TTSResponse(
+        success=job.status != JOB_FAILED,
+        message=_JOB_MESSAGES[job.status],
+        job_id=job.id,
+        status=job.status,
+        audio_id=job.audio_id,
+        audio_url=f"/v1/audio/files/{job.audio_id}" if job.audio_id else None,
+        model_used=job.model_used,
+        duration=job.duration,
+        error=job.error,
+    )
+
+
+async def _charge_quota(raw_request: Request, requests: List[TTSRequest]) -> QuotaCharge:
+    """扣除合成配额，超出时返回 429"""
+    try:
+        return await quota_service.charge(raw_request, requests)
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
+
+
+def _scoped_name(private_key: str, name: str) -> str:
+    """密钥下的音频名称，save_name 不允许包含 /，不会与其他名称冲突"""
+    return f"{metadata_service.key_tag(private_key)}/{name}"
+
+
+def _scope_save_name(raw_request: Request, request: TTSRequest) -> TTSRequest:
+    """
+    将客户端指定的保存名称限定在请求密钥下
+
+    下载接口按名称访问，名称必须属于某个密钥，否则任何人都能猜测或覆盖他人的名称
+    """
+    if not request.save_name:
+        return request
+    private_key = raw_request.headers.get("X-Private-Key")
+    if not private_key:
+        raise HTTPException(
+            status_code=400,
+            detail="指定 save_name 需要携带 X-Private-Key，名称只能用同一密钥访问；"
+                   "不指定时自动生成名称",
+        )
+    return request.model_copy(update={"save_name": _scoped_name(private_key, request.save_name)})
+
+
+def _allow_cache(cache_control: Optional[str]) -> bool:
+    """请求头 Cache-Control: no-cache / no-store 时跳过合成结果缓存"""
+    return not (
+        cache_control and ("no-cache" in cache_control or "no-store" in cache_control)
+    )
+
+
+def _error_status(error: Exception) -> int:
+    """批量结果中单条错误对应的 HTTP 状态码"""
+    if isinstance(error, (UnsupportedFormatError, UnknownModelError)):
+        return 400
+    if isinstance(error, BackendUnavailableError):
+        return 503
+    return 500
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 可以是 * 或以逗号分隔的多个（可能为弱）ETag"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
@@ -6,7 +6,8 @@ from typing import Optional
 from fastapi import APIRouter, HTTPException
 
 from gateway.schemas.response import ModelInfo, ModelsResponse, BackendStatus
-from gateway.adapters import AdapterFactory
+from gateway.adapters import AdapterFactory, health_monitor
+from gateway.services.admission_service import admission_service
 
 logger = logging.getLogger(__name__)
 
@@ -22,24 +23,25 @@ async def list_models():
     """
     models = []
     adapters = AdapterFactory.get_all()
+    healths = await health_monitor.get_statuses(adapters)
 
     for backend_id, adapter in adapters.items():
-        try:
-            status = await adapter.get_status()
+        status = healths[backend_id].status
+        if status is None:
+            logger.warning(f"Failed to get status for {backend_id}: {healths[backend_id].error}")
             models.append(ModelInfo(
                 id=backend_id,
                 name=adapter.backend_name,
                 backend=backend_id,
-                status="online" if status.online and status.model_loaded else "offline",
+                status="error",
                 features=adapter.features,
             ))
-        except Exception as e:
-            logger.warning(f"Failed to get status for {backend_id}: {e}")
+        else:
             models.append(ModelInfo(
                 id=backend_id,
                 name=adapter.backend_name,
                 backend=backend_id,
-                status="error",
+                status="online" if status.online and status.model_loaded else "offline",
                 features=adapter.features,
             ))
 
@@ -58,24 +60,27 @@ async def get_model(model_id: str):
     if not adapter:
         raise HTTPException(status_code=404, detail=f"模型不存在: {model_id}")
 
-    try:
-        status = await adapter.get_status()
-        return {
-            "id": model_id,
-            "name": adapter.backend_name,
-            "backend": model_id,
-            "status": "online" if status.online and status.model_loaded else "offline",
-            "features": adapter.features,
-            "details": {
-                "model_loaded": status.model_loaded,
-                "model_name": status.model_name,
-                "device": status.device,
-                "error": status.error,
-            }
+    health = await health_monitor.get_status(adapter)
+    status = health.status
+    if status is None:
+        logger.error(f"Failed to get model info for {model_id}: {health.error}")
+        raise HTTPException(status_code=500, detail=health.error)
+
+    return {
+        "id": model_id,
+        "name": adapter.backend_name,
+        "backend": model_id,
+        "status": "online" if status.online and status.model_loaded else "offline",
+        "features": adapter.features,
+        "details": {
+            "model_loaded": status.model_loaded,
+            "model_name": status.model_name,
+            "device": status.device,
+            "error": status.error,
+            "checked_at": health.describe()["checked_at"],
+            "circuit": health.breaker.state,
         }
-    except Exception as e:
-        logger.error(f"Failed to get model info for {model_id}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    }
 
 
 @router.get("/models/{model_id}/status")
@@ -90,17 +95,16 @@ async def get_model_status(model_id: str):
     if not adapter:
         raise HTTPException(status_code=404, detail=f"模型不存在: {model_id}")
 
-    try:
-        status = await adapter.get_status()
-        return BackendStatus(
-            id=model_id,
-            name=adapter.backend_name,
-            url=adapter.base_url,
-            status="online" if status.online else "offline",
-            model_loaded=status.model_loaded,
-            features=adapter.features,
-            error=status.error,
-        )
-    except Exception as e:
-        logger.error(f"Failed to get status for {model_id}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    health = await health_monitor.get_status(adapter)
+    if health.status is None:
+        logger.error(f"Failed to get status for {model_id}: {health.error}")
+        raise HTTPException(status_code=500, detail=health.error)
+
+    return BackendStatus(
+        id=model_id,
+        name=adapter.backend_name,
+        url=adapter.base_url,
+        features=adapter.features,
+        admission=admission_service.get(model_id).stats(),
+        **health.describe(),
+    )
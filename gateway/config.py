@@ -2,7 +2,7 @@
 
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
 import yaml
 from pydantic import BaseModel, Field
@@ -14,6 +14,17 @@ class BackendConfig(BaseModel):
     enabled: bool = True
     url: str
     timeout: float = 60.0
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    segment_concurrency: int = 2
+    probe_timeout: float = 5.0
+    urls: List[str] = Field(default_factory=list)
+    weights: List[float] = Field(default_factory=list)
+    balance_policy: str = "least_outstanding"
+    max_concurrency: int = 4
+    max_queue: int = 32
+    max_queue_wait: float = 30.0
 
 
 class BackendsConfig(BaseModel):
@@ -30,6 +41,25 @@ class BackendsConfig(BaseModel):
     )
 
 
+class SegmentationConfig(BaseModel):
+    """长文本分段合成配置"""
+    enabled: bool = True
+    max_chars: int = 120
+
+
+class CacheConfig(BaseModel):
+    """合成结果缓存配置"""
+    enabled: bool = True
+    dir: Optional[str] = None
+    memory_max_bytes: int = 128 * 1024 * 1024
+    memory_ttl: float = 3600.0
+    disk_enabled: bool = True
+    disk_max_bytes: int = 1024 * 1024 * 1024
+    disk_ttl: float = 7 * 24 * 3600.0
+    max_entry_bytes: int = 16 * 1024 * 1024
+    bypass_sampling: bool = False
+
+
 class ServerConfig(BaseModel):
     """服务器配置"""
     host: str = "0.0.0.0"
@@ -40,6 +70,8 @@ class RateLimitConfig(BaseModel):
     """限流配置"""
     enabled: bool = True
     requests_per_minute: int = 60
+    max_clients: int = 100000
+    backend: str = "memory"
 
 
 class Settings(BaseSettings):
@@ -48,19 +80,146 @@ class Settings(BaseSettings):
     # 服务器配置
     host: str = "0.0.0.0"
     port: int = 8000
+    # 受信任的反向代理地址或网段，只有来自这些地址的请求才采用 X-Forwarded-For，
+    # 默认信任本机上的反向代理
+    trusted_proxies: List[str] = ["127.0.0.1", "::1"]
 
     # 后端配置
     qwen3_tts_url: str = "http://localhost:8019"
     qwen3_tts_timeout: float = 60.0
     qwen3_tts_enabled: bool = True
+    qwen3_tts_max_connections: int = 20
+    qwen3_tts_max_keepalive_connections: int = 10
+    qwen3_tts_keepalive_expiry: float = 30.0
+    qwen3_tts_segment_concurrency: int = 2
+    qwen3_tts_probe_timeout: float = 5.0
+    # 多副本：配置后替代 url，按策略在副本间分发请求
+    qwen3_tts_urls: List[str] = []
+    qwen3_tts_weights: List[float] = []
+    qwen3_tts_balance_policy: str = "least_outstanding"
+    # 准入控制：每个副本的同时合成数上限（0 表示不限制）、排队上限与最长排队时间（秒）
+    qwen3_tts_max_concurrency: int = 4
+    qwen3_tts_max_queue: int = 32
+    qwen3_tts_max_queue_wait: float = 30.0
 
     indextts_url: str = "http://localhost:8080"
     indextts_timeout: float = 120.0
     indextts_enabled: bool = True
+    indextts_max_connections: int = 20
+    indextts_max_keepalive_connections: int = 10
+    indextts_keepalive_expiry: float = 30.0
+    indextts_segment_concurrency: int = 2
+    indextts_probe_timeout: float = 5.0
+    # 多副本：配置后替代 url，按策略在副本间分发请求
+    indextts_urls: List[str] = []
+    indextts_weights: List[float] = []
+    indextts_balance_policy: str = "least_outstanding"
+    # 准入控制：每个副本的同时合成数上限（0 表示不限制）、排队上限与最长排队时间（秒）
+    indextts_max_concurrency: int = 4
+    indextts_max_queue: int = 32
+    indextts_max_queue_wait: float = 30.0
+
+    # 分段合成配置
+    segment_enabled: bool = True
+    segment_max_chars: int = 120
+
+    # 合成结果缓存配置
+    cache_enabled: bool = True
+    cache_dir: Optional[str] = None
+    cache_memory_max_bytes: int = 128 * 1024 * 1024
+    cache_memory_ttl: float = 3600.0
+    cache_disk_enabled: bool = True
+    cache_disk_max_bytes: int = 1024 * 1024 * 1024
+    cache_disk_ttl: float = 7 * 24 * 3600.0
+    cache_max_entry_bytes: int = 16 * 1024 * 1024
+    cache_bypass_sampling: bool = False
+
+    # 合并进行中的相同合成请求
+    coalesce_enabled: bool = True
+    # 为后到的相同请求保留的已合成音频上限（字节），超过后不再合并，已读分块随即释放
+    coalesce_replay_max_bytes: int = 4194304
+
+    # 后端音色目录缓存：超过 ttl 的目录先返回旧数据再后台刷新
+    voice_catalog_enabled: bool = True
+    voice_catalog_ttl: float = 60.0
+    voice_catalog_refresh_interval: float = 30.0
+
+    # 音色元数据存储：file（JSON 文件）或 sqlite
+    metadata_backend: str = "file"
+    metadata_sqlite_path: Optional[str] = None
+    # 多次修改合并落盘的等待窗口（秒，仅 file 存储）
+    metadata_flush_delay: float = 0.05
+    # 私人密钥查找标签使用的服务端密钥（十六进制），留空时自动生成并保存在数据目录
+    metadata_key_lookup_secret: Optional[str] = None
+
+    # 密钥哈希计算线程数与校验结果缓存
+    crypto_max_workers: int = 2
+    crypto_verify_cache_ttl: float = 300.0
+    crypto_verify_cache_size: int = 1024
+
+    # 合成请求重试：总尝试次数（1 表示不重试）、退避时间与重试预算
+    retry_max_attempts: int = 2
+    retry_base_delay: float = 0.2
+    retry_max_delay: float = 2.0
+    retry_budget_ratio: float = 0.2
+    retry_budget_min: int = 3
+
+    # 合成请求对冲：超过近期耗时分位数后向同一后端的其他副本再发一次
+    hedge_enabled: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_delay: float = 0.5
+    hedge_min_samples: int = 20
+
+    # 批量合成
+    batch_max_items: int = 500
+    batch_concurrency: int = 8
+
+    # 网关侧转码（mp3/opus/aac/flac 需要 ffmpeg）
+    transcode_ffmpeg_path: str = "ffmpeg"
+    transcode_mp3_bitrate: str = "128k"
+    transcode_opus_bitrate: str = "64k"
+    transcode_aac_bitrate: str = "128k"
+
+    # 异步合成任务
+    jobs_workers: int = 2
+    jobs_max_queue: int = 100
+    jobs_retention: float = 3600.0
+    # 任务状态数据库（多个 worker 共用），默认为 gateway/data/jobs.db
+    jobs_db_path: Optional[str] = None
+
+    # 合成音频存储目录，默认为 gateway/data/audio
+    audio_store_dir: Optional[str] = None
+    # 保留策略：最后一次保存后保留的秒数与文件总大小上限（字节），0 表示不限制
+    audio_store_max_age: float = 604800.0
+    audio_store_max_bytes: int = 10737418240
+
+    # 后端健康监控与熔断
+    health_check_interval: float = 10.0
+    circuit_failure_threshold: int = 3
+    circuit_recovery_timeout: float = 30.0
 
     # 限流配置
     rate_limit_enabled: bool = True
     rate_limit_requests_per_minute: int = 60
+    # 最多跟踪的客户端数，超出后淘汰最久未访问的客户端
+    rate_limit_max_clients: int = 100000
+    # 令牌桶存储：memory（每个 worker 各自计数）、sqlite（本机多个 worker 共享）或 redis（多机共享）
+    rate_limit_backend: str = "memory"
+    rate_limit_sqlite_path: Optional[str] = None
+    rate_limit_redis_url: Optional[str] = None
+    rate_limit_redis_prefix: str = "tts:ratelimit:"
+
+    # 合成配额：按输入字数乘以后端成本系数扣除，分别按客户端 IP 与 X-Private-Key 计算，0 表示不限制
+    quota_enabled: bool = False
+    quota_ip_chars_per_minute: int = 20000
+    quota_ip_chars_per_day: int = 500000
+    quota_key_chars_per_minute: int = 50000
+    quota_key_chars_per_day: int = 2000000
+    # 后端成本系数（如 {"indextts-2.0": 1.5}），未配置的后端为 1.0
+    quota_backend_costs: Dict[str, float] = {}
+
+    # 指标导出（GET /metrics）
+    metrics_enabled: bool = True
 
     # 日志配置
     log_level: str = "INFO"
@@ -84,6 +243,19 @@ def load_yaml_config(config_path: Optional[Path] = None) -> dict:
         return yaml.safe_load(f) or {}
 
 
+def _parse_replicas(entries: list) -> tuple[List[str], List[float]]:
+    """解析副本列表，每项可以是 URL 字符串或 {url, weight}"""
+    urls, weights = [], []
+    for entry in entries or []:
+        if isinstance(entry, dict):
+            urls.append(entry["url"])
+            weights.append(float(entry.get("weight", 1.0)))
+        else:
+            urls.append(entry)
+            weights.append(1.0)
+    return urls, weights
+
+
 def get_settings() -> Settings:
     """获取配置实例，合并 YAML 和环境变量"""
     yaml_config = load_yaml_config()
@@ -98,6 +270,8 @@ def get_settings() -> Settings:
             config_dict["host"] = server["host"]
         if "port" in server:
             config_dict["port"] = server["port"]
+        if "trusted_proxies" in server:
+            config_dict["trusted_proxies"] = server["trusted_proxies"] or []
 
     # 从 YAML 加载后端配置
     if "backends" in yaml_config:
@@ -111,6 +285,23 @@ def get_settings() -> Settings:
                 config_dict["qwen3_tts_timeout"] = qwen["timeout"]
             if "enabled" in qwen:
                 config_dict["qwen3_tts_enabled"] = qwen["enabled"]
+            if "max_connections" in qwen:
+                config_dict["qwen3_tts_max_connections"] = qwen["max_connections"]
+            if "max_keepalive_connections" in qwen:
+                config_dict["qwen3_tts_max_keepalive_connections"] = qwen["max_keepalive_connections"]
+            if "keepalive_expiry" in qwen:
+                config_dict["qwen3_tts_keepalive_expiry"] = qwen["keepalive_expiry"]
+            if "segment_concurrency" in qwen:
+                config_dict["qwen3_tts_segment_concurrency"] = qwen["segment_concurrency"]
+            if "probe_timeout" in qwen:
+                config_dict["qwen3_tts_probe_timeout"] = qwen["probe_timeout"]
+            if "urls" in qwen:
+                config_dict["qwen3_tts_urls"], config_dict["qwen3_tts_weights"] = _parse_replicas(qwen["urls"])
+            if "balance_policy" in qwen:
+                config_dict["qwen3_tts_balance_policy"] = qwen["balance_policy"]
+            for key in ("max_concurrency", "max_queue", "max_queue_wait"):
+                if key in qwen:
+                    config_dict[f"qwen3_tts_{key}"] = qwen[key]
 
         if "indextts" in backends:
             idx = backends["indextts"]
@@ -120,6 +311,124 @@ def get_settings() -> Settings:
                 config_dict["indextts_timeout"] = idx["timeout"]
             if "enabled" in idx:
                 config_dict["indextts_enabled"] = idx["enabled"]
+            if "max_connections" in idx:
+                config_dict["indextts_max_connections"] = idx["max_connections"]
+            if "max_keepalive_connections" in idx:
+                config_dict["indextts_max_keepalive_connections"] = idx["max_keepalive_connections"]
+            if "keepalive_expiry" in idx:
+                config_dict["indextts_keepalive_expiry"] = idx["keepalive_expiry"]
+            if "segment_concurrency" in idx:
+                config_dict["indextts_segment_concurrency"] = idx["segment_concurrency"]
+            if "probe_timeout" in idx:
+                config_dict["indextts_probe_timeout"] = idx["probe_timeout"]
+            if "urls" in idx:
+                config_dict["indextts_urls"], config_dict["indextts_weights"] = _parse_replicas(idx["urls"])
+            if "balance_policy" in idx:
+                config_dict["indextts_balance_policy"] = idx["balance_policy"]
+            for key in ("max_concurrency", "max_queue", "max_queue_wait"):
+                if key in idx:
+                    config_dict[f"indextts_{key}"] = idx[key]
+
+    # 从 YAML 加载分段合成配置
+    if "segmentation" in yaml_config:
+        seg = yaml_config["segmentation"]
+        if "enabled" in seg:
+            config_dict["segment_enabled"] = seg["enabled"]
+        if "max_chars" in seg:
+            config_dict["segment_max_chars"] = seg["max_chars"]
+
+    # 从 YAML 加载缓存配置
+    if "cache" in yaml_config:
+        cache = yaml_config["cache"]
+        for key in (
+            "enabled",
+            "dir",
+            "memory_max_bytes",
+            "memory_ttl",
+            "disk_enabled",
+            "disk_max_bytes",
+            "disk_ttl",
+            "max_entry_bytes",
+            "bypass_sampling",
+        ):
+            if key in cache:
+                config_dict[f"cache_{key}"] = cache[key]
+
+    # 从 YAML 加载请求合并配置
+    if "coalesce" in yaml_config:
+        coalesce = yaml_config["coalesce"]
+        if "enabled" in coalesce:
+            config_dict["coalesce_enabled"] = coalesce["enabled"]
+        if "replay_max_bytes" in coalesce:
+            config_dict["coalesce_replay_max_bytes"] = coalesce["replay_max_bytes"]
+
+    # 从 YAML 加载音色目录缓存配置
+    if "voice_catalog" in yaml_config:
+        catalog = yaml_config["voice_catalog"]
+        if "enabled" in catalog:
+            config_dict["voice_catalog_enabled"] = catalog["enabled"]
+        if "ttl" in catalog:
+            config_dict["voice_catalog_ttl"] = catalog["ttl"]
+        if "refresh_interval" in catalog:
+            config_dict["voice_catalog_refresh_interval"] = catalog["refresh_interval"]
+
+    # 从 YAML 加载元数据存储配置
+    if "metadata" in yaml_config:
+        meta = yaml_config["metadata"]
+        if "backend" in meta:
+            config_dict["metadata_backend"] = meta["backend"]
+        if "sqlite_path" in meta:
+            config_dict["metadata_sqlite_path"] = meta["sqlite_path"]
+        if "flush_delay" in meta:
+            config_dict["metadata_flush_delay"] = meta["flush_delay"]
+        if "key_lookup_secret" in meta:
+            config_dict["metadata_key_lookup_secret"] = meta["key_lookup_secret"]
+
+    # 从 YAML 加载密钥计算配置
+    if "crypto" in yaml_config:
+        crypto = yaml_config["crypto"]
+        if "max_workers" in crypto:
+            config_dict["crypto_max_workers"] = crypto["max_workers"]
+        if "verify_cache_ttl" in crypto:
+            config_dict["crypto_verify_cache_ttl"] = crypto["verify_cache_ttl"]
+        if "verify_cache_size" in crypto:
+            config_dict["crypto_verify_cache_size"] = crypto["verify_cache_size"]
+
+    # 从 YAML 加载重试、对冲、批量合成、异步任务、转码、指标与配额配置
+    for section, keys in (
+        ("retry", ("max_attempts", "base_delay", "max_delay", "budget_ratio", "budget_min")),
+        ("hedge", ("enabled", "quantile", "min_delay", "min_samples")),
+        ("batch", ("max_items", "concurrency")),
+        ("jobs", ("workers", "max_queue", "retention", "db_path")),
+        ("transcode", ("ffmpeg_path", "mp3_bitrate", "opus_bitrate", "aac_bitrate")),
+        ("metrics", ("enabled",)),
+        ("quota", (
+            "enabled", "ip_chars_per_minute", "ip_chars_per_day",
+            "key_chars_per_minute", "key_chars_per_day", "backend_costs",
+        )),
+    ):
+        if section in yaml_config:
+            for key in keys:
+                if key in yaml_config[section]:
+                    config_dict[f"{section}_{key}"] = yaml_config[section][key]
+
+    # 从 YAML 加载音频存储配置
+    audio_store = yaml_config.get("audio_store") or {}
+    if audio_store.get("dir"):
+        config_dict["audio_store_dir"] = audio_store["dir"]
+    for key in ("max_age", "max_bytes"):
+        if key in audio_store:
+            config_dict[f"audio_store_{key}"] = audio_store[key]
+
+    # 从 YAML 加载健康监控配置
+    if "health" in yaml_config:
+        health = yaml_config["health"]
+        if "interval" in health:
+            config_dict["health_check_interval"] = health["interval"]
+        if "failure_threshold" in health:
+            config_dict["circuit_failure_threshold"] = health["failure_threshold"]
+        if "recovery_timeout" in health:
+            config_dict["circuit_recovery_timeout"] = health["recovery_timeout"]
 
     # 从 YAML 加载限流配置
     if "rate_limit" in yaml_config:
@@ -128,6 +437,9 @@ def get_settings() -> Settings:
             config_dict["rate_limit_enabled"] = rl["enabled"]
         if "requests_per_minute" in rl:
             config_dict["rate_limit_requests_per_minute"] = rl["requests_per_minute"]
+        for key in ("max_clients", "backend", "sqlite_path", "redis_url", "redis_prefix"):
+            if key in rl:
+                config_dict[f"rate_limit_{key}"] = rl[key]
 
     # 创建配置实例（环境变量会覆盖 YAML 配置）
     return Settings(**config_dict)
@@ -3,14 +3,22 @@
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from . import __version__
 from .config import settings
-from .adapters import AdapterFactory
+from .adapters import AdapterFactory, health_monitor
 from .api.v1 import router as v1_router
 from .middleware import RateLimitMiddleware, LoggingMiddleware
+from .services.admission_service import admission_service
+from .services.cache_service import synthesis_cache
+from .services.job_service import job_service
+from .services.metadata_service import metadata_service
+from .services.voice_service import voice_service
+from .utils.crypto import shutdown_executor
+from .utils.metrics import registry
 from .schemas.response import HealthResponse, BackendStatus
 
 # 配置日志
@@ -28,20 +36,26 @@ async def lifespan(app: FastAPI):
     logger.info(f"TTS Gateway v{__version__} 启动中...")
     logger.info("=" * 50)
 
-    # 初始化适配器
-    AdapterFactory.initialize()
+    # 初始化适配器（含连接池与健康监控）
+    await AdapterFactory.startup()
     logger.info(f"已注册后端: {AdapterFactory.list_backend_ids()}")
 
-    # 检查后端状态
-    for backend_id, adapter in AdapterFactory.get_all().items():
-        try:
-            status = await adapter.get_status()
-            if status.online:
-                logger.info(f"  {backend_id}: ONLINE (model_loaded={status.model_loaded})")
-            else:
-                logger.warning(f"  {backend_id}: OFFLINE ({status.error})")
-        except Exception as e:
-            logger.warning(f"  {backend_id}: ERROR ({e})")
+    # 并发检查后端状态，结果同时作为健康监控的初始状态
+    healths = await health_monitor.probe_all(AdapterFactory.get_all())
+    for backend_id, health in healths.items():
+        status = health.status
+        if status is None:
+            logger.warning(f"  {backend_id}: ERROR ({health.error})")
+        elif status.online:
+            logger.info(f"  {backend_id}: ONLINE (model_loaded={status.model_loaded})")
+        else:
+            logger.warning(f"  {backend_id}: OFFLINE ({status.error})")
+
+    # 后台刷新音色目录
+    await voice_service.start()
+
+    # 启动异步合成任务 worker
+    await job_service.start()
 
     logger.info(f"服务已启动: http://{settings.host}:{settings.port}")
     logger.info("API 文档: http://{settings.host}:{settings.port}/docs")
@@ -50,7 +64,11 @@ async def lifespan(app: FastAPI):
 
     # 关闭时清理
     logger.info("TTS Gateway 正在关闭...")
-    AdapterFactory.reset()
+    await job_service.stop()
+    await voice_service.stop()
+    await metadata_service.flush()
+    await AdapterFactory.shutdown()
+    shutdown_executor()
 
 
 # 创建 FastAPI 应用
@@ -76,10 +94,12 @@ app.add_middleware(
 app.add_middleware(
     RateLimitMiddleware,
     requests_per_minute=settings.rate_limit_requests_per_minute,
+    max_clients=settings.rate_limit_max_clients,
+    trusted_proxies=settings.trusted_proxies,
 )
 
 # 添加日志中间件
-app.add_middleware(LoggingMiddleware)
+app.add_middleware(LoggingMiddleware, trusted_proxies=settings.trusted_proxies)
 
 # 注册 API 路由
 app.include_router(v1_router, prefix="/v1")
@@ -101,28 +121,19 @@ async def health_check():
     """健康检查"""
     backends = []
 
-    for backend_id, adapter in AdapterFactory.get_all().items():
-        try:
-            status = await adapter.get_status()
-            backends.append(BackendStatus(
-                id=backend_id,
-                name=adapter.backend_name,
-                url=adapter.base_url,
-                status="online" if status.online else "offline",
-                model_loaded=status.model_loaded,
-                features=adapter.features,
-                error=status.error,
-            ))
-        except Exception as e:
-            backends.append(BackendStatus(
-                id=backend_id,
-                name=adapter.backend_name,
-                url=adapter.base_url,
-                status="error",
-                model_loaded=False,
-                features=adapter.features,
-                error=str(e),
-            ))
+    # 使用健康监控缓存的状态，不逐个请求后端
+    adapters = AdapterFactory.get_all()
+    healths = await health_monitor.get_statuses(adapters)
+
+    for backend_id, adapter in adapters.items():
+        backends.append(BackendStatus(
+            id=backend_id,
+            name=adapter.backend_name,
+            url=adapter.base_url,
+            features=adapter.features,
+            admission=admission_service.get(backend_id).stats(),
+            **healths[backend_id].describe(),
+        ))
 
     return HealthResponse(
         status="running",
@@ -131,6 +142,60 @@ async def health_check():
     )
 
 
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics():
+    """Prometheus 文本格式的运行指标"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    await job_service.refresh_stats()
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def _register_runtime_metrics() -> None:
+    """将各服务内部已有的统计注册为采集时取值的指标"""
+    def admission(field: str):
+        return lambda: {
+            (backend_id,): stats[field]
+            for backend_id, stats in admission_service.stats().items()
+        }
+
+    def backend_up():
+        result = {}
+        for backend_id in AdapterFactory.list_backend_ids():
+            status = health_monitor.get(backend_id).status
+            result[(backend_id,)] = 1 if status is not None and status.online else 0
+        return result
+
+    def circuit_state():
+        return {
+            (backend_id, health_monitor.get(backend_id).breaker.state): 1
+            for backend_id in AdapterFactory.list_backend_ids()
+        }
+
+    registry.callback("tts_admission_active", "占用执行名额的请求数", ("backend",), admission("active"))
+    registry.callback("tts_admission_queued", "排队等待执行名额的请求数", ("backend",), admission("queued"))
+    registry.callback(
+        "tts_admission_rejected_total", "准入控制拒绝的请求数", ("backend",),
+        admission("rejected_total"), kind="counter",
+    )
+    registry.callback("tts_backend_up", "后端最近一次探测是否在线", ("backend",), backend_up)
+    registry.callback("tts_circuit_state", "后端熔断器当前状态", ("backend", "state"), circuit_state)
+    registry.callback(
+        "tts_cache_memory_bytes", "合成结果缓存内存层占用字节数", (),
+        lambda: {(): synthesis_cache.memory_bytes},
+    )
+    registry.callback(
+        "tts_jobs", "异步合成任务数", ("status",),
+        lambda: {(status,): count for status, count in job_service.stats().items()},
+    )
+
+
+_register_runtime_metrics()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
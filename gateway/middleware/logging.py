@@ -2,44 +2,75 @@
 
 import logging
 import time
-from typing import Callable
+from typing import Iterable, Optional
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from gateway.utils.metrics import registry
+from gateway.utils.network import get_client_ip, parse_networks
 
 logger = logging.getLogger("gateway.access")
 
+HTTP_REQUESTS = registry.counter(
+    "tts_http_requests_total",
+    "HTTP 请求数",
+    ("method", "route", "status"),
+)
+HTTP_DURATION = registry.histogram(
+    "tts_http_request_duration_seconds",
+    "HTTP 请求耗时（至响应体发送完毕，流式响应包含整个传输过程）",
+    ("method", "route"),
+)
+
 
-class LoggingMiddleware(BaseHTTPMiddleware):
+class LoggingMiddleware:
     """
     请求日志中间件
 
-    记录请求路径、方法、耗时、状态码
+    记录请求路径、方法、耗时、状态码。
+    以 ASGI 中间件实现，只包装 send 在响应开始时追加 X-Response-Time（首字节耗时），
+    不缓冲响应体，也不为每个请求额外创建任务
     """
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """处理请求并记录日志"""
-        start_time = time.time()
+    def __init__(self, app: ASGIApp, trusted_proxies: Optional[Iterable[str]] = None):
+        self.app = app
+        self.trusted_proxies = parse_networks(trusted_proxies or ())
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        # 获取客户端 IP
-        client_ip = self._get_client_ip(request)
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # 添加响应头
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Response-Time", f"{(time.perf_counter() - start_time) * 1000:.2f}ms")
+            await send(message)
 
         # 处理请求
         try:
-            response = await call_next(request)
-            status_code = response.status_code
+            await self.app(scope, receive, send_with_timing)
         except Exception as e:
             # 记录异常
-            duration = (time.time() - start_time) * 1000
+            duration = (time.perf_counter() - start_time) * 1000
+            self._observe(scope, 500, duration)
             logger.error(
-                f"{client_ip} - {request.method} {request.url.path} - "
+                f"{self._get_client_ip(scope)} - {scope['method']} {scope['path']} - "
                 f"ERROR ({duration:.2f}ms) - {str(e)}"
             )
             raise
 
         # 计算耗时
-        duration = (time.time() - start_time) * 1000
+        duration = (time.perf_counter() - start_time) * 1000
+        self._observe(scope, status_code, duration)
 
         # 根据状态码选择日志级别
         if status_code >= 500:
@@ -51,26 +82,33 @@ class LoggingMiddleware(BaseHTTPMiddleware):
 
         # 记录日志
         log_func(
-            f"{client_ip} - {request.method} {request.url.path} - "
+            f"{self._get_client_ip(scope)} - {scope['method']} {scope['path']} - "
             f"{status_code} ({duration:.2f}ms)"
         )
 
-        # 添加响应头
-        response.headers["X-Response-Time"] = f"{duration:.2f}ms"
-
-        return response
-
-    def _get_client_ip(self, request: Request) -> str:
+    def _observe(self, scope: Scope, status_code: int, duration_ms: float) -> None:
+        """记录请求指标，按路由模板而不是实际路径分组，避免标签数量失控"""
+        route_path = self._route_template(scope)
+        HTTP_REQUESTS.labels(scope["method"], route_path, str(status_code)).inc()
+        HTTP_DURATION.labels(scope["method"], route_path).observe(duration_ms / 1000)
+
+    @staticmethod
+    def _route_template(scope: Scope) -> str:
+        """
+        获取匹配到的路由模板
+
+        挂载在前缀下的子路由只记录相对路径（如 /audio/speech），
+        按实际路径的段数补回前缀（如 /v1）
+        """
+        route = scope.get("route")
+        template = getattr(route, "path", None)
+        if template is None:
+            return "unmatched"
+        path_segments = scope["path"].rstrip("/").split("/")
+        template_segments = template.rstrip("/").split("/")
+        prefix = "/".join(path_segments[:len(path_segments) - len(template_segments) + 1])
+        return prefix + template
+
+    def _get_client_ip(self, scope: Scope) -> str:
         """获取客户端 IP"""
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
-
-        if request.client:
-            return request.client.host
-
-        return "unknown"
+        return get_client_ip(HTTPConnection(scope), self.trusted_proxies)
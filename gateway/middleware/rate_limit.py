@@ -1,107 +1,106 @@
 """请求限流中间件"""
 
-import time
-from collections import defaultdict
-from typing import Dict, Tuple
+import math
+from typing import Iterable, Optional, Tuple
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from gateway.config import settings
+from gateway.services.rate_limit_store import BucketStore, create_bucket_store
+from gateway.utils.metrics import registry
+from gateway.utils.network import get_client_ip, parse_networks
 
+RATE_LIMIT_DECISIONS = registry.counter(
+    "tts_rate_limit_decisions_total",
+    "限流判定次数（result: allowed / limited）",
+    ("result",),
+)
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+# 不限流的端点
+_EXEMPT_PATHS = frozenset(("/", "/health", "/metrics", "/docs", "/openapi.json", "/redoc"))
+
+
+class RateLimitMiddleware:
     """
-    简单的令牌桶限流中间件
+    令牌桶限流中间件
 
-    按 IP 地址限制每分钟请求数
+    按客户端 IP 限制每分钟请求数；只有来自受信任代理的请求才采用 X-Forwarded-For，
+    客户端无法通过伪造请求头制造任意多个限流键。
+    以 ASGI 中间件实现，只包装 send 在响应开始时追加限流头，不缓冲响应体
     """
 
-    def __init__(self, app, requests_per_minute: int = 60):
-        super().__init__(app)
+    def __init__(
+        self,
+        app: ASGIApp,
+        requests_per_minute: int = 60,
+        max_clients: int = 100000,
+        trusted_proxies: Optional[Iterable[str]] = None,
+        store: Optional[BucketStore] = None,
+    ):
+        self.app = app
         self.requests_per_minute = requests_per_minute
         self.tokens_per_second = requests_per_minute / 60.0
+        self.trusted_proxies = parse_networks(trusted_proxies or ())
+
+        # 未指定时按配置创建：进程内、本机共享文件或 Redis
+        if store is None:
+            store = create_bucket_store(
+                capacity=requests_per_minute,
+                refill_rate=self.tokens_per_second,
+                max_entries=max_clients,
+            )
+        self._buckets = store
 
-        # 存储每个 IP 的 (tokens, last_update_time)
-        self._buckets: Dict[str, Tuple[float, float]] = defaultdict(
-            lambda: (float(requests_per_minute), time.time())
-        )
-
-    def _get_client_ip(self, request: Request) -> str:
+    def _get_client_ip(self, scope: Scope) -> str:
         """获取客户端 IP"""
-        # 优先使用代理转发的真实 IP
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
-
-        # 回退到直连 IP
-        if request.client:
-            return request.client.host
+        return get_client_ip(HTTPConnection(scope), self.trusted_proxies)
 
-        return "unknown"
-
-    def _check_rate_limit(self, client_ip: str) -> Tuple[bool, float]:
+    async def _check_rate_limit(self, client_ip: str) -> Tuple[bool, float]:
         """
         检查速率限制
 
         Returns:
             (是否允许, 剩余令牌数)
         """
-        now = time.time()
-        tokens, last_update = self._buckets[client_ip]
-
-        # 计算新增的令牌
-        elapsed = now - last_update
-        new_tokens = min(
-            self.requests_per_minute,
-            tokens + elapsed * self.tokens_per_second
-        )
-
-        if new_tokens >= 1.0:
-            # 消耗一个令牌
-            self._buckets[client_ip] = (new_tokens - 1.0, now)
-            return True, new_tokens - 1.0
-        else:
-            # 令牌不足
-            self._buckets[client_ip] = (new_tokens, now)
-            return False, new_tokens
-
-    async def dispatch(self, request: Request, call_next):
-        """处理请求"""
-        # 检查是否启用限流
-        if not settings.rate_limit_enabled:
-            return await call_next(request)
-
-        # 跳过健康检查等端点
-        if request.url.path in ("/", "/health", "/docs", "/openapi.json", "/redoc"):
-            return await call_next(request)
-
-        client_ip = self._get_client_ip(request)
-        allowed, remaining = self._check_rate_limit(client_ip)
+        return await self._buckets.acquire(client_ip)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # 检查是否启用限流，跳过健康检查等端点
+        if scope["type"] != "http" or not settings.rate_limit_enabled or scope["path"] in _EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        client_ip = self._get_client_ip(scope)
+        allowed, remaining = await self._check_rate_limit(client_ip)
+        RATE_LIMIT_DECISIONS.labels("allowed" if allowed else "limited").inc()
 
         if not allowed:
-            return JSONResponse(
+            retry_after = self._buckets.retry_after(remaining)
+            response = JSONResponse(
                 status_code=429,
                 content={
                     "error": "Too Many Requests",
                     "message": f"请求过于频繁，请稍后再试。限制: {self.requests_per_minute} 请求/分钟",
-                    "retry_after": 1.0 / self.tokens_per_second,
+                    "retry_after": round(retry_after, 3),
                 },
                 headers={
                     "X-RateLimit-Limit": str(self.requests_per_minute),
                     "X-RateLimit-Remaining": "0",
-                    "Retry-After": str(int(1.0 / self.tokens_per_second)),
+                    "Retry-After": str(max(1, math.ceil(retry_after))),
                 }
             )
-
-        # 添加限流头信息
-        response = await call_next(request)
-        response.headers["X-RateLimit-Limit"] = str(self.requests_per_minute)
-        response.headers["X-RateLimit-Remaining"] = str(int(remaining))
-
-        return response
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            # 添加限流头信息
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-RateLimit-Limit", str(self.requests_per_minute))
+                headers.append("X-RateLimit-Remaining", str(int(remaining)))
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -1,6 +1,6 @@
 """Pydantic 数据模型"""
 
-from .request import TTSRequest
+from .request import BatchTTSRequest, TTSRequest
 from .response import (
     TTSResponse,
     VoiceInfo,
@@ -12,6 +12,7 @@ from .response import (
 
 __all__ = [
     "TTSRequest",
+    "BatchTTSRequest",
     "TTSResponse",
     "VoiceInfo",
     "VoicesResponse",
@@ -23,9 +23,9 @@ class TTSRequest(BaseModel):
         default="default",
         description="音色ID"
     )
-    response_format: Literal["wav", "mp3"] = Field(
+    response_format: Literal["wav", "mp3", "opus", "aac", "flac", "pcm"] = Field(
         default="wav",
-        description="输出音频格式"
+        description="输出音频格式，pcm 为无头部的 16 位小端 PCM"
     )
     speed: float = Field(
         default=1.0,
@@ -109,7 +109,9 @@ class TTSRequest(BaseModel):
     )
     save_name: Optional[str] = Field(
         default=None,
-        description="保存文件名"
+        max_length=128,
+        pattern=r"^[^/\\]+$",
+        description="保存名称，之后可按名称下载"
     )
 
     @field_validator("emo_vector")
@@ -124,6 +126,20 @@ class TTSRequest(BaseModel):
         return v
 
 
+class BatchTTSRequest(BaseModel):
+    """批量 TTS 请求"""
+    items: List[TTSRequest] = Field(
+        ...,
+        min_length=1,
+        description="合成请求列表"
+    )
+    concurrency: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="同时合成的条数，不超过服务端上限"
+    )
+
+
 class VoiceUploadRequest(BaseModel):
     """音色上传请求"""
     voice_id: str = Field(
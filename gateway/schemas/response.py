@@ -1,6 +1,6 @@
 """TTS 响应模型"""
 
-from typing import List, Literal, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -16,6 +16,10 @@ class TTSResponse(BaseModel):
     audio_id: Optional[str] = None
     model_used: Optional[str] = None
     duration: Optional[float] = None
+    # 异步任务字段
+    job_id: Optional[str] = None
+    status: Optional[str] = Field(default=None, description="任务状态：queued/running/succeeded/failed")
+    error: Optional[str] = None
 
 
 class VoiceInfo(BaseModel):
@@ -33,6 +37,8 @@ class VoicesResponse(BaseModel):
     """音色列表响应"""
     voices: List[VoiceInfo]
     total: int
+    # 所用音色目录中最旧一份的缓存时长（秒），未使用缓存时为空
+    catalog_age: Optional[float] = None
 
 
 class VoiceUploadResponse(BaseModel):
@@ -66,6 +72,11 @@ class BackendStatus(BaseModel):
     model_loaded: bool = False
     features: List[str] = Field(default_factory=list)
     error: Optional[str] = None
+    # 状态探测时间（ISO 8601）与熔断器状态 closed / open / half_open
+    checked_at: Optional[str] = None
+    circuit: Optional[str] = None
+    # 准入控制统计：进行中/排队数、排队等待时间等
+    admission: Optional[Dict[str, Any]] = None
 
 
 class ModelInfo(BaseModel):
@@ -0,0 +1,242 @@
+"""后端并发准入控制"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Optional
+
+from gateway.adapters import AdapterFactory, BackendUnavailableError
+from gateway.adapters.pool import ReplicaPool
+from gateway.config import settings
+
+# 耗时统计的平滑系数
+_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejectedError(BackendUnavailableError):
+    """后端已满载，请求被拒绝"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    单个后端的准入控制
+
+    同时进行的合成调用数不超过 max_concurrency，超出的调用按到达顺序排队；
+    队列已满或排队超过 max_queue_wait 秒时立即拒绝，让客户端稍后重试，
+    而不是把请求压到已经满载的 GPU 后端上。
+
+    上限按副本计算：总上限为每副本上限乘以当前健康副本数，
+    副本故障时上限随之收缩，恢复后自动放开
+    """
+
+    def __init__(
+        self,
+        backend_id: str,
+        max_concurrency: int = 4,
+        max_queue: int = 32,
+        max_queue_wait: float = 30.0,
+        replicas: Optional[Callable[[], int]] = None,
+    ):
+        """
+        Args:
+            backend_id: 后端 ID
+            max_concurrency: 每个副本的同时合成数上限，0 表示不限制
+            max_queue: 排队上限
+            max_queue_wait: 最长排队时间（秒）
+            replicas: 返回当前健康副本数的函数，未提供时按单副本计算
+        """
+        self.backend_id = backend_id
+        self.per_replica_concurrency = max_concurrency
+        self._replicas = replicas
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        self.admitted_total = 0
+        self.rejected_total = 0
+        # 排队等待与占用时长的指数加权平均（秒）
+        self.avg_wait = 0.0
+        self.max_wait = 0.0
+        self.avg_service_time = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_replica_concurrency > 0
+
+    @property
+    def max_concurrency(self) -> int:
+        """当前的总上限（所有副本都不健康时仍保留一个副本的名额）"""
+        replicas = self._replicas() if self._replicas is not None else 1
+        return self.per_replica_concurrency * max(1, replicas)
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def retry_after(self) -> int:
+        """估算客户端多久后重试：排在队列后面需要等待的处理时间"""
+        if self.avg_service_time <= 0:
+            return 1
+        rounds = (self.queued + 1) / max(1, self.max_concurrency)
+        return max(1, math.ceil(self.avg_service_time * rounds))
+
+    def _reject(self, reason: str) -> AdmissionRejectedError:
+        self.rejected_total += 1
+        return AdmissionRejectedError(
+            f"{self.backend_id} 后端繁忙（{reason}），请稍后重试",
+            retry_after=self.retry_after(),
+        )
+
+    async def acquire(self) -> None:
+        """获取执行名额，必要时排队等待"""
+        if not self.enabled:
+            return
+
+        started = time.monotonic()
+        # 副本恢复后上限变大，先把空出的名额交给排队中的请求
+        self._grant()
+        if self.active < self.max_concurrency and not self.queued:
+            self.active += 1
+        else:
+            if self.queued >= self.max_queue:
+                raise self._reject("队列已满")
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.max_queue_wait)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise self._reject("排队超时")
+            except BaseException:
+                if self._abandon(waiter):
+                    self.release()
+                raise
+
+        self.admitted_total += 1
+        self._observe_wait(time.monotonic() - started)
+
+    def _abandon(self, waiter: asyncio.Future) -> bool:
+        """
+        放弃排队
+
+        Returns:
+            bool: 放弃前名额是否已经转交给了该请求（此时仍持有名额）
+        """
+        if waiter.done() and not waiter.cancelled():
+            return True
+        waiter.cancel()
+        return False
+
+    def release(self, service_time: Optional[float] = None) -> None:
+        """释放名额，按上限转交给排队中的请求"""
+        if not self.enabled:
+            return
+
+        if service_time is not None:
+            self.avg_service_time = self._ewma(self.avg_service_time, service_time)
+
+        self.active -= 1
+        self._grant()
+
+    def _grant(self) -> None:
+        """在上限内按到达顺序把名额交给排队中的请求（上限收缩时不再转交）"""
+        limit = self.max_concurrency
+        while self._waiters and self.active < limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.active += 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """在名额内执行"""
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "per_replica_concurrency": self.per_replica_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "avg_queue_wait": round(self.avg_wait, 3),
+            "peak_queue_wait": round(self.max_wait, 3),
+            "avg_service_time": round(self.avg_service_time, 3),
+        }
+
+    def _observe_wait(self, waited: float) -> None:
+        self.avg_wait = self._ewma(self.avg_wait, waited)
+        self.max_wait = max(self.max_wait, waited)
+
+    @staticmethod
+    def _ewma(current: float, sample: float) -> float:
+        if current == 0.0:
+            return sample
+        return current + _EWMA_ALPHA * (sample - current)
+
+
+class AdmissionService:
+    """按后端管理准入控制器"""
+
+    def __init__(self):
+        self._controllers: Dict[str, AdmissionController] = {}
+
+    def get(self, backend_id: str) -> AdmissionController:
+        controller = self._controllers.get(backend_id)
+        if controller is None:
+            controller = AdmissionController(
+                backend_id,
+                replicas=lambda: self._healthy_replicas(backend_id),
+                **self._limits(backend_id),
+            )
+            self._controllers[backend_id] = controller
+        return controller
+
+    def stats(self) -> Dict[str, dict]:
+        return {backend_id: c.stats() for backend_id, c in self._controllers.items()}
+
+    def reset(self) -> None:
+        """清空所有控制器（主要用于测试）"""
+        self._controllers.clear()
+
+    @staticmethod
+    def _healthy_replicas(backend_id: str) -> int:
+        """后端当前的健康副本数，未配置多副本时为 1"""
+        adapter = AdapterFactory.get(backend_id)
+        if isinstance(adapter, ReplicaPool):
+            return sum(1 for replica in adapter.replicas if replica.healthy)
+        return 1
+
+    @staticmethod
+    def _limits(backend_id: str) -> dict:
+        prefix = {
+            "qwen3-tts": "qwen3_tts",
+            "indextts-2.0": "indextts",
+        }.get(backend_id)
+        if prefix is None:
+            return {"max_concurrency": 0}
+        return {
+            "max_concurrency": getattr(settings, f"{prefix}_max_concurrency"),
+            "max_queue": getattr(settings, f"{prefix}_max_queue"),
+            "max_queue_wait": getattr(settings, f"{prefix}_max_queue_wait"),
+        }
+
+
+# 单例实例
+admission_service = AdmissionService()
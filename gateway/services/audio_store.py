@@ -0,0 +1,337 @@
+"""本地音频文件存储"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from gateway.config import settings
+from gateway.utils.audio import STREAMING_SIZE, locate_wav_data
+
+logger = logging.getLogger(__name__)
+
+# 音频 ID 为内容的 SHA-256，只允许十六进制字符，避免路径穿越
+_AUDIO_ID = re.compile(r"^[0-9a-f]{64}$")
+
+# 写入缓冲区达到该大小后再交给线程写盘
+_FLUSH_BYTES = 256 * 1024
+
+# 读取 WAV 头部的长度，足够覆盖 fmt 与常见的 LIST 附加块
+_HEADER_BYTES = 4096
+
+# 两次按保留策略清理之间的最短间隔（秒）
+_SWEEP_INTERVAL = 60.0
+
+
+class AudioRecord:
+    """已保存音频的索引记录"""
+
+    def __init__(
+        self,
+        audio_id: str,
+        fmt: str,
+        size: int,
+        duration: Optional[float] = None,
+        created_at: Optional[float] = None,
+    ):
+        self.audio_id = audio_id
+        self.fmt = fmt
+        self.size = size
+        self.duration = duration
+        self.created_at = created_at or time.time()
+
+    @property
+    def filename(self) -> str:
+        return f"{self.audio_id}.{self.fmt}"
+
+
+class AudioWriter:
+    """
+    流式写入单个音频
+
+    分块数据先写入临时文件，提交时按内容计算 ID 并移动到最终位置，
+    中途放弃时删除临时文件
+    """
+
+    def __init__(self, store: "AudioStore", fmt: str):
+        self.store = store
+        self.fmt = fmt
+        self.tmp_path = store.store_dir / "tmp" / f"{uuid.uuid4().hex}.{fmt}.tmp"
+        self._file = None
+        self._buffer = bytearray()
+
+    async def write(self, chunk: bytes) -> None:
+        self._buffer += chunk
+        if len(self._buffer) >= _FLUSH_BYTES:
+            await self._flush()
+
+    async def commit(self, name: Optional[str] = None) -> AudioRecord:
+        """
+        完成写入
+
+        Args:
+            name: 可选的别名，之后可以按名称访问
+
+        Returns:
+            AudioRecord: 音频记录，内容相同的音频只保存一份
+        """
+        await self._flush()
+        if self._file is None:
+            raise ValueError("没有可保存的音频数据")
+        self._file.close()
+        return await asyncio.to_thread(self.store._commit, self.tmp_path, self.fmt, name)
+
+    async def abort(self) -> None:
+        """放弃写入并删除临时文件"""
+        await asyncio.to_thread(self._discard)
+
+    async def _flush(self) -> None:
+        if not self._buffer:
+            return
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        await asyncio.to_thread(self._write, data)
+
+    def _write(self, data: bytes) -> None:
+        if self._file is None:
+            self.tmp_path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.tmp_path, "wb")
+        self._file.write(data)
+
+    def _discard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class AudioStore:
+    """
+    内容寻址的本地音频存储
+
+    音频以内容的 SHA-256 作为 ID，保存为 <ID 前两位>/<ID>.<格式>，相同内容只保存一份；
+    索引保存在同目录的 index.db（SQLite，WAL 模式）中，记录格式、大小、时长以及名称到 ID 的映射，
+    多个 worker 进程共用同一份索引，任一进程保存的音频在其他进程中立即可见。
+
+    保留策略：超过 max_age 秒未再保存的音频、以及总大小超过 max_bytes 时最早保存的音频
+    连同指向它们的名称一起删除（0 表示不限制），在保存时定期检查
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS audio (
+            audio_id TEXT PRIMARY KEY,
+            format TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            duration REAL,
+            created_at REAL NOT NULL,
+            saved_at REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_audio_saved_at ON audio(saved_at);
+        CREATE TABLE IF NOT EXISTS names (
+            name TEXT PRIMARY KEY,
+            audio_id TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_names_audio_id ON names(audio_id);
+    """
+
+    def __init__(
+        self,
+        store_dir: Optional[Path] = None,
+        max_age: float = 0.0,
+        max_bytes: int = 0,
+    ):
+        """
+        Args:
+            store_dir: 存储目录，默认为 gateway/data/audio
+            max_age: 音频最后一次保存后保留的秒数，0 表示不限制
+            max_bytes: 音频文件总大小上限，0 表示不限制
+        """
+        if store_dir is None:
+            store_dir = Path(__file__).parent.parent / "data" / "audio"
+        self.store_dir = store_dir
+        self.index_path = store_dir / "index.db"
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._next_sweep = 0.0
+        # 提交在线程中执行，连接的使用需要加锁
+        self._lock = threading.Lock()
+
+    def writer(self, fmt: str) -> AudioWriter:
+        """创建流式写入器"""
+        return AudioWriter(self, fmt)
+
+    def get(self, audio_id: str) -> Optional[AudioRecord]:
+        """按 ID 查找音频"""
+        if not _AUDIO_ID.match(audio_id):
+            return None
+        with self._lock:
+            row = self._db().execute(
+                "SELECT audio_id, format, size, duration, created_at FROM audio WHERE audio_id = ?",
+                (audio_id,),
+            ).fetchone()
+        return AudioRecord(*row) if row else None
+
+    def resolve(self, ref: str) -> Optional[AudioRecord]:
+        """按 ID 或保存时指定的名称查找音频"""
+        record = self.get(ref)
+        if record is not None:
+            return record
+        with self._lock:
+            row = self._db().execute(
+                "SELECT a.audio_id, a.format, a.size, a.duration, a.created_at "
+                "FROM names n JOIN audio a ON a.audio_id = n.audio_id WHERE n.name = ?",
+                (ref,),
+            ).fetchone()
+        return AudioRecord(*row) if row else None
+
+    def path(self, record: AudioRecord) -> Path:
+        return self.store_dir / record.audio_id[:2] / record.filename
+
+    def _db(self) -> sqlite3.Connection:
+        """首次访问时打开索引（需持有锁）"""
+        if self._conn is None:
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.index_path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(self._SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _commit(self, tmp_path: Path, fmt: str, name: Optional[str]) -> AudioRecord:
+        """在线程中执行：补全 WAV 头部、计算内容哈希并移动到最终位置"""
+        try:
+            duration = _finalize_wav_file(tmp_path) if fmt == "wav" else None
+            audio_id = _hash_file(tmp_path)
+            size = tmp_path.stat().st_size
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        now = time.time()
+        final_path = self.store_dir / audio_id[:2] / f"{audio_id}.{fmt}"
+        with self._lock:
+            conn = self._db()
+            # 写事务在进程间互斥，文件的移动与删除和索引保持一致
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT audio_id, format, size, duration, created_at FROM audio WHERE audio_id = ?",
+                    (audio_id,),
+                ).fetchone()
+                if row is not None and final_path.exists():
+                    tmp_path.unlink(missing_ok=True)
+                    record = AudioRecord(*row)
+                    conn.execute("UPDATE audio SET saved_at = ? WHERE audio_id = ?", (now, audio_id))
+                else:
+                    final_path.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(tmp_path, final_path)
+                    record = AudioRecord(audio_id, fmt, size, duration, now)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO audio "
+                        "(audio_id, format, size, duration, created_at, saved_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (audio_id, fmt, size, duration, record.created_at, now),
+                    )
+
+                if name:
+                    conn.execute(
+                        "INSERT INTO names (name, audio_id) VALUES (?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET audio_id = excluded.audio_id",
+                        (name, audio_id),
+                    )
+
+                if now >= self._next_sweep:
+                    self._evict(conn, now, keep=audio_id)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                tmp_path.unlink(missing_ok=True)
+                raise
+
+        return record
+
+    def _evict(self, conn: sqlite3.Connection, now: float, keep: str) -> None:
+        """按保留策略删除音频及指向它们的名称（需在写事务中调用）"""
+        self._next_sweep = now + _SWEEP_INTERVAL
+        victims = []
+        if self.max_age > 0:
+            victims = conn.execute(
+                "SELECT audio_id, format, size FROM audio WHERE saved_at < ? AND audio_id != ?",
+                (now - self.max_age, keep),
+            ).fetchall()
+
+        if self.max_bytes > 0:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM audio").fetchone()[0]
+            excess = total - sum(size for _, _, size in victims) - self.max_bytes
+            if excess > 0:
+                chosen = {audio_id for audio_id, _, _ in victims}
+                rows = conn.execute(
+                    "SELECT audio_id, format, size FROM audio WHERE audio_id != ? ORDER BY saved_at",
+                    (keep,),
+                ).fetchall()
+                for audio_id, fmt, size in rows:
+                    if excess <= 0:
+                        break
+                    if audio_id not in chosen:
+                        victims.append((audio_id, fmt, size))
+                        excess -= size
+
+        for audio_id, fmt, _ in victims:
+            conn.execute("DELETE FROM names WHERE audio_id = ?", (audio_id,))
+            conn.execute("DELETE FROM audio WHERE audio_id = ?", (audio_id,))
+            (self.store_dir / audio_id[:2] / f"{audio_id}.{fmt}").unlink(missing_ok=True)
+        if victims:
+            logger.info(f"Evicted {len(victims)} saved audio files")
+
+
+def _finalize_wav_file(path: Path) -> Optional[float]:
+    """
+    将流式 WAV 文件头部的占位长度改写为实际长度
+
+    Returns:
+        Optional[float]: 音频时长（秒），不是 WAV 文件时返回 None
+    """
+    with open(path, "r+b") as f:
+        header = f.read(_HEADER_BYTES)
+        try:
+            fmt_chunk, data_offset, data_size = locate_wav_data(header)
+        except ValueError:
+            return None
+
+        file_size = os.fstat(f.fileno()).st_size
+        if data_size == STREAMING_SIZE or data_offset + data_size > file_size:
+            data_size = file_size - data_offset
+            f.seek(4)
+            f.write(struct.pack("<I", file_size - 8))
+            f.seek(data_offset - 4)
+            f.write(struct.pack("<I", data_size))
+
+    # fmt 块第 8-12 字节为每秒字节数
+    byte_rate = struct.unpack("<I", fmt_chunk[8:12])[0] if len(fmt_chunk) >= 12 else 0
+    return data_size / byte_rate if byte_rate else None
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# 单例实例
+audio_store = AudioStore(
+    store_dir=Path(settings.audio_store_dir) if settings.audio_store_dir else None,
+    max_age=settings.audio_store_max_age,
+    max_bytes=settings.audio_store_max_bytes,
+)
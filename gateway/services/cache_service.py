@@ -0,0 +1,227 @@
+"""语音合成结果缓存服务"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from gateway.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SynthesisCache:
+    """
+    内容寻址的合成结果缓存
+
+    两级结构：
+    - 内存层：按字节数限制容量的 LRU
+    - 磁盘层：按 key 存放的文件，内存淘汰后仍可命中
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        cache_dir: Optional[Path] = None,
+        memory_max_bytes: int = 128 * 1024 * 1024,
+        memory_ttl: float = 3600.0,
+        disk_enabled: bool = True,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+        disk_ttl: float = 7 * 24 * 3600.0,
+        max_entry_bytes: int = 16 * 1024 * 1024,
+    ):
+        if cache_dir is None:
+            cache_dir = Path(__file__).parent.parent / "data" / "tts_cache"
+        self.enabled = enabled
+        self.cache_dir = cache_dir
+        self.memory_max_bytes = memory_max_bytes
+        self.memory_ttl = memory_ttl
+        self.disk_enabled = disk_enabled
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_ttl = disk_ttl
+        self.max_entry_bytes = max_entry_bytes
+
+        # key -> (音频数据, 过期时间)
+        self._memory: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._memory_bytes = 0
+        # 磁盘层占用字节数，首次写入时扫描目录得到
+        self._disk_bytes: Optional[int] = None
+
+    @staticmethod
+    def make_key(backend_id: str, text: str, voice: str, kwargs: Dict) -> str:
+        """
+        计算缓存 key
+
+        对后端 ID、文本、音色与适配器参数做规范化 JSON 序列化后取 SHA-256
+
+        Args:
+            backend_id: 实际使用的后端 ID
+            text: 待合成文本
+            voice: 音色 ID
+            kwargs: _prepare_kwargs 生成的适配器参数
+
+        Returns:
+            str: 十六进制缓存 key
+        """
+        canonical = json.dumps(
+            {"backend": backend_id, "text": text, "voice": voice, "params": kwargs},
+            ensure_ascii=False,
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """读取缓存，内存未命中时查找磁盘并回填内存"""
+        data = self._memory_get(key)
+        if data is not None:
+            return data
+
+        if not self.disk_enabled:
+            return None
+
+        data = await asyncio.to_thread(self._disk_get, key)
+        if data is not None:
+            self._memory_set(key, data)
+        return data
+
+    async def set(self, key: str, data: bytes) -> None:
+        """写入缓存，超过单条上限的结果不缓存"""
+        if not data or len(data) > self.max_entry_bytes:
+            return
+
+        self._memory_set(key, data)
+
+        if self.disk_enabled:
+            try:
+                await asyncio.to_thread(self._disk_set, key, data)
+            except OSError as e:
+                logger.warning(f"Failed to write synthesis cache entry {key}: {e}")
+
+    @property
+    def memory_bytes(self) -> int:
+        """内存层占用字节数"""
+        return self._memory_bytes
+
+    def clear(self) -> None:
+        """清空内存层"""
+        self._memory.clear()
+        self._memory_bytes = 0
+
+    def _expires_at(self, ttl: float) -> float:
+        """ttl <= 0 表示永不过期"""
+        return time.monotonic() + ttl if ttl > 0 else float("inf")
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+
+        data, expires_at = entry
+        if expires_at < time.monotonic():
+            self._memory_pop(key)
+            return None
+
+        self._memory.move_to_end(key)
+        return data
+
+    def _memory_set(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_max_bytes:
+            return
+
+        self._memory_pop(key)
+        self._memory[key] = (data, self._expires_at(self.memory_ttl))
+        self._memory_bytes += len(data)
+
+        # 按 LRU 顺序淘汰直到容量达标
+        while self._memory_bytes > self.memory_max_bytes:
+            oldest_key = next(iter(self._memory))
+            self._memory_pop(oldest_key)
+
+    def _memory_pop(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[0])
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.bin"
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        path = self._disk_path(key)
+        try:
+            stat = path.stat()
+            if self.disk_ttl > 0 and time.time() - stat.st_mtime > self.disk_ttl:
+                path.unlink(missing_ok=True)
+                return None
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Failed to read synthesis cache entry {key}: {e}")
+            return None
+
+    def _disk_set(self, key: str, data: bytes) -> None:
+        if self._disk_bytes is None:
+            self._disk_bytes = self._scan_disk_bytes()
+
+        path = self._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            previous_size = path.stat().st_size
+        except FileNotFoundError:
+            previous_size = 0
+
+        # 先写临时文件再原子替换，避免读到半截文件
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        self._disk_bytes += len(data) - previous_size
+        if self._disk_bytes > self.disk_max_bytes:
+            self._prune_disk()
+
+    def _scan_disk_bytes(self) -> int:
+        if not self.cache_dir.exists():
+            return 0
+        return sum(p.stat().st_size for p in self.cache_dir.glob("*/*.bin"))
+
+    def _prune_disk(self) -> None:
+        """删除过期文件，并按修改时间从旧到新删除直到低于容量上限"""
+        entries = []
+        for path in self.cache_dir.glob("*/*.bin"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for mtime, size, path in entries:
+            expired = self.disk_ttl > 0 and now - mtime > self.disk_ttl
+            if not expired and total <= self.disk_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+        self._disk_bytes = total
+
+
+# 单例实例
+synthesis_cache = SynthesisCache(
+    enabled=settings.cache_enabled,
+    cache_dir=Path(settings.cache_dir) if settings.cache_dir else None,
+    memory_max_bytes=settings.cache_memory_max_bytes,
+    memory_ttl=settings.cache_memory_ttl,
+    disk_enabled=settings.cache_disk_enabled,
+    disk_max_bytes=settings.cache_disk_max_bytes,
+    disk_ttl=settings.cache_disk_ttl,
+    max_entry_bytes=settings.cache_max_entry_bytes,
+)
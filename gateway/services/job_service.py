@@ -0,0 +1,401 @@
+"""异步合成任务"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from gateway.adapters import BackendUnavailableError
+from gateway.config import settings
+from gateway.schemas.request import TTSRequest
+from gateway.services.admission_service import AdmissionRejectedError
+from gateway.services.quota_service import QuotaCharge, quota_service
+from gateway.services.tts_service import TTSService, tts_service
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+# 后端满载被拒绝时，任务最多重新排队的次数
+_MAX_ADMISSION_RETRIES = 5
+
+# 两次清理过期任务之间的最短间隔（秒）
+_PRUNE_INTERVAL = 60.0
+
+
+class JobQueueFullError(BackendUnavailableError):
+    """任务队列已满"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Job:
+    """一次异步合成任务"""
+
+    def __init__(self, request: TTSRequest, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.request = request
+        self.status = JOB_QUEUED
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.audio_id: Optional[str] = None
+        self.model_used: Optional[str] = None
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        # 执行该任务的进程（主机名:进程号）
+        self.worker: Optional[str] = None
+        # 提交时扣除的配额，任务失败时退还（只在提交任务的进程内有效，不写入存储）
+        self.charge: Optional[QuotaCharge] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+
+class JobStore:
+    """
+    任务状态存储
+
+    保存在 SQLite 文件（WAL 模式）中，多个 worker 进程共用：
+    任务由提交它的进程执行，任一进程都能查询其状态。
+    连接仅在专用的单线程执行器中使用，不阻塞事件循环
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            request TEXT NOT NULL,
+            worker TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            audio_id TEXT,
+            model_used TEXT,
+            duration REAL,
+            error TEXT,
+            finished_ts REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+        CREATE INDEX IF NOT EXISTS idx_jobs_finished_ts ON jobs(finished_ts);
+    """
+
+    _COLUMNS = (
+        "id, status, request, worker, created_at, started_at, finished_at, "
+        "audio_id, model_used, duration, error"
+    )
+
+    def __init__(self, db_file: Path):
+        self.db_file = db_file
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs-sqlite")
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        """在专用线程中执行数据库操作"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def put(self, job: Job) -> None:
+        """写入任务的当前状态"""
+        finished_ts = time.time() if job.finished else None
+        await self._run(
+            self._execute,
+            f"INSERT OR REPLACE INTO jobs ({self._COLUMNS}, finished_ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job.id, job.status, job.request.model_dump_json(), job.worker,
+                _isoformat(job.created_at), _isoformat(job.started_at), _isoformat(job.finished_at),
+                job.audio_id, job.model_used, job.duration, job.error, finished_ts,
+            ),
+        )
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        rows = await self._run(self._fetch, f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+        return self._from_row(rows[0]) if rows else None
+
+    async def unfinished(self) -> List[Job]:
+        """排队中与执行中的任务"""
+        rows = await self._run(
+            self._fetch,
+            f"SELECT {self._COLUMNS} FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+            (JOB_QUEUED, JOB_RUNNING),
+        )
+        return [self._from_row(row) for row in rows]
+
+    async def claim(self, job: Job, worker: str) -> bool:
+        """将任务转交给指定进程执行，任务已被其他进程接手时返回 False"""
+        cursor = await self._run(
+            self._execute,
+            "UPDATE jobs SET worker = ? WHERE id = ? AND worker IS ?",
+            (worker, job.id, job.worker),
+        )
+        if cursor.rowcount != 1:
+            return False
+        job.worker = worker
+        return True
+
+    async def counts(self) -> Dict[str, int]:
+        return dict(await self._run(self._fetch, "SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    async def prune(self, cutoff: float) -> None:
+        """删除完成时间早于 cutoff（Unix 时间戳）的任务"""
+        await self._run(self._execute, "DELETE FROM jobs WHERE finished_ts < ?", (cutoff,))
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        return self._db().execute(sql, params)
+
+    def _fetch(self, sql: str, params: tuple = ()) -> List[tuple]:
+        return self._db().execute(sql, params).fetchall()
+
+    def _db(self) -> sqlite3.Connection:
+        """首次访问时打开数据库（只在执行器线程中调用）"""
+        if self._conn is None:
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(self._SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _from_row(row: tuple) -> Job:
+        (job_id, status, request, worker, created_at, started_at, finished_at,
+         audio_id, model_used, duration, error) = row
+        # 请求在提交时已校验，保存名称随后被限定在密钥下（包含 /），读取时不再重复校验
+        job = Job(TTSRequest.model_construct(**json.loads(request)), job_id=job_id)
+        job.status = status
+        job.worker = worker
+        job.created_at = datetime.fromisoformat(created_at)
+        job.started_at = datetime.fromisoformat(started_at) if started_at else None
+        job.finished_at = datetime.fromisoformat(finished_at) if finished_at else None
+        job.audio_id = audio_id
+        job.model_used = model_used
+        job.duration = duration
+        job.error = error
+        return job
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _process_alive(worker: Optional[str]) -> bool:
+    """任务所属进程是否仍在运行；其他主机上的进程无法判断，视为仍在运行"""
+    if not worker:
+        return False
+    host, _, pid = worker.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+class JobService:
+    """
+    异步合成任务服务
+
+    提交后立即返回任务 ID，由固定数量的后台 worker 按提交顺序执行合成，
+    结果写入 TTSService 的音频存储；任务状态保存在多个进程共用的 JobStore 中，
+    查询请求落到任一 worker 进程都能得到结果，已完成的任务保留 retention 秒。
+    任务失败时退还提交时扣除的合成配额
+    """
+
+    def __init__(
+        self,
+        tts: Optional[TTSService] = None,
+        workers: int = 2,
+        max_queue: int = 100,
+        retention: float = 3600.0,
+        store: Optional[JobStore] = None,
+    ):
+        self.tts = tts or tts_service
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retention = retention
+        self.store = store or JobStore(_default_db_file())
+        # 当前进程的标识，记录在任务中用于判断执行者是否仍在运行
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._next_prune = 0.0
+        self._counts: Dict[str, int] = {}
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self) -> None:
+        """启动后台 worker"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker())
+            for _ in range(max(1, self.workers))
+        ]
+        await self._recover()
+
+    async def _recover(self) -> None:
+        """
+        重新排入本进程重启前未执行的任务，并接手本机已退出进程遗留的任务：
+        排队中的任务重新执行，执行到一半的任务标记为失败
+        """
+        for job in await self.store.unfinished():
+            if job.worker != self.worker_id and _process_alive(job.worker):
+                continue
+            if job.status == JOB_RUNNING:
+                if job.worker != self.worker_id and await self.store.claim(job, self.worker_id):
+                    await self._finish(job, JOB_FAILED, error="执行任务的进程已退出")
+                continue
+            if job.worker == self.worker_id or await self.store.claim(job, self.worker_id):
+                self._queue.put_nowait(job)
+
+    async def stop(self) -> None:
+        """停止后台 worker，执行中的任务标记为失败"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, request: TTSRequest, charge: Optional[QuotaCharge] = None) -> Job:
+        """
+        提交任务
+
+        Args:
+            request: TTS 请求
+            charge: 提交前扣除的配额，任务失败时退还
+
+        Raises:
+            JobQueueFullError: 排队中的任务数已达上限
+            RuntimeError: worker 未启动
+        """
+        if self._queue is None or not self.running:
+            raise RuntimeError("任务服务未启动")
+        if self._queue.qsize() >= self.max_queue:
+            raise JobQueueFullError("任务队列已满，请稍后重试", retry_after=self._retry_after())
+
+        await self._prune()
+        job = Job(request)
+        job.worker = self.worker_id
+        job.charge = charge
+        await self.store.put(job)
+        self._queue.put_nowait(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        await self._prune()
+        return await self.store.get(job_id)
+
+    async def refresh_stats(self) -> None:
+        """从存储读取各状态的任务数，供 stats() 返回"""
+        self._counts = await self.store.counts()
+
+    def stats(self) -> dict:
+        """各状态的任务数（所有进程合计，取最近一次 refresh_stats 的结果）"""
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_SUCCEEDED: 0, JOB_FAILED: 0}
+        counts.update(self._counts)
+        return counts
+
+    def _retry_after(self) -> int:
+        return max(1, self._queue.qsize() // max(1, self.workers))
+
+    async def _prune(self) -> None:
+        """删除超过保留时间的已完成任务"""
+        now = time.time()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + _PRUNE_INTERVAL
+        await self.store.prune(now - self.retention)
+
+    async def _finish(self, job: Job, status: str, error: Optional[str] = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.now(timezone.utc)
+        if status == JOB_FAILED and job.charge is not None:
+            await quota_service.refund(job.charge)
+        await self.store.put(job)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job.status = JOB_RUNNING
+        job.started_at = datetime.now(timezone.utc)
+        await self.store.put(job)
+        try:
+            metadata = await self._synthesize(job.request)
+            record = self.tts.store.get(metadata.get("audio_id", ""))
+            if record is None:
+                raise RuntimeError("音频保存失败")
+            job.audio_id = record.audio_id
+            job.model_used = metadata.get("model_used")
+            job.duration = record.duration
+            await self._finish(job, JOB_SUCCEEDED)
+        except asyncio.CancelledError:
+            await self._finish(job, JOB_FAILED, error="服务关闭，任务已取消")
+            raise
+        except Exception as e:
+            logger.warning(f"Job {job.id} failed: {e}")
+            await self._finish(job, JOB_FAILED, error=str(e))
+
+    async def _synthesize(self, request: TTSRequest) -> dict:
+        """
+        合成音频并直接写入音频存储，不在内存中拼接完整音频
+
+        后端满载时按建议时间等待后重试，而不是直接失败
+        """
+        request = request.model_copy(update={"save_audio": True})
+        for attempt in range(_MAX_ADMISSION_RETRIES + 1):
+            try:
+                audio_stream, metadata = await self.tts.stream_speech(request)
+                async for _ in audio_stream:
+                    pass
+                return metadata
+            except AdmissionRejectedError as e:
+                if attempt == _MAX_ADMISSION_RETRIES:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+
+def _default_db_file() -> Path:
+    if settings.jobs_db_path:
+        return Path(settings.jobs_db_path)
+    return Path(__file__).parent.parent / "data" / "jobs.db"
+
+
+# 单例实例
+job_service = JobService(
+    workers=settings.jobs_workers,
+    max_queue=settings.jobs_max_queue,
+    retention=settings.jobs_retention,
+)
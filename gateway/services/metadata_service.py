@@ -1,44 +1,69 @@
 """音色元数据管理服务"""
 
-import json
+import hmac
 import logging
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
-from gateway.utils.crypto import hash_key, verify_key
+from gateway.config import settings
+from gateway.services.metadata_store import MetadataStore, create_metadata_store
+from gateway.utils.crypto import (
+    hash_key_async,
+    key_lookup_tag,
+    load_or_create_secret,
+    verify_key_async,
+)
 
 logger = logging.getLogger(__name__)
 
 
 class MetadataService:
-    """音色元数据管理服务（基于文件存储）"""
+    """
+    音色元数据管理服务
 
-    def __init__(self, data_path: Optional[Path] = None):
+    存储后端由配置 metadata.backend 选择：file（单个 JSON 文件）或 sqlite
+
+    私人音色额外保存密钥的 HMAC 查找标签（key_tag），按密钥查询时
+    直接按标签定位，无需对每个私人音色做 PBKDF2 校验
+    """
+
+    def __init__(
+        self,
+        data_path: Optional[Path] = None,
+        store: Optional[MetadataStore] = None,
+        key_lookup_secret: Optional[bytes] = None,
+    ):
         if data_path is None:
             data_path = Path(__file__).parent.parent / "data"
         self.data_path = data_path
-        self.metadata_file = self.data_path / "voice_metadata.json"
         self._ensure_data_dir()
+        self.store = store or create_metadata_store(self.data_path)
+        self._lookup_secret = key_lookup_secret or self._load_lookup_secret()
+        # 旧私人音色全部补写标签后不再查询（新保存的私人音色总是带标签）
+        self._untagged_backfilled = False
 
     def _ensure_data_dir(self):
         """确保数据目录存在"""
         self.data_path.mkdir(parents=True, exist_ok=True)
-        if not self.metadata_file.exists():
-            self._save_metadata({"version": "1.0", "voices": {}})
-
-    def _load_metadata(self) -> dict:
-        """加载元数据"""
-        try:
-            with open(self.metadata_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {"version": "1.0", "voices": {}}
-
-    def _save_metadata(self, metadata: dict):
-        """保存元数据"""
-        with open(self.metadata_file, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+    def _load_lookup_secret(self) -> bytes:
+        """读取查找标签密钥：优先使用配置，否则使用数据目录中持久化的密钥"""
+        if settings.metadata_key_lookup_secret:
+            return bytes.fromhex(settings.metadata_key_lookup_secret)
+        return load_or_create_secret(self.data_path / ".key_lookup_secret")
+
+    def key_tag(self, private_key: str) -> str:
+        """密钥的查找标签，不可逆，可用于按密钥隔离数据"""
+        return key_lookup_tag(private_key, self._lookup_secret)
+
+    async def flush(self):
+        """确保所有修改已落盘（关闭服务时调用）"""
+        await self.store.flush()
+
+    async def list_voices_by_backend(self, backend: str) -> list[dict]:
+        """获取指定后端的音色元数据"""
+        return await self.store.list_by_backend(backend)
 
     async def save_voice_metadata(
         self,
@@ -61,8 +86,6 @@ class MetadataService:
         Returns:
             dict: 保存的元数据
         """
-        metadata = self._load_metadata()
-
         voice_meta = {
             "id": voice_id,
             "backend": backend,
@@ -73,29 +96,23 @@ class MetadataService:
 
         # 如果是私人音色，哈希密钥
         if visibility == "private" and private_key:
-            salt, key_hash = hash_key(private_key)
+            salt, key_hash = await hash_key_async(private_key)
             voice_meta["key_salt"] = salt
             voice_meta["key_hash"] = key_hash
+            voice_meta["key_tag"] = self.key_tag(private_key)
 
-        metadata["voices"][voice_id] = voice_meta
-        self._save_metadata(metadata)
+        await self.store.put(voice_meta)
 
         logger.info(f"Saved voice metadata: {voice_id}, visibility: {visibility}")
         return voice_meta
 
     async def get_voice_metadata(self, voice_id: str) -> Optional[dict]:
         """获取音色元数据"""
-        metadata = self._load_metadata()
-        return metadata["voices"].get(voice_id)
+        return await self.store.get(voice_id)
 
     async def list_public_voices(self) -> list[dict]:
         """获取所有公共音色元数据"""
-        metadata = self._load_metadata()
-        return [
-            voice
-            for voice in metadata["voices"].values()
-            if voice.get("visibility") == "public"
-        ]
+        return await self.store.list_by_visibility("public")
 
     async def list_private_voices_by_key(self, private_key: str) -> list[dict]:
         """
@@ -107,20 +124,48 @@ class MetadataService:
         Returns:
             list[dict]: 可访问的私人音色列表
         """
-        metadata = self._load_metadata()
-        accessible_voices = []
-
-        for voice in metadata["voices"].values():
-            if voice.get("visibility") != "private":
-                continue
+        # 标签相同即密钥相同，只需对其中一个音色做一次 PBKDF2 校验
+        tagged = [
+            voice
+            for voice in await self.store.list_by_key_tag(self.key_tag(private_key))
+            if voice.get("visibility") == "private"
+        ]
+        if tagged and not await self._check_key(tagged[0], private_key):
+            tagged = []
 
-            salt = voice.get("key_salt")
-            stored_hash = voice.get("key_hash")
+        return tagged + await self._match_untagged_voices(private_key)
 
-            if salt and stored_hash and verify_key(private_key, salt, stored_hash):
-                accessible_voices.append(voice)
+    async def _match_untagged_voices(self, private_key: str) -> list[dict]:
+        """
+        兼容没有查找标签的旧私人音色
 
-        return accessible_voices
+        逐个校验，匹配成功的补写标签，之后的查询即可走标签索引；
+        存储中已没有未打标签的私人音色后直接跳过
+        """
+        if self._untagged_backfilled:
+            return []
+
+        untagged = await self.store.list_untagged_private()
+        if not untagged:
+            self._untagged_backfilled = True
+            return []
+
+        matched = []
+        for voice in untagged:
+            if await self._check_key(voice, private_key):
+                voice = {**voice, "key_tag": self.key_tag(private_key)}
+                await self.store.put(voice)
+                logger.info(f"Backfilled key tag for voice: {voice['id']}")
+                matched.append(voice)
+        return matched
+
+    @staticmethod
+    async def _check_key(voice_meta: dict, private_key: str) -> bool:
+        salt = voice_meta.get("key_salt")
+        stored_hash = voice_meta.get("key_hash")
+        if not salt or not stored_hash:
+            return False
+        return await verify_key_async(private_key, salt, stored_hash)
 
     async def verify_voice_access(
         self, voice_id: str, private_key: Optional[str] = None
@@ -146,11 +191,12 @@ class MetadataService:
             if not private_key:
                 return False
 
-            salt = voice_meta.get("key_salt")
-            stored_hash = voice_meta.get("key_hash")
+            # 标签不一致说明密钥错误，无需再做 PBKDF2
+            key_tag = voice_meta.get("key_tag")
+            if key_tag and not hmac.compare_digest(key_tag, self.key_tag(private_key)):
+                return False
 
-            if salt and stored_hash:
-                return verify_key(private_key, salt, stored_hash)
+            return await self._check_key(voice_meta, private_key)
 
         return False
 
@@ -176,15 +222,11 @@ class MetadataService:
 
     async def delete_metadata(self, voice_id: str) -> bool:
         """删除音色元数据"""
-        metadata = self._load_metadata()
+        if not await self.store.delete(voice_id):
+            return False
 
-        if voice_id in metadata["voices"]:
-            del metadata["voices"][voice_id]
-            self._save_metadata(metadata)
-            logger.info(f"Deleted voice metadata: {voice_id}")
-            return True
-
-        return False
+        logger.info(f"Deleted voice metadata: {voice_id}")
+        return True
 
     async def get_all_voice_ids_with_visibility(self) -> dict[str, str]:
         """
@@ -193,11 +235,7 @@ class MetadataService:
         Returns:
             dict[str, str]: {voice_id: visibility}
         """
-        metadata = self._load_metadata()
-        return {
-            voice_id: voice.get("visibility", "public")
-            for voice_id, voice in metadata["voices"].items()
-        }
+        return await self.store.visibility_map()
 
 
 # 单例实例
@@ -0,0 +1,448 @@
+"""音色元数据存储后端"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+from gateway.config import settings
+from gateway.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+METADATA_IO = registry.histogram(
+    "tts_metadata_io_seconds",
+    "音色元数据存储的读写耗时",
+    ("store", "operation"),
+)
+
+
+class MetadataStore(ABC):
+    """音色元数据存储抽象基类"""
+
+    @abstractmethod
+    async def get(self, voice_id: str) -> Optional[dict]:
+        """按 ID 获取音色元数据"""
+        pass
+
+    @abstractmethod
+    async def put(self, voice: dict) -> None:
+        """新增或覆盖音色元数据"""
+        pass
+
+    @abstractmethod
+    async def delete(self, voice_id: str) -> bool:
+        """删除音色元数据，返回是否存在"""
+        pass
+
+    @abstractmethod
+    async def list_by_visibility(self, visibility: str) -> List[dict]:
+        """按可见性列出音色元数据"""
+        pass
+
+    @abstractmethod
+    async def list_by_backend(self, backend: str) -> List[dict]:
+        """按后端列出音色元数据"""
+        pass
+
+    @abstractmethod
+    async def list_by_key_tag(self, key_tag: str) -> List[dict]:
+        """按密钥查找标签列出音色元数据"""
+        pass
+
+    @abstractmethod
+    async def list_untagged_private(self) -> List[dict]:
+        """列出设置了密钥但还没有查找标签的旧私人音色"""
+        pass
+
+    @abstractmethod
+    async def visibility_map(self) -> Dict[str, str]:
+        """获取 {voice_id: visibility}"""
+        pass
+
+    async def flush(self) -> None:
+        """确保所有修改已落盘（关闭服务时调用）"""
+        pass
+
+
+class JsonFileMetadataStore(MetadataStore):
+    """
+    基于单个 JSON 文件的存储
+
+    元数据在内存中按音色 ID、后端、可见性建立索引，读取时仅通过文件的
+    inode/mtime/size 判断是否需要重新加载（多 worker 部署时由其他进程写入）。
+
+    写入先更新内存索引，短时间窗口内的多次修改合并为一次落盘：
+    在线程中写临时文件后 os.replace 原子替换，调用方等待落盘完成后返回
+    """
+
+    def __init__(self, metadata_file: Path, flush_delay: Optional[float] = None):
+        self.metadata_file = metadata_file
+
+        # 内存索引
+        self._version = "1.0"
+        self._voices: Dict[str, dict] = {}
+        self._by_backend: Dict[str, Set[str]] = defaultdict(set)
+        self._by_visibility: Dict[str, Set[str]] = defaultdict(set)
+        self._by_key_tag: Dict[Optional[str], Set[str]] = defaultdict(set)
+        self._untagged_private: Set[str] = set()
+        self._file_signature: Optional[Tuple[int, int, int]] = None
+
+        # 串行化写入
+        self._write_lock = asyncio.Lock()
+        self.flush_delay = settings.metadata_flush_delay if flush_delay is None else flush_delay
+        # 尚未落盘的修改：("put", voice_id, voice) 或 ("delete", voice_id, None)
+        self._pending_ops: List[Tuple[str, str, Optional[dict]]] = []
+        self._pending_flush: Optional[asyncio.Future] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        if not self.metadata_file.exists():
+            self._save_metadata({"version": "1.0", "voices": {}})
+        self._reload()
+
+    def _load_metadata(self) -> dict:
+        """加载元数据"""
+        try:
+            with METADATA_IO.labels("file", "read").time():
+                with open(self.metadata_file, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"version": "1.0", "voices": {}}
+
+    def _save_metadata(self, metadata: dict):
+        """
+        保存元数据
+
+        紧凑编码写入临时文件后原子替换，并发读取方不会看到写了一半的文件
+        """
+        tmp_file = self.metadata_file.with_name(
+            f".{self.metadata_file.name}.{os.getpid()}.tmp"
+        )
+        with METADATA_IO.labels("file", "write").time():
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(metadata, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.metadata_file)
+
+    def _stat_signature(self) -> Optional[Tuple[int, int, int]]:
+        """元数据文件的 (inode, mtime_ns, size)，文件不存在时返回 None"""
+        try:
+            stat = os.stat(self.metadata_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _reload(self):
+        """从文件重建内存索引"""
+        signature = self._stat_signature()
+        metadata = self._load_metadata()
+
+        self._version = metadata.get("version", "1.0")
+        self._voices = {}
+        self._by_backend = defaultdict(set)
+        self._by_visibility = defaultdict(set)
+        self._by_key_tag = defaultdict(set)
+        self._untagged_private = set()
+        for voice in metadata.get("voices", {}).values():
+            self._index_voice(voice)
+
+        self._file_signature = signature
+
+    def _refresh(self):
+        """
+        文件被外部修改时重新加载
+
+        有未落盘的修改时跳过，由落盘时合并外部修改
+        """
+        if self._pending_ops:
+            return
+        if self._stat_signature() != self._file_signature:
+            self._reload()
+
+    def _index_voice(self, voice: dict):
+        """将音色加入索引（同 ID 的旧记录会先移除）"""
+        self._unindex_voice(voice["id"])
+        self._voices[voice["id"]] = voice
+        self._by_backend[voice.get("backend")].add(voice["id"])
+        self._by_visibility[voice.get("visibility", "public")].add(voice["id"])
+        self._by_key_tag[voice.get("key_tag")].add(voice["id"])
+        if _is_untagged_private(voice):
+            self._untagged_private.add(voice["id"])
+
+    def _unindex_voice(self, voice_id: str) -> Optional[dict]:
+        """将音色移出索引，返回被移除的记录"""
+        voice = self._voices.pop(voice_id, None)
+        if voice is not None:
+            self._by_backend[voice.get("backend")].discard(voice_id)
+            self._by_visibility[voice.get("visibility", "public")].discard(voice_id)
+            self._by_key_tag[voice.get("key_tag")].discard(voice_id)
+            self._untagged_private.discard(voice_id)
+        return voice
+
+    def _schedule_flush(self, op: Tuple[str, str, Optional[dict]]) -> asyncio.Future:
+        """
+        登记一次修改并返回对应的落盘 Future
+
+        窗口期内的所有修改共享同一次落盘（需在持有写锁时调用）
+        """
+        self._pending_ops.append(op)
+        if self._pending_flush is None:
+            self._pending_flush = asyncio.get_running_loop().create_future()
+            self._flush_task = asyncio.create_task(self._flush_later(self._pending_flush))
+        return self._pending_flush
+
+    async def _flush_later(self, future: asyncio.Future):
+        """等待合并窗口结束后落盘"""
+        await asyncio.sleep(self.flush_delay)
+
+        async with self._write_lock:
+            ops, self._pending_ops = self._pending_ops, []
+            self._pending_flush = None
+
+            try:
+                # 其他进程在窗口期内写过文件：重新加载并重放本进程的修改
+                if self._stat_signature() != self._file_signature:
+                    self._reload()
+                    for action, voice_id, voice in ops:
+                        if action == "put":
+                            self._index_voice(voice)
+                        else:
+                            self._unindex_voice(voice_id)
+
+                snapshot = {"version": self._version, "voices": dict(self._voices)}
+                await asyncio.to_thread(self._save_metadata, snapshot)
+                self._file_signature = self._stat_signature()
+            except Exception as e:
+                logger.error(f"Failed to persist voice metadata: {e}")
+                future.set_exception(e)
+                return
+
+        future.set_result(None)
+
+    async def get(self, voice_id: str) -> Optional[dict]:
+        self._refresh()
+        return self._voices.get(voice_id)
+
+    async def put(self, voice: dict) -> None:
+        async with self._write_lock:
+            self._refresh()
+            self._index_voice(voice)
+            flushed = self._schedule_flush(("put", voice["id"], voice))
+        await asyncio.shield(flushed)
+
+    async def delete(self, voice_id: str) -> bool:
+        async with self._write_lock:
+            self._refresh()
+            if self._unindex_voice(voice_id) is None:
+                return False
+            flushed = self._schedule_flush(("delete", voice_id, None))
+        await asyncio.shield(flushed)
+        return True
+
+    async def list_by_visibility(self, visibility: str) -> List[dict]:
+        self._refresh()
+        return [self._voices[voice_id] for voice_id in self._by_visibility.get(visibility, ())]
+
+    async def list_by_backend(self, backend: str) -> List[dict]:
+        self._refresh()
+        return [self._voices[voice_id] for voice_id in self._by_backend.get(backend, ())]
+
+    async def list_by_key_tag(self, key_tag: str) -> List[dict]:
+        self._refresh()
+        return [self._voices[voice_id] for voice_id in self._by_key_tag.get(key_tag, ())]
+
+    async def list_untagged_private(self) -> List[dict]:
+        self._refresh()
+        return [self._voices[voice_id] for voice_id in self._untagged_private]
+
+    async def visibility_map(self) -> Dict[str, str]:
+        self._refresh()
+        return {
+            voice_id: visibility
+            for visibility, voice_ids in self._by_visibility.items()
+            for voice_id in voice_ids
+        }
+
+    async def flush(self) -> None:
+        """等待所有未落盘的修改写入文件"""
+        if self._pending_flush is not None:
+            await asyncio.shield(self._pending_flush)
+
+
+class SQLiteMetadataStore(MetadataStore):
+    """
+    基于 SQLite 的存储（适用于大规模音色库）
+
+    使用 WAL 模式，在 visibility、backend 与密钥查找列上建立索引。
+    连接仅在专用的单线程执行器中使用，不阻塞事件循环。
+    首次打开时会从旧的 voice_metadata.json 一次性迁移数据
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS voices (
+            id TEXT PRIMARY KEY,
+            backend TEXT,
+            visibility TEXT NOT NULL DEFAULT 'public',
+            key_tag TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_voices_visibility ON voices(visibility);
+        CREATE INDEX IF NOT EXISTS idx_voices_backend ON voices(backend);
+        CREATE INDEX IF NOT EXISTS idx_voices_key_tag ON voices(key_tag);
+        CREATE INDEX IF NOT EXISTS idx_voices_untagged_private ON voices(id)
+            WHERE visibility = 'private' AND key_tag IS NULL;
+        CREATE TABLE IF NOT EXISTS store_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, db_file: Path, legacy_json_file: Optional[Path] = None):
+        self.db_file = db_file
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metadata-sqlite")
+        self._conn: sqlite3.Connection = self._executor.submit(self._connect).result()
+        if legacy_json_file is not None:
+            self._executor.submit(self._migrate_from_json, legacy_json_file).result()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.executescript(self._SCHEMA)
+        return conn
+
+    def _migrate_from_json(self, json_file: Path) -> None:
+        """从 voice_metadata.json 一次性导入（已迁移过则跳过）"""
+        migrated = self._conn.execute(
+            "SELECT value FROM store_meta WHERE key = 'migrated_from_json'"
+        ).fetchone()
+        if migrated or not json_file.exists():
+            return
+
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                voices = json.load(f).get("voices", {})
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to migrate {json_file}: {e}")
+            return
+
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO voices (id, backend, visibility, key_tag, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [self._row(voice) for voice in voices.values()],
+            )
+            self._conn.execute(
+                "INSERT INTO store_meta (key, value) VALUES ('migrated_from_json', ?)",
+                (str(json_file),),
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+        logger.info(f"Migrated {len(voices)} voices from {json_file} to {self.db_file}")
+
+    @staticmethod
+    def _row(voice: dict) -> tuple:
+        return (
+            voice["id"],
+            voice.get("backend"),
+            voice.get("visibility", "public"),
+            voice.get("key_tag"),
+            json.dumps(voice, ensure_ascii=False, separators=(",", ":")),
+        )
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        """在专用线程中执行数据库操作"""
+        loop = asyncio.get_running_loop()
+        with METADATA_IO.labels("sqlite", "query").time():
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    def _query(self, sql: str, params: tuple = ()) -> List[dict]:
+        rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    async def get(self, voice_id: str) -> Optional[dict]:
+        rows = await self._run(self._query, "SELECT data FROM voices WHERE id = ?", (voice_id,))
+        return rows[0] if rows else None
+
+    async def put(self, voice: dict) -> None:
+        await self._run(
+            self._conn.execute,
+            "INSERT OR REPLACE INTO voices (id, backend, visibility, key_tag, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            self._row(voice),
+        )
+
+    async def delete(self, voice_id: str) -> bool:
+        cursor = await self._run(self._conn.execute, "DELETE FROM voices WHERE id = ?", (voice_id,))
+        return cursor.rowcount > 0
+
+    async def list_by_visibility(self, visibility: str) -> List[dict]:
+        return await self._run(
+            self._query, "SELECT data FROM voices WHERE visibility = ?", (visibility,)
+        )
+
+    async def list_by_backend(self, backend: str) -> List[dict]:
+        return await self._run(
+            self._query, "SELECT data FROM voices WHERE backend = ?", (backend,)
+        )
+
+    async def list_by_key_tag(self, key_tag: str) -> List[dict]:
+        return await self._run(
+            self._query, "SELECT data FROM voices WHERE key_tag = ?", (key_tag,)
+        )
+
+    async def list_untagged_private(self) -> List[dict]:
+        return await self._run(
+            self._query,
+            # 明确使用部分索引，只扫描未打标签的私人音色
+            "SELECT data FROM voices INDEXED BY idx_voices_untagged_private "
+            "WHERE visibility = 'private' AND key_tag IS NULL "
+            "AND json_extract(data, '$.key_hash') IS NOT NULL",
+        )
+
+    async def visibility_map(self) -> Dict[str, str]:
+        def _fetch() -> Dict[str, str]:
+            return dict(self._conn.execute("SELECT id, visibility FROM voices").fetchall())
+        return await self._run(_fetch)
+
+    async def flush(self) -> None:
+        """将 WAL 内容合并回主库文件"""
+        await self._run(self._conn.execute, "PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def _is_untagged_private(voice: dict) -> bool:
+    """设置了密钥但还没有查找标签的旧私人音色"""
+    return (
+        voice.get("visibility") == "private"
+        and not voice.get("key_tag")
+        and bool(voice.get("key_hash"))
+    )
+
+
+def create_metadata_store(data_path: Path) -> MetadataStore:
+    """根据配置创建元数据存储"""
+    json_file = data_path / "voice_metadata.json"
+
+    if settings.metadata_backend == "sqlite":
+        db_file = Path(settings.metadata_sqlite_path) if settings.metadata_sqlite_path \
+            else data_path / "voice_metadata.db"
+        return SQLiteMetadataStore(db_file, legacy_json_file=json_file)
+
+    if settings.metadata_backend != "file":
+        raise ValueError(f"未知的元数据存储类型: {settings.metadata_backend}")
+
+    return JsonFileMetadataStore(json_file)
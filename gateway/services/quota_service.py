@@ -0,0 +1,229 @@
+"""按合成字数计费的配额"""
+
+import hashlib
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from starlette.requests import HTTPConnection
+
+from gateway.adapters import AdapterFactory
+from gateway.config import settings
+from gateway.schemas.request import TTSRequest
+from gateway.services.rate_limit_store import BucketStore, create_bucket_store
+from gateway.utils.metrics import registry
+from gateway.utils.network import get_client_ip, parse_networks
+
+QUOTA_REJECTIONS = registry.counter(
+    "tts_quota_rejections_total",
+    "超出合成配额被拒绝的请求数",
+    ("scope", "window"),
+)
+QUOTA_CHARGED = registry.counter(
+    "tts_quota_charged_units_total",
+    "扣除的合成配额（字数乘以后端成本系数）",
+    ("scope",),
+)
+
+# 配额窗口对应的秒数，令牌桶在一个窗口内回填满额度
+_WINDOW_SECONDS = {"minute": 60.0, "day": 86400.0}
+
+_SCOPE_NAMES = {"ip": "客户端 IP ", "key": "密钥 "}
+_WINDOW_NAMES = {"minute": "分钟", "day": "天"}
+
+
+class QuotaExceededError(Exception):
+    """超出合成配额"""
+
+    def __init__(self, message: str, retry_after: int, headers: Dict[str, str]):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.headers = headers
+
+
+class QuotaCharge:
+    """一次请求已扣除的配额，请求在合成开始前失败或批量条目失败时用于退还"""
+
+    def __init__(self, cost: float, entries: List[Tuple[BucketStore, str]], remaining: Dict[str, float]):
+        self.cost = cost
+        self.entries = entries
+        self.remaining = remaining
+
+    def headers(self) -> Dict[str, str]:
+        """配额响应头：本次消耗与各窗口的剩余额度（取各维度中最小的），未启用配额时为空"""
+        if not self.remaining:
+            return {}
+        headers = {"X-Quota-Cost": _format_units(self.cost)}
+        for window, remaining in self.remaining.items():
+            headers[f"X-Quota-Remaining-{window.capitalize()}"] = str(max(0, math.floor(remaining)))
+        return headers
+
+
+class QuotaService:
+    """
+    合成配额服务
+
+    请求体解析后按输入字数乘以后端成本系数扣除配额，而不是按请求数计数，
+    使限额与 GPU 负载大致成正比。配额按维度与窗口分别维护令牌桶：
+    - 按客户端 IP：所有请求都会扣除
+    - 按 X-Private-Key：携带密钥时额外扣除，限制同一个密钥在多个 IP 上的总用量
+
+    密钥由客户端自行声明，无法作为身份凭证，因此不会替代按 IP 的配额。
+    令牌桶与限流中间件使用同一种存储（memory / sqlite / redis），多个 worker 可共享配额
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        limits: Dict[Tuple[str, str], int],
+        backend_costs: Optional[Dict[str, float]] = None,
+        trusted_proxies: Sequence[str] = (),
+        max_clients: int = 100000,
+    ):
+        """
+        Args:
+            enabled: 是否启用
+            limits: {(维度, 窗口): 每个窗口的额度}，维度为 ip / key，窗口为 minute / day；
+                额度为 0 表示不限制
+            backend_costs: 后端成本系数，未配置的后端为 1.0
+            trusted_proxies: 受信任代理，用于确定客户端 IP
+            max_clients: 每个令牌桶存储最多跟踪的客户端数
+        """
+        self.enabled = enabled
+        self.limits = {scope: limit for scope, limit in limits.items() if limit > 0}
+        self.backend_costs = backend_costs or {}
+        self.trusted_proxies = parse_networks(trusted_proxies)
+        self.max_clients = max_clients
+        self._stores: Dict[Tuple[str, str], BucketStore] = {}
+
+    def cost(self, request: TTSRequest) -> float:
+        """
+        单条请求的配额消耗
+
+        auto 模式在合成前无法确定后端，按已注册后端中最高的成本系数计算
+        """
+        if request.model == "auto":
+            factors = [self.backend_costs.get(b, 1.0) for b in AdapterFactory.list_backend_ids()]
+            factor = max(factors, default=1.0)
+        else:
+            factor = self.backend_costs.get(request.model, 1.0)
+        return max(1, len(request.input)) * factor
+
+    async def charge(self, connection: HTTPConnection, requests: Sequence[TTSRequest]) -> QuotaCharge:
+        """
+        扣除一次 HTTP 请求中全部合成条目的配额
+
+        任一维度或窗口额度不足时退还已扣除的部分并拒绝整个请求
+
+        Raises:
+            QuotaExceededError: 超出配额
+        """
+        if not self.enabled or not self.limits:
+            return QuotaCharge(0, [], {})
+
+        cost = sum(self.cost(request) for request in requests)
+        remaining: Dict[str, float] = {}
+        charged: List[Tuple[BucketStore, str]] = []
+        scopes = set()
+
+        for (scope, window), limit in self.limits.items():
+            client = self._client_key(connection, scope)
+            if client is None:
+                continue
+            store = self._store(scope, window)
+            key = f"quota:{scope}:{window}:{client}"
+
+            if cost > limit:
+                # 单次请求超过整个窗口的额度，等待也无法满足
+                await self._refund(charged, cost)
+                QUOTA_REJECTIONS.labels(scope, window).inc()
+                raise QuotaExceededError(
+                    f"单次请求消耗 {_format_units(cost)} 超过{_SCOPE_NAMES[scope]}每{_WINDOW_NAMES[window]}"
+                    f"配额 {limit}，请拆分文本",
+                    retry_after=0,
+                    headers={"X-Quota-Cost": _format_units(cost)},
+                )
+
+            allowed, left = await store.acquire(key, cost)
+            if not allowed:
+                await self._refund(charged, cost)
+                QUOTA_REJECTIONS.labels(scope, window).inc()
+                retry_after = max(1, math.ceil(store.retry_after(left, cost)))
+                raise QuotaExceededError(
+                    f"超出{_SCOPE_NAMES[scope]}每{_WINDOW_NAMES[window]}合成配额 {limit}，"
+                    f"请 {retry_after} 秒后重试",
+                    retry_after=retry_after,
+                    headers={
+                        "X-Quota-Cost": _format_units(cost),
+                        f"X-Quota-Remaining-{window.capitalize()}": str(max(0, math.floor(left))),
+                        "Retry-After": str(retry_after),
+                    },
+                )
+
+            charged.append((store, key))
+            scopes.add(scope)
+            remaining[window] = min(remaining.get(window, left), left)
+
+        for scope in scopes:
+            QUOTA_CHARGED.labels(scope).inc(cost)
+        return QuotaCharge(cost, charged, remaining)
+
+    async def refund(self, charge: QuotaCharge, cost: Optional[float] = None) -> None:
+        """
+        退还配额
+
+        Args:
+            charge: 扣除记录
+            cost: 退还的额度，默认退还全部剩余额度（请求在开始合成前失败时）；
+                批量请求中单条失败时只退还该条的消耗
+        """
+        amount = charge.cost if cost is None else min(cost, charge.cost)
+        if amount <= 0 or not charge.entries:
+            return
+        await self._refund(charge.entries, amount)
+        charge.cost -= amount
+        if charge.cost <= 0:
+            charge.entries = []
+
+    @staticmethod
+    async def _refund(entries: List[Tuple[BucketStore, str]], cost: float) -> None:
+        for store, key in entries:
+            await store.refund(key, cost)
+
+    def _client_key(self, connection: HTTPConnection, scope: str) -> Optional[str]:
+        if scope == "ip":
+            return get_client_ip(connection, self.trusted_proxies)
+        private_key = connection.headers.get("X-Private-Key")
+        if not private_key:
+            return None
+        # 存储中只保留密钥的哈希
+        return hashlib.sha256(private_key.encode("utf-8")).hexdigest()[:32]
+
+    def _store(self, scope: str, window: str) -> BucketStore:
+        store = self._stores.get((scope, window))
+        if store is None:
+            limit = self.limits[(scope, window)]
+            # 与限流及其他窗口分开存放，避免按各自回填时间清理时删除对方的桶
+            store = create_bucket_store(
+                limit, limit / _WINDOW_SECONDS[window], self.max_clients, name=f"quota_{scope}_{window}"
+            )
+            self._stores[(scope, window)] = store
+        return store
+
+
+def _format_units(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:.2f}"
+
+
+# 单例实例
+quota_service = QuotaService(
+    enabled=settings.quota_enabled,
+    limits={
+        ("ip", "minute"): settings.quota_ip_chars_per_minute,
+        ("ip", "day"): settings.quota_ip_chars_per_day,
+        ("key", "minute"): settings.quota_key_chars_per_minute,
+        ("key", "day"): settings.quota_key_chars_per_day,
+    },
+    backend_costs=settings.quota_backend_costs,
+    trusted_proxies=settings.trusted_proxies,
+    max_clients=settings.rate_limit_max_clients,
+)
@@ -0,0 +1,323 @@
+"""限流令牌桶存储"""
+
+import asyncio
+import math
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+from gateway.config import settings
+
+# 分片数量：定期清理每次只扫描一个分片，避免一次遍历全部客户端造成停顿
+_SHARDS = 16
+
+# 两次清理之间的间隔（秒）
+_SWEEP_INTERVAL = 1.0
+
+
+class _Bucket:
+    """单个客户端的令牌桶状态"""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class BucketStore(ABC):
+    """
+    令牌桶存储抽象基类
+
+    每个客户端键对应一个容量为 capacity、每秒回填 refill_rate 个令牌的桶；
+    实现需要保证同一个键的"回填-判断-扣减"是原子的
+    """
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = float(capacity)
+        self.refill_rate = refill_rate
+        # 从空桶回填到满所需的时间，空闲超过该时间的桶与不存在等价，可以安全删除
+        self.idle_ttl = self.capacity / refill_rate if refill_rate > 0 else float("inf")
+
+    @abstractmethod
+    async def acquire(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        尝试从客户端的桶中取出令牌
+
+        Args:
+            key: 客户端键
+            cost: 本次请求消耗的令牌数
+
+        Returns:
+            (是否允许, 剩余令牌数)
+        """
+        pass
+
+    async def refund(self, key: str, cost: float) -> None:
+        """放回已扣除的令牌，超出容量的部分在下次回填时截断"""
+        await self.acquire(key, -cost)
+
+    def retry_after(self, remaining: float, cost: float = 1.0) -> float:
+        """令牌回填到 cost 所需的秒数"""
+        if self.refill_rate <= 0:
+            return float("inf")
+        return max(0.0, (cost - remaining) / self.refill_rate)
+
+    def _refill(self, tokens: float, updated: float, now: float) -> float:
+        # 多进程共享时各进程时钟可能有微小偏差，不允许时间倒退扣减令牌
+        return min(self.capacity, tokens + max(0.0, now - updated) * self.refill_rate)
+
+
+class MemoryBucketStore(BucketStore):
+    """
+    进程内令牌桶存储（仅在单个 worker 进程内有效）
+
+    按客户端键的哈希分为若干分片，每个分片是按最近访问排序的 LRU：
+    - 桶在空闲期间会回填到满，空闲超过回填时间的桶与不存在等价，定期清理时直接删除
+    - 客户端数超过 max_entries 时淘汰最久未访问的桶，内存占用不随访问过的 IP 数增长
+    """
+
+    def __init__(self, capacity: float, refill_rate: float, max_entries: int = 100000):
+        """
+        Args:
+            capacity: 桶容量（突发请求数）
+            refill_rate: 每秒回填的令牌数
+            max_entries: 最多保留的客户端数
+        """
+        super().__init__(capacity, refill_rate)
+        self.max_entries = max_entries
+
+        self._shard_limit = max(1, max_entries // _SHARDS)
+        self._shards: List["OrderedDict[str, _Bucket]"] = [OrderedDict() for _ in range(_SHARDS)]
+        self._next_shard = 0
+        self._next_sweep = 0.0
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    async def acquire(self, key: str, cost: float = 1.0, now: Optional[float] = None) -> Tuple[bool, float]:
+        """
+        Args:
+            now: 当前时间（单调时钟），主要用于测试
+        """
+        if now is None:
+            now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        shard = self._shards[hash(key) % _SHARDS]
+        bucket = shard.get(key)
+        if bucket is None:
+            bucket = _Bucket(self.capacity, now)
+            shard[key] = bucket
+            if len(shard) > self._shard_limit:
+                shard.popitem(last=False)
+        else:
+            shard.move_to_end(key)
+            bucket.tokens = self._refill(bucket.tokens, bucket.updated, now)
+            bucket.updated = now
+
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            return True, bucket.tokens
+        return False, bucket.tokens
+
+    def _sweep(self, now: float) -> None:
+        """清理一个分片中已经回填满的空闲桶"""
+        self._next_sweep = now + _SWEEP_INTERVAL
+        shard = self._shards[self._next_shard]
+        self._next_shard = (self._next_shard + 1) % _SHARDS
+
+        # 分片按最近访问排序，从最旧的一端删除，遇到仍在冷却的桶即可停止
+        cutoff = now - self.idle_ttl
+        while shard:
+            key, bucket = next(iter(shard.items()))
+            if bucket.updated > cutoff:
+                break
+            del shard[key]
+
+
+class SQLiteBucketStore(BucketStore):
+    """
+    基于 SQLite 文件的令牌桶存储，供同一台机器上的多个 worker 进程共享
+
+    每次判定在 BEGIN IMMEDIATE 事务中完成读取与更新，多个进程对同一个键的扣减互斥；
+    使用 WAL 模式，连接仅在专用的单线程执行器中使用，不阻塞事件循环。
+    时间使用墙上时钟，各进程一致。
+    容量与回填速率不同的存储（如限流与按天的配额）共用一个文件时各自使用独立的表，
+    清理与淘汰只作用于本存储的表
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS {table} (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_{table}_updated ON {table}(updated);
+    """
+
+    def __init__(
+        self,
+        db_file: Path,
+        capacity: float,
+        refill_rate: float,
+        max_entries: int = 100000,
+        table: str = "buckets",
+    ):
+        """
+        Args:
+            db_file: 数据库文件
+            capacity: 桶容量
+            refill_rate: 每秒回填的令牌数
+            max_entries: 最多保留的客户端数
+            table: 表名，共用文件的存储之间必须不同
+        """
+        if not table.isidentifier():
+            raise ValueError(f"无效的表名: {table}")
+        super().__init__(capacity, refill_rate)
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.table = table
+        self._next_sweep = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rate-limit-sqlite")
+        self._conn: sqlite3.Connection = self._executor.submit(self._connect).result()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # 限流状态丢失最近一次写入没有影响，不必每次提交都同步到磁盘
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.executescript(self._SCHEMA.format(table=self.table))
+        return conn
+
+    async def acquire(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._take, key, cost, time.time())
+
+    def _take(self, key: str, cost: float, now: float) -> Tuple[bool, float]:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"SELECT tokens, updated FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            tokens = self.capacity if row is None else self._refill(row[0], row[1], now)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                f"INSERT INTO {self.table} (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            if now >= self._next_sweep:
+                self._sweep(now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tokens
+
+    def _sweep(self, now: float) -> None:
+        """删除已经回填满的空闲桶，超出 max_entries 时再删除最久未访问的桶"""
+        self._next_sweep = now + _SWEEP_INTERVAL
+        conn = self._conn
+        conn.execute(f"DELETE FROM {self.table} WHERE updated <= ?", (now - self.idle_ttl,))
+        excess = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY updated LIMIT ?)",
+                (excess,),
+            )
+
+
+class RedisBucketStore(BucketStore):
+    """
+    基于 Redis 的令牌桶存储，供多台机器共享
+
+    判定由 Lua 脚本在 Redis 端原子执行，时间取 Redis 服务器时钟；
+    桶的过期时间为回填到满所需的时间，空闲客户端由 Redis 自动清除。
+    client 可以是 redis.asyncio.Redis 或任何提供同样 eval 接口的客户端
+    """
+
+    _SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+        local ttl = tonumber(ARGV[4])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = capacity
+        if state[1] then
+            tokens = math.min(capacity, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+        end
+        local allowed = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('PEXPIRE', KEYS[1], ttl)
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, client: Any, capacity: float, refill_rate: float, prefix: str = "tts:ratelimit:"):
+        super().__init__(capacity, refill_rate)
+        self.client = client
+        self.prefix = prefix
+        # 过期时间至少一秒，refill_rate 为 0 时桶永不回填，保留一天
+        ttl = self.idle_ttl if math.isfinite(self.idle_ttl) else 86400.0
+        self._ttl_ms = max(1000, math.ceil(ttl * 1000))
+
+    async def acquire(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        allowed, tokens = await self.client.eval(
+            self._SCRIPT, 1, self.prefix + key,
+            self.capacity, self.refill_rate, cost, self._ttl_ms,
+        )
+        return bool(int(allowed)), float(tokens)
+
+
+def create_bucket_store(
+    capacity: float,
+    refill_rate: float,
+    max_entries: int = 100000,
+    name: str = "buckets",
+) -> BucketStore:
+    """
+    根据配置创建令牌桶存储
+
+    - memory: 进程内（默认），多个 worker 各自计数
+    - sqlite: 本机共享文件，多个 worker 共用同一份限额；name 为存储使用的表名
+    - redis: 多台机器共用同一份限额，需要安装 redis 包；各存储的键互不重叠，过期时间按键设置
+
+    Args:
+        name: 存储名称，容量或回填速率不同的存储必须使用不同的名称
+    """
+    backend = settings.rate_limit_backend
+
+    if backend == "sqlite":
+        db_file = Path(settings.rate_limit_sqlite_path) if settings.rate_limit_sqlite_path \
+            else Path(__file__).parent.parent / "data" / "rate_limit.db"
+        return SQLiteBucketStore(db_file, capacity, refill_rate, max_entries, table=name)
+
+    if backend == "redis":
+        if not settings.rate_limit_redis_url:
+            raise ValueError("rate_limit.backend 为 redis 时必须配置 rate_limit.redis_url")
+        try:
+            from redis.asyncio import Redis
+        except ImportError:
+            raise ValueError("rate_limit.backend 为 redis 时需要安装 redis 包: pip install redis")
+        client = Redis.from_url(settings.rate_limit_redis_url)
+        return RedisBucketStore(client, capacity, refill_rate, prefix=settings.rate_limit_redis_prefix)
+
+    if backend != "memory":
+        raise ValueError(f"未知的限流存储类型: {backend}")
+
+    return MemoryBucketStore(capacity, refill_rate, max_entries)
@@ -0,0 +1,245 @@
+"""合成请求的重试与对冲"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+
+from gateway.adapters import TTSAdapter
+from gateway.config import settings
+from gateway.utils.metrics import track_backend_call
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+# 可重试的后端 HTTP 状态码（网关/服务暂时不可用）
+_RETRYABLE_STATUS = (502, 503, 504)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    判断错误是否可以重试
+
+    适配器会把 httpx 异常包装为普通 Exception，原始异常保存在 __cause__ 中
+    """
+    cause = error if isinstance(error, httpx.HTTPError) else error.__cause__
+    if isinstance(cause, httpx.TransportError):
+        return True
+    if isinstance(cause, httpx.HTTPStatusError):
+        return cause.response.status_code in _RETRYABLE_STATUS
+    return False
+
+
+class RetryBudget:
+    """
+    重试预算
+
+    滑动窗口内的重试（含对冲）次数不超过请求数的 ratio 倍，
+    但至少允许 min_retries 次，避免后端故障时重试把负载放大数倍
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 3, window: float = 10.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+
+    def _trim(self, now: float) -> None:
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        self._trim(now)
+        self._requests.append(now)
+
+    def try_spend(self) -> bool:
+        """预算充足时记录一次重试并返回 True"""
+        now = time.monotonic()
+        self._trim(now)
+        allowed = max(self.min_retries, self.ratio * len(self._requests))
+        if len(self._retries) >= allowed:
+            return False
+        self._retries.append(now)
+        return True
+
+
+class LatencyTracker:
+    """最近若干次请求耗时，用于计算对冲阈值"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def observe(self, elapsed: float) -> None:
+        self._samples.append(elapsed)
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        if len(self._samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+
+class ResiliencePolicy:
+    """
+    合成调用的重试与对冲策略
+
+    - 重试：仅对连接失败、超时和 502/503/504 重试，指数退避加随机抖动，受重试预算限制
+    - 对冲：请求耗时超过该后端近期 p95 时，向同一后端的另一副本再发一次，
+      取先完成的结果并取消另一个
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 2,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        budget: Optional[RetryBudget] = None,
+        hedge_enabled: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.5,
+        hedge_min_samples: int = 20,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._latency: Dict[str, LatencyTracker] = {}
+
+    def tracker(self, key: str) -> LatencyTracker:
+        tracker = self._latency.get(key)
+        if tracker is None:
+            tracker = self._latency[key] = LatencyTracker()
+        return tracker
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        """对冲阈值，样本不足时不对冲"""
+        if not self.hedge_enabled:
+            return None
+        p = self.tracker(key).quantile(self.hedge_quantile, self.hedge_min_samples)
+        if p is None:
+            return None
+        return max(self.hedge_min_delay, p)
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间（full jitter）"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    async def call(
+        self,
+        kind: str,
+        primary: TTSAdapter,
+        call: Callable[[TTSAdapter], Awaitable[R]],
+        alternate: Optional[TTSAdapter] = None,
+        discard: Optional[Callable[[R], None]] = None,
+    ) -> R:
+        """
+        执行一次带重试与对冲的调用
+
+        Args:
+            kind: 调用类型，与后端 ID 一起区分耗时统计（如整段合成与流式首包）
+            primary: 首选适配器
+            call: 对适配器执行的调用
+            alternate: 对冲目标，为空时不对冲
+            discard: 对冲中落选但已成功的结果的清理函数
+
+        Returns:
+            先成功完成的调用结果
+        """
+        self.budget.record_request()
+        attempt = 1
+        while True:
+            try:
+                return await self._hedged(kind, primary, call, alternate, discard)
+            except Exception as e:
+                if (
+                    attempt >= self.max_attempts
+                    or not is_retryable(e)
+                    or not self.budget.try_spend()
+                ):
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(
+                    f"Retrying {primary.backend_id} {kind} in {delay:.2f}s "
+                    f"(attempt {attempt + 1}/{self.max_attempts}): {e}"
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _timed(
+        self,
+        kind: str,
+        adapter: TTSAdapter,
+        call: Callable[[TTSAdapter], Awaitable[R]],
+    ) -> R:
+        started = time.monotonic()
+        result = await track_backend_call(adapter.backend_id, kind, call(adapter))
+        self.tracker(f"{adapter.backend_id}:{kind}").observe(time.monotonic() - started)
+        return result
+
+    async def _hedged(
+        self,
+        kind: str,
+        primary: TTSAdapter,
+        call: Callable[[TTSAdapter], Awaitable[R]],
+        alternate: Optional[TTSAdapter],
+        discard: Optional[Callable[[R], None]],
+    ) -> R:
+        delay = self.hedge_delay(f"{primary.backend_id}:{kind}") if alternate else None
+        if delay is None:
+            return await self._timed(kind, primary, call)
+
+        tasks = [asyncio.create_task(self._timed(kind, primary, call))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self.budget.try_spend():
+                logger.info(f"Hedging {primary.backend_id} {kind} to {alternate.backend_id} after {delay:.2f}s")
+                tasks.append(asyncio.create_task(self._timed(kind, alternate, call)))
+
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task.result()
+                        # 同时完成的其他成功结果需要清理
+                        for other in done - {task}:
+                            if discard and other.exception() is None:
+                                discard(other.result())
+                        return winner
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+# 单例实例
+resilience_policy = ResiliencePolicy(
+    max_attempts=settings.retry_max_attempts,
+    base_delay=settings.retry_base_delay,
+    max_delay=settings.retry_max_delay,
+    budget=RetryBudget(
+        ratio=settings.retry_budget_ratio,
+        min_retries=settings.retry_budget_min,
+    ),
+    hedge_enabled=settings.hedge_enabled,
+    hedge_quantile=settings.hedge_quantile,
+    hedge_min_delay=settings.hedge_min_delay,
+    hedge_min_samples=settings.hedge_min_samples,
+)
@@ -1,61 +1,757 @@
 """TTS 核心服务"""
 
+import asyncio
 import logging
-from typing import Dict, Optional, Tuple
+import re
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 
-from gateway.adapters import AdapterFactory, TTSAdapter
+import httpx
+
+from gateway.adapters import (
+    AdapterFactory,
+    BackendUnavailableError,
+    ReplicaPool,
+    TTSAdapter,
+    health_monitor,
+)
+from gateway.config import settings
 from gateway.schemas.request import TTSRequest
+from gateway.services.admission_service import AdmissionService, admission_service
+from gateway.services.audio_store import AudioStore, audio_store
+from gateway.services.cache_service import SynthesisCache, synthesis_cache
+from gateway.services.resilience import ResiliencePolicy, resilience_policy
+from gateway.utils.audio import build_wav_header, finalize_wav, parse_wav
+from gateway.utils.metrics import registry
+from gateway.utils.transcode import check_format, transcode
 
 logger = logging.getLogger(__name__)
 
+# 句末标点（中英文），允许后跟引号/括号；英文句点需后跟空白，避免切开小数
+_SENTENCE_END = re.compile(r"(?:[。！？!?；;…\n]+|\.+(?=\s|$))[\"'”’」』）)]*")
+
+# 超长句子的次级切分点
+_CLAUSE_END = re.compile(r"[，,、：:]+")
+
+# 带随机性的采样参数及其默认值，与默认值相同的请求视为未指定采样参数
+_SAMPLING_DEFAULTS = {
+    name: TTSRequest.model_fields[name].default for name in ("temperature", "top_p", "top_k")
+}
+
+
+class UnknownModelError(ValueError):
+    """请求的模型名不对应任何后端"""
+    pass
+
+
+SYNTHESIS_REQUESTS = registry.counter(
+    "tts_synthesis_requests_total",
+    "合成请求数（status: success / error / cancelled）",
+    ("backend", "format", "status"),
+)
+SYNTHESIS_INFLIGHT = registry.gauge(
+    "tts_synthesis_inflight",
+    "正在输出音频的合成请求数",
+    ("backend",),
+)
+SYNTHESIS_FIRST_BYTE = registry.histogram(
+    "tts_synthesis_first_byte_seconds",
+    "从收到合成请求到输出第一个音频分块的耗时",
+    ("backend",),
+)
+SYNTHESIS_DURATION = registry.histogram(
+    "tts_synthesis_duration_seconds",
+    "完整输出一次合成结果的耗时",
+    ("backend",),
+)
+SYNTHESIS_CHARS = registry.counter(
+    "tts_synthesis_input_chars_total",
+    "成功合成的输入字符数",
+    ("backend",),
+)
+SYNTHESIS_BYTES = registry.counter(
+    "tts_synthesis_output_bytes_total",
+    "成功输出的音频字节数",
+    ("backend", "format"),
+)
+
+
+def _split_long_sentence(sentence: str, max_chars: int) -> List[str]:
+    """将超过长度上限的句子按逗号等切开，仍过长时按长度硬切"""
+    if len(sentence) <= max_chars:
+        return [sentence]
+
+    pieces = []
+    pos = 0
+    for match in _CLAUSE_END.finditer(sentence):
+        pieces.append(sentence[pos:match.end()])
+        pos = match.end()
+    if pos < len(sentence):
+        pieces.append(sentence[pos:])
+
+    result = []
+    for piece in pieces:
+        while len(piece) > max_chars:
+            # 英文优先在空格处切开，避免截断单词
+            cut = piece.rfind(" ", 1, max_chars) + 1 or max_chars
+            result.append(piece[:cut])
+            piece = piece[cut:]
+        if piece:
+            result.append(piece)
+    return result
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """
+    按中英文句末标点切分文本
+
+    相邻短句会合并，使每段不超过 max_chars 个字符
+
+    Args:
+        text: 待切分文本
+        max_chars: 每段最大字符数
+
+    Returns:
+        List[str]: 按原顺序排列的文本段
+    """
+    sentences = []
+    pos = 0
+    for match in _SENTENCE_END.finditer(text):
+        sentences.append(text[pos:match.end()])
+        pos = match.end()
+    if pos < len(text):
+        sentences.append(text[pos:])
+
+    chunks = []
+    current = ""
+    for sentence in sentences:
+        for piece in _split_long_sentence(sentence, max_chars):
+            if current.strip() and len(current) + len(piece) > max_chars:
+                chunks.append(current.strip())
+                current = ""
+            current += piece
+    if current.strip():
+        chunks.append(current.strip())
+
+    return chunks
+
+
+class _Flight:
+    """
+    一次进行中的后端合成
+
+    由独立任务拉取后端音频流并缓存已到达的分块，相同请求的所有订阅者
+    都从第一个分块开始重放，之后跟随实时输出。
+
+    只在还能加入新订阅者（joinable）时保留全部分块；停止接受加入后，
+    所有订阅者都已读过的分块立即释放，内存占用不随音频长度增长
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks: List[bytes] = []
+        # chunks[0] 在整个音频流中的序号
+        self.base = 0
+        # chunks 中保留的字节数
+        self.buffered = 0
+        self.joinable = True
+        self.done = False
+        self.error: Optional[BaseException] = None
+        # 订阅者 -> 下一个要读取的分块序号
+        self.positions: Dict[object, int] = {}
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self.positions)
+
+    @property
+    def end(self) -> int:
+        """已到达分块的总数"""
+        return self.base + len(self.chunks)
+
+    def append(self, chunk: bytes) -> None:
+        self.chunks.append(chunk)
+        self.buffered += len(chunk)
+        self.trim()
+
+    def trim(self) -> None:
+        """停止接受加入后，释放所有订阅者都已读过的分块"""
+        if self.joinable:
+            return
+        consumed = min(self.positions.values(), default=self.end) - self.base
+        if consumed <= 0:
+            return
+        self.buffered -= sum(len(chunk) for chunk in self.chunks[:consumed])
+        del self.chunks[:consumed]
+        self.base += consumed
+
+    def notify(self) -> None:
+        """唤醒所有等待新分块的订阅者"""
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self) -> None:
+        """等待新分块、完成或出错"""
+        await self._changed.wait()
+
 
 class TTSService:
     """TTS 核心服务 - 处理语音合成请求"""
 
+    def __init__(
+        self,
+        cache: Optional[SynthesisCache] = None,
+        admission: Optional[AdmissionService] = None,
+        resilience: Optional[ResiliencePolicy] = None,
+        store: Optional[AudioStore] = None,
+    ):
+        self.cache = cache or synthesis_cache
+        self.admission = admission or admission_service
+        self.resilience = resilience or resilience_policy
+        self.store = store or audio_store
+        # 进行中的合成：请求规范 key -> _Flight
+        self._inflight: Dict[str, _Flight] = {}
+
     async def generate_speech(
         self,
-        request: TTSRequest
+        request: TTSRequest,
+        use_cache: bool = True,
     ) -> Tuple[bytes, Dict]:
         """
         生成语音
 
         Args:
             request: TTS 请求
+            use_cache: 是否允许使用合成结果缓存
 
         Returns:
             (音频数据, 元数据字典)
         """
+        audio_stream, metadata = await self.stream_speech(request, use_cache=use_cache)
+        audio_data = b"".join([chunk async for chunk in audio_stream])
+        return finalize_wav(audio_data), metadata
+
+    async def generate_batch(
+        self,
+        requests: List[TTSRequest],
+        concurrency: int,
+        use_cache: bool = True,
+    ) -> AsyncIterator[Tuple[int, Union[Tuple[bytes, Dict], Exception]]]:
+        """
+        批量生成语音
+
+        最多同时合成 concurrency 条，按完成顺序逐条产出结果；
+        单条失败只影响该条，不中断整个批次
+
+        Args:
+            requests: TTS 请求列表
+            concurrency: 同时合成的条数
+            use_cache: 是否允许使用合成结果缓存
+
+        Yields:
+            (请求下标, (音频数据, 元数据字典) 或异常)
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def _run(index: int, request: TTSRequest):
+            async with semaphore:
+                try:
+                    return index, await self.generate_speech(request, use_cache=use_cache)
+                except Exception as e:
+                    logger.warning(f"Batch item {index} failed: {e}")
+                    return index, e
+
+        tasks = [
+            asyncio.create_task(_run(index, request))
+            for index, request in enumerate(requests)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 客户端断开时取消剩余的合成
+            await self._cancel_tasks(tasks)
+
+    async def stream_speech(
+        self,
+        request: TTSRequest,
+        use_cache: bool = True,
+    ) -> Tuple[AsyncIterator[bytes], Dict]:
+        """
+        流式生成语音
+
+        在返回前先取得第一个音频分块，使后端错误在响应头发送前即可抛出。
+        与进行中的相同请求合并为一次后端调用
+
+        Args:
+            request: TTS 请求
+            use_cache: 是否允许使用合成结果缓存
+
+        Returns:
+            (音频分块迭代器, 元数据字典)
+        """
+        started = time.perf_counter()
+        try:
+            audio_stream, metadata = await self._stream_speech(request, use_cache)
+        except Exception:
+            # 尚未确定后端，按请求的模型名记录；未知模型名统一归类，避免标签数量失控
+            model = request.model if request.model in AdapterFactory.list_backend_ids() else "other"
+            SYNTHESIS_REQUESTS.labels(model, request.response_format, "error").inc()
+            raise
+        return self._measure(request, audio_stream, metadata, started), metadata
+
+    async def _stream_speech(
+        self,
+        request: TTSRequest,
+        use_cache: bool,
+    ) -> Tuple[AsyncIterator[bytes], Dict]:
+        check_format(request.response_format)
+        adapter, kwargs = await self._resolve(request)
+        metadata = self._build_metadata(request, adapter)
+        request_key = SynthesisCache.make_key(
+            adapter.backend_id, request.input, request.voice, kwargs
+        )
+
+        cacheable = self._is_cacheable(kwargs, use_cache)
+        if cacheable:
+            cached = await self.cache.get(request_key)
+            if cached is not None:
+                metadata["cache"] = "HIT"
+                return self._output(request, self._iterate_bytes(cached), metadata), metadata
+            metadata["cache"] = "MISS"
+
+        flight = self._inflight.get(request_key) if settings.coalesce_enabled else None
+        if flight is None:
+            stream = self._open_stream(adapter, request, kwargs)
+            if cacheable:
+                stream = self._cache_stream(request_key, stream)
+            if settings.coalesce_enabled:
+                stream = self._subscribe(self._start_flight(request_key, stream))
+        else:
+            metadata["coalesced"] = True
+            logger.info(f"Joined in-flight synthesis for {adapter.backend_id}")
+            stream = self._subscribe(flight)
+
+        audio_stream = await self._prime_stream(stream)
+
+        return self._output(request, audio_stream, metadata), metadata
+
+    async def _measure(
+        self,
+        request: TTSRequest,
+        stream: AsyncIterator[bytes],
+        metadata: Dict,
+        started: float,
+    ) -> AsyncIterator[bytes]:
+        """记录合成请求的进行中数量、首包耗时、总耗时、字符数与输出字节数"""
+        backend = metadata["model_used"]
+        inflight = SYNTHESIS_INFLIGHT.labels(backend)
+        inflight.inc()
+        status = "error"
+        first_chunk = True
+        size = 0
+        try:
+            async for chunk in stream:
+                if first_chunk:
+                    SYNTHESIS_FIRST_BYTE.labels(backend).observe(time.perf_counter() - started)
+                    first_chunk = False
+                size += len(chunk)
+                yield chunk
+            status = "success"
+        except (GeneratorExit, asyncio.CancelledError):
+            # 客户端断开
+            status = "cancelled"
+            raise
+        finally:
+            inflight.dec()
+            SYNTHESIS_REQUESTS.labels(backend, request.response_format, status).inc()
+            if status == "success":
+                SYNTHESIS_DURATION.labels(backend).observe(time.perf_counter() - started)
+                SYNTHESIS_CHARS.labels(backend).inc(len(request.input))
+                SYNTHESIS_BYTES.labels(backend, request.response_format).inc(size)
+
+    def _start_flight(self, key: str, stream: AsyncIterator[bytes]) -> _Flight:
+        """
+        启动后台任务拉取音频流，供相同请求共享
+
+        已缓存的分块超过 coalesce_replay_max_bytes 后不再接受新的订阅者，
+        之后的分块被所有订阅者读过即释放
+        """
+        flight = _Flight(key)
+
+        async def _pump() -> None:
+            try:
+                async for chunk in stream:
+                    flight.append(chunk)
+                    if flight.joinable and flight.buffered > settings.coalesce_replay_max_bytes:
+                        self._close_flight(flight)
+                    flight.notify()
+            except asyncio.CancelledError:
+                flight.error = asyncio.CancelledError()
+                raise
+            except Exception as e:
+                flight.error = e
+            finally:
+                await stream.aclose()
+                flight.done = True
+                self._close_flight(flight)
+                flight.notify()
+
+        self._inflight[key] = flight
+        flight.task = asyncio.create_task(_pump())
+        return flight
+
+    def _close_flight(self, flight: _Flight) -> None:
+        """停止接受新的订阅者"""
+        flight.joinable = False
+        if self._inflight.get(flight.key) is flight:
+            del self._inflight[flight.key]
+        flight.trim()
+
+    async def _subscribe(self, flight: _Flight) -> AsyncIterator[bytes]:
+        """
+        订阅进行中的合成
+
+        所有订阅者都断开时取消后端调用；单个订阅者断开不影响其他订阅者
+        """
+        token = object()
+        flight.positions[token] = flight.base
+        try:
+            while True:
+                index = flight.positions[token]
+                if index < flight.end:
+                    chunk = flight.chunks[index - flight.base]
+                    flight.positions[token] = index + 1
+                    flight.trim()
+                    yield chunk
+                    continue
+                if flight.error is not None:
+                    raise flight.error
+                if flight.done:
+                    return
+                await flight.wait()
+        finally:
+            del flight.positions[token]
+            if flight.subscribers == 0 and not flight.done:
+                logger.info("All subscribers left, cancelling in-flight synthesis")
+                self._close_flight(flight)
+                flight.task.cancel()
+            else:
+                flight.trim()
+
+    def _open_stream(
+        self,
+        adapter: TTSAdapter,
+        request: TTSRequest,
+        kwargs: Dict,
+    ) -> AsyncIterator[bytes]:
+        """
+        打开后端音频流，长文本分段并发合成后按顺序输出
+
+        单段请求整个音频流占用一个准入名额；分段请求的每段合成各自占用名额，
+        准入上限对应的是后端实际同时进行的合成数
+
+        Raises:
+            BackendUnavailableError: 后端已熔断
+        """
+        self._check_circuit(adapter)
+        segments = self._split_for_synthesis(request)
+        if len(segments) == 1:
+            stream = self._admit(adapter.backend_id, self._stream_single(adapter, request, kwargs))
+        else:
+            stream = self._stream_segments(adapter, request, kwargs, segments)
+        return self._track_health(adapter.backend_id, stream)
+
+    async def _stream_single(
+        self,
+        adapter: TTSAdapter,
+        request: TTSRequest,
+        kwargs: Dict,
+    ) -> AsyncIterator[bytes]:
+        """
+        单段流式合成
+
+        首个分块到达前失败可以重试，耗时过长时可以对冲；
+        开始向客户端输出后不再重试
+        """
+        alternate = self._hedge_target(adapter)
+
+        async def _first_chunk(target: TTSAdapter) -> Tuple[AsyncIterator[bytes], bytes]:
+            stream = target.stream_speech(text=request.input, voice=request.voice, **kwargs)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, b""
+
+        stream, first_chunk = await self.resilience.call(
+            "stream",
+            adapter,
+            _first_chunk,
+            alternate=alternate,
+            discard=lambda result: asyncio.create_task(result[0].aclose()),
+        )
+        try:
+            if first_chunk:
+                yield first_chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    def _hedge_target(self, adapter: TTSAdapter) -> Optional[TTSAdapter]:
+        """
+        对冲请求的目标
+
+        只在同一后端的多个副本之间对冲（发往同一副本池，会选中负载更低的另一副本）。
+        不对冲到其他后端：胜出的结果会以主后端的缓存键、model_used 与准入名额记账，
+        音色 ID 也只在本后端有效
+        """
+        if self.resilience.hedge_enabled and self._has_replicas(adapter):
+            return adapter
+        return None
+
+    @staticmethod
+    def _has_replicas(adapter: TTSAdapter) -> bool:
+        return isinstance(adapter, ReplicaPool) and len(adapter.replicas) > 1
+
+    async def _admit(
+        self, backend_id: str, stream: AsyncIterator[bytes]
+    ) -> AsyncIterator[bytes]:
+        """取得后端的准入名额后才开始请求后端，直到音频流结束才释放"""
+        async with self.admission.get(backend_id).slot():
+            async for chunk in stream:
+                yield chunk
+
+    async def _track_health(
+        self, backend_id: str, stream: AsyncIterator[bytes]
+    ) -> AsyncIterator[bytes]:
+        """将合成结果反馈给熔断器：连接失败、超时计为失败，正常完成计为成功"""
+        try:
+            async for chunk in stream:
+                yield chunk
+        except httpx.TransportError:
+            health_monitor.record_failure(backend_id)
+            raise
+        health_monitor.record_success(backend_id)
+
+    def _is_cacheable(self, kwargs: Dict, use_cache: bool) -> bool:
+        """判断请求是否可以使用缓存"""
+        if not use_cache or not self.cache.enabled:
+            return False
+
+        if settings.cache_bypass_sampling and any(
+            kwargs.get(name) not in (None, default) for name, default in _SAMPLING_DEFAULTS.items()
+        ):
+            return False
+
+        return True
+
+    async def _cache_stream(
+        self,
+        cache_key: str,
+        stream: AsyncIterator[bytes],
+    ) -> AsyncIterator[bytes]:
+        """边转发边收集音频，完整结束后写入缓存"""
+        buffer = bytearray()
+        cacheable = True
+
+        async for chunk in stream:
+            if cacheable:
+                buffer.extend(chunk)
+                if len(buffer) > self.cache.max_entry_bytes:
+                    cacheable = False
+                    buffer = bytearray()
+            yield chunk
+
+        if cacheable and buffer:
+            await self.cache.set(cache_key, finalize_wav(bytes(buffer)))
+
+    def _output(
+        self,
+        request: TTSRequest,
+        stream: AsyncIterator[bytes],
+        metadata: Dict,
+    ) -> AsyncIterator[bytes]:
+        """
+        将 WAV 流转换为请求的输出格式
+
+        缓存与请求合并都针对后端输出的 WAV，转码在每个订阅者各自的输出上进行；
+        请求 save_audio 时边输出边写入音频存储
+        """
+        stream = transcode(stream, request.response_format)
+        if not request.save_audio:
+            return stream
+        return self._save_stream(request, stream, metadata)
+
+    async def _save_stream(
+        self,
+        request: TTSRequest,
+        stream: AsyncIterator[bytes],
+        metadata: Dict,
+    ) -> AsyncIterator[bytes]:
+        """
+        转发音频流的同时写入音频存储
+
+        完整输出后提交，音频 ID 写入 metadata["audio_id"]；
+        客户端中途断开或合成出错时丢弃已写入的部分
+        """
+        writer = self.store.writer(request.response_format)
+        try:
+            async for chunk in stream:
+                await writer.write(chunk)
+                yield chunk
+        except BaseException:
+            await writer.abort()
+            raise
+
+        try:
+            record = await writer.commit(request.save_name)
+        except (OSError, ValueError) as e:
+            # 保存失败不影响已经发给客户端的音频
+            logger.warning(f"Failed to save audio: {e}")
+            await writer.abort()
+            return
+        metadata["audio_id"] = record.audio_id
+
+    async def _iterate_bytes(self, data: bytes) -> AsyncIterator[bytes]:
+        """将完整数据包装为音频流"""
+        yield data
+
+    async def _resolve(self, request: TTSRequest) -> Tuple[TTSAdapter, Dict]:
+        """选择适配器并准备参数"""
         # 1. 选择适配器
         adapter = await self._select_adapter(request)
         if not adapter:
-            raise Exception("没有可用的 TTS 后端")
+            raise BackendUnavailableError("没有可用的 TTS 后端")
 
         # 2. 准备参数
         kwargs = self._prepare_kwargs(request, adapter.backend_id)
 
-        # 3. 调用适配器生成语音
         logger.info(
             f"Generating speech with {adapter.backend_id}: "
             f"text={request.input[:50]}..., voice={request.voice}"
         )
 
-        audio_data = await adapter.generate_speech(
-            text=request.input,
-            voice=request.voice,
-            **kwargs
-        )
+        return adapter, kwargs
 
-        # 4. 返回结果
-        metadata = {
+    def _build_metadata(self, request: TTSRequest, adapter: TTSAdapter) -> Dict:
+        """构建返回给路由层的元数据"""
+        return {
             "model_used": adapter.backend_id,
             "voice": request.voice,
             "response_format": request.response_format,
+            "cache": "BYPASS",
         }
 
-        return audio_data, metadata
+    def _split_for_synthesis(self, request: TTSRequest) -> List[str]:
+        """决定是否分段合成（后端统一输出 WAV，可在网关侧无损拼接）"""
+        if not settings.segment_enabled:
+            return [request.input]
+        if len(request.input) <= settings.segment_max_chars:
+            return [request.input]
+        return split_text(request.input, settings.segment_max_chars) or [request.input]
+
+    def _segment_concurrency(self, backend_id: str) -> int:
+        """获取后端的分段并发数"""
+        concurrency = {
+            "qwen3-tts": settings.qwen3_tts_segment_concurrency,
+            "indextts-2.0": settings.indextts_segment_concurrency,
+        }.get(backend_id, 1)
+        return max(1, concurrency)
+
+    def _start_segment_tasks(
+        self,
+        adapter: TTSAdapter,
+        request: TTSRequest,
+        kwargs: Dict,
+        segments: List[str],
+    ) -> List[asyncio.Task]:
+        """为每个文本段创建合成任务，并发数受后端配置限制，每段合成占用一个准入名额"""
+        semaphore = asyncio.Semaphore(self._segment_concurrency(adapter.backend_id))
+        admission = self.admission.get(adapter.backend_id)
+        # 各段必须由同一类后端合成才能拼接，只对冲到其他副本
+        alternate = self._hedge_target(adapter)
+
+        async def _synthesize(segment: str) -> bytes:
+            async with semaphore, admission.slot():
+                return await self.resilience.call(
+                    "segment",
+                    adapter,
+                    lambda target: target.generate_speech(
+                        text=segment,
+                        voice=request.voice,
+                        **kwargs
+                    ),
+                    alternate=alternate,
+                )
+
+        logger.info(
+            f"Split input into {len(segments)} segments for {adapter.backend_id}"
+        )
+        return [asyncio.create_task(_synthesize(segment)) for segment in segments]
+
+    async def _stream_segments(
+        self,
+        adapter: TTSAdapter,
+        request: TTSRequest,
+        kwargs: Dict,
+        segments: List[str],
+    ) -> AsyncIterator[bytes]:
+        """
+        并发合成各段并按顺序输出
+
+        第一段完成即输出流式 WAV 头与其 PCM 数据，后续段依次输出 PCM
+        """
+        tasks = self._start_segment_tasks(adapter, request, kwargs, segments)
+        try:
+            fmt_chunk = None
+            for task in tasks:
+                segment_fmt, pcm = parse_wav(await task)
+                if fmt_chunk is None:
+                    fmt_chunk = segment_fmt
+                    yield build_wav_header(fmt_chunk)
+                elif segment_fmt != fmt_chunk:
+                    raise ValueError("各段音频采样格式不一致，无法拼接")
+                yield pcm
+        finally:
+            await self._cancel_tasks(tasks)
+
+    async def _cancel_tasks(self, tasks: List[asyncio.Task]) -> None:
+        """取消尚未完成的分段任务并回收其异常"""
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _prime_stream(
+        self,
+        stream: AsyncIterator[bytes]
+    ) -> AsyncIterator[bytes]:
+        """预取第一个分块，返回包含该分块的完整迭代器"""
+        try:
+            first_chunk = await stream.__anext__()
+        except StopAsyncIteration:
+            first_chunk = b""
+
+        async def _iterate() -> AsyncIterator[bytes]:
+            try:
+                if first_chunk:
+                    yield first_chunk
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+        return _iterate()
 
     async def _select_adapter(self, request: TTSRequest) -> Optional[TTSAdapter]:
-        """选择适配器"""
+        """
+        选择适配器
+
+        Raises:
+            UnknownModelError: 模型名不对应任何后端
+        """
         model = request.model.lower()
 
         # 指定具体模型
@@ -84,13 +780,24 @@ class TTSService:
         if adapter:
             return adapter
 
-        raise Exception(f"未知的模型: {model}")
+        raise UnknownModelError(f"未知的模型: {model}")
+
+    def _check_circuit(self, adapter: TTSAdapter) -> None:
+        """
+        后端已熔断时立即失败，不再等待请求超时
+
+        只在确定要请求后端时调用：半开状态下会占用本周期的试探机会，
+        缓存命中与合并到进行中的请求不经过这里，不会占用试探也不会被熔断拒绝
+        """
+        if not health_monitor.allow_request(adapter.backend_id):
+            raise BackendUnavailableError(f"{adapter.backend_id} 后端暂时不可用（已熔断）")
 
     def _prepare_kwargs(self, request: TTSRequest, backend_id: str) -> Dict:
         """准备适配器参数"""
         kwargs = {
             "speed": request.speed,
-            "response_format": request.response_format,
+            # 后端统一输出 WAV，由网关转码为请求的格式
+            "response_format": "wav",
         }
 
         if backend_id == "qwen3-tts":
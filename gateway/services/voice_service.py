@@ -1,19 +1,152 @@
 """音色管理服务"""
 
+import asyncio
 import logging
-from typing import List, Optional
+import time
+from typing import Dict, List, Optional, Tuple
 
 from gateway.adapters import AdapterFactory
+from gateway.adapters.base import TTSAdapter, VoiceItem
+from gateway.config import settings
 from gateway.schemas.response import VoiceInfo, VoicesResponse
 from gateway.services.metadata_service import metadata_service
+from gateway.utils.concurrency import fan_out
+from gateway.utils.metrics import track_backend_call
 
 logger = logging.getLogger(__name__)
 
 
+class _Catalog:
+    """单个后端的音色目录缓存"""
+
+    def __init__(self):
+        self.voices: Optional[List[VoiceItem]] = None
+        self.fetched_at = 0.0
+        self.refreshing: Optional[asyncio.Task] = None
+        # 每次失效加一，失效前发起的刷新结果会被丢弃
+        self.generation = 0
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
 class VoiceService:
-    """音色管理服务"""
+    """
+    音色管理服务
+
+    各后端的音色目录缓存在内存中，由后台任务定时刷新；
+    目录过期时先返回旧数据并在后台刷新，上传音色后立即失效
+    """
+
+    def __init__(
+        self,
+        catalog_enabled: bool = True,
+        catalog_ttl: float = 60.0,
+        catalog_refresh_interval: float = 30.0,
+    ):
+        self.catalog_enabled = catalog_enabled
+        self.catalog_ttl = catalog_ttl
+        self.catalog_refresh_interval = catalog_refresh_interval
+        self._catalogs: Dict[str, _Catalog] = {}
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """启动后台目录刷新任务"""
+        if not self.catalog_enabled or self.catalog_refresh_interval <= 0:
+            return
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """停止后台刷新任务并清空目录缓存"""
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+        for catalog in self._catalogs.values():
+            if catalog.refreshing is not None:
+                catalog.refreshing.cancel()
+        self._catalogs.clear()
+
+    def invalidate_catalog(self, backend_id: str) -> None:
+        """使指定后端的目录失效，下次读取时重新获取"""
+        catalog = self._catalogs.get(backend_id)
+        if catalog is None:
+            return
+        catalog.generation += 1
+        catalog.voices = None
+        catalog.refreshing = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            results = await fan_out(
+                AdapterFactory.get_all(),
+                self._refresh_catalog,
+                timeout=lambda adapter: adapter.probe_timeout,
+            )
+            for backend_id, result in results.items():
+                if isinstance(result, Exception):
+                    logger.warning(f"Failed to refresh voice catalog of {backend_id}: {result}")
+            await asyncio.sleep(self.catalog_refresh_interval)
+
+    def _refresh_catalog(self, adapter: TTSAdapter) -> "asyncio.Future[List[VoiceItem]]":
+        """
+        刷新指定后端的目录
+
+        同一后端同时只有一个刷新请求，返回的 Future 被取消时刷新仍会继续
+        """
+        catalog = self._catalogs.setdefault(adapter.backend_id, _Catalog())
+        if catalog.refreshing is None:
+            catalog.refreshing = asyncio.create_task(self._fetch_catalog(adapter, catalog))
+        return asyncio.shield(catalog.refreshing)
+
+    async def _fetch_catalog(self, adapter: TTSAdapter, catalog: _Catalog) -> List[VoiceItem]:
+        generation = catalog.generation
+        task = asyncio.current_task()
+        try:
+            voices = await track_backend_call(adapter.backend_id, "list_voices", adapter.list_voices())
+        finally:
+            if catalog.refreshing is task:
+                catalog.refreshing = None
+
+        if generation == catalog.generation:
+            catalog.voices = voices
+            catalog.fetched_at = time.monotonic()
+            logger.debug(f"Refreshed voice catalog of {adapter.backend_id}: {len(voices)} voices")
+        return voices
+
+    async def _get_catalog(self, adapter: TTSAdapter) -> Tuple[List[VoiceItem], Optional[float]]:
+        """
+        获取后端音色目录
+
+        Returns:
+            tuple: (音色列表, 目录缓存时长)，未启用缓存时时长为 None
+        """
+        if not self.catalog_enabled:
+            voices = await track_backend_call(adapter.backend_id, "list_voices", adapter.list_voices())
+            return voices, None
+
+        catalog = self._catalogs.get(adapter.backend_id)
+        if catalog is None or catalog.voices is None:
+            voices = await self._refresh_catalog(adapter)
+            return voices, 0.0
+
+        if catalog.age > self.catalog_ttl:
+            # 先返回旧目录，后台刷新
+            self._refresh_catalog(adapter).add_done_callback(self._log_background_refresh)
 
-    async def _merge_voice_with_metadata(
+        return catalog.voices, catalog.age
+
+    @staticmethod
+    def _log_background_refresh(future: "asyncio.Future") -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Background voice catalog refresh failed: {future.exception()}")
+
+    def _merge_voice_with_metadata(
         self,
         voice,
         backend_id: str,
@@ -95,23 +228,30 @@ class VoiceService:
             聚合的音色列表响应
         """
         all_voices: List[VoiceInfo] = []
+        catalog_ages: List[float] = []
 
         # 获取所有音色的可见性映射
         visibility_map = await metadata_service.get_all_voice_ids_with_visibility()
 
-        adapters = AdapterFactory.get_all()
+        # 并发读取各后端目录，单个后端失败或超时只影响自身的结果
+        results = await fan_out(
+            AdapterFactory.get_all(),
+            self._get_catalog,
+            timeout=lambda adapter: adapter.probe_timeout,
+        )
 
-        for backend_id, adapter in adapters.items():
-            try:
-                voices = await adapter.list_voices()
-                for voice in voices:
-                    voice_info = await self._merge_voice_with_metadata(
-                        voice, backend_id, visibility_map
-                    )
-                    all_voices.append(voice_info)
-                logger.debug(f"Listed {len(voices)} voices from {backend_id}")
-            except Exception as e:
-                logger.warning(f"Failed to list voices from {backend_id}: {e}")
+        for backend_id, result in results.items():
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to list voices from {backend_id}: {result}")
+                continue
+            voices, age = result
+            if age is not None:
+                catalog_ages.append(age)
+            for voice in voices:
+                all_voices.append(
+                    self._merge_voice_with_metadata(voice, backend_id, visibility_map)
+                )
+            logger.debug(f"Listed {len(voices)} voices from {backend_id}")
 
         # 过滤音色
         filtered_voices = await self._filter_voices_by_visibility(
@@ -121,6 +261,7 @@ class VoiceService:
         return VoicesResponse(
             voices=filtered_voices,
             total=len(filtered_voices),
+            catalog_age=round(max(catalog_ages), 3) if catalog_ages else None,
         )
 
     async def list_voices_by_backend(
@@ -149,9 +290,9 @@ class VoiceService:
         visibility_map = await metadata_service.get_all_voice_ids_with_visibility()
 
         try:
-            voices = await adapter.list_voices()
+            voices, age = await self._get_catalog(adapter)
             voice_infos = [
-                await self._merge_voice_with_metadata(voice, backend_id, visibility_map)
+                self._merge_voice_with_metadata(voice, backend_id, visibility_map)
                 for voice in voices
             ]
 
@@ -163,6 +304,7 @@ class VoiceService:
             return VoicesResponse(
                 voices=filtered_voices,
                 total=len(filtered_voices),
+                catalog_age=round(age, 3) if age is not None else None,
             )
 
         except Exception as e:
@@ -203,14 +345,21 @@ class VoiceService:
 
         try:
             # 上传到 TTS 后端
-            result = await adapter.upload_voice(
-                file_content=file_content,
-                filename=filename,
-                voice_id=voice_id,
-                **kwargs
+            result = await track_backend_call(
+                adapter.backend_id,
+                "upload_voice",
+                adapter.upload_voice(
+                    file_content=file_content,
+                    filename=filename,
+                    voice_id=voice_id,
+                    **kwargs
+                ),
             )
 
             if result.get("success"):
+                # 新音色需要立即出现在列表中
+                self.invalidate_catalog(adapter.backend_id)
+
                 # 保存元数据
                 actual_voice_id = result.get("voice_id", voice_id)
                 await metadata_service.save_voice_metadata(
@@ -248,4 +397,8 @@ class VoiceService:
 
 
 # 全局服务实例
-voice_service = VoiceService()
+voice_service = VoiceService(
+    catalog_enabled=settings.voice_catalog_enabled,
+    catalog_ttl=settings.voice_catalog_ttl,
+    catalog_refresh_interval=settings.voice_catalog_refresh_interval,
+)
@@ -0,0 +1,102 @@
+"""WAV 音频处理工具"""
+
+import struct
+from typing import Tuple
+
+# 流式输出时总长度未知，按惯例用最大值占位
+STREAMING_SIZE = 0xFFFFFFFF
+
+
+def parse_wav(data: bytes) -> Tuple[bytes, bytes]:
+    """
+    解析 WAV 文件
+
+    逐块扫描 RIFF 结构，兼容 fmt 与 data 之间带有 LIST 等附加块的文件
+
+    Args:
+        data: WAV 文件内容
+
+    Returns:
+        tuple[bytes, bytes]: (fmt 块内容, PCM 数据)
+    """
+    fmt_chunk, data_offset, data_size = locate_wav_data(data)
+    # 流式 WAV 的 data 长度可能是占位值，截取到文件末尾
+    return fmt_chunk, data[data_offset:data_offset + data_size]
+
+
+def locate_wav_data(header: bytes) -> Tuple[bytes, int, int]:
+    """
+    定位 WAV 文件的 data 块
+
+    只需要文件开头到 data 块头部为止的内容，可用于只读取了头部的文件
+
+    Args:
+        header: WAV 文件开头的内容
+
+    Returns:
+        tuple[bytes, int, int]: (fmt 块内容, PCM 数据起始偏移, data 块声明的长度)
+    """
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise ValueError("不是有效的 WAV 数据")
+
+    fmt_chunk = None
+    offset = 12
+    while offset + 8 <= len(header):
+        chunk_id = header[offset:offset + 4]
+        chunk_size = struct.unpack("<I", header[offset + 4:offset + 8])[0]
+        body_start = offset + 8
+
+        if chunk_id == b"fmt ":
+            fmt_chunk = header[body_start:body_start + chunk_size]
+        elif chunk_id == b"data":
+            if fmt_chunk is None:
+                raise ValueError("WAV 数据缺少 fmt 块")
+            return fmt_chunk, body_start, chunk_size
+
+        # RIFF 块按偶数字节对齐
+        offset = body_start + chunk_size + (chunk_size & 1)
+
+    raise ValueError("WAV 数据缺少 data 块")
+
+
+def build_wav_header(fmt_chunk: bytes, data_size: int = STREAMING_SIZE) -> bytes:
+    """
+    构建 WAV 文件头
+
+    Args:
+        fmt_chunk: fmt 块内容
+        data_size: PCM 数据长度，默认为流式占位值
+
+    Returns:
+        bytes: RIFF/fmt/data 头部
+    """
+    if data_size == STREAMING_SIZE:
+        riff_size = STREAMING_SIZE
+    else:
+        riff_size = 4 + (8 + len(fmt_chunk)) + (8 + data_size)
+
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        + b"fmt " + struct.pack("<I", len(fmt_chunk)) + fmt_chunk
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+def finalize_wav(data: bytes) -> bytes:
+    """
+    将流式 WAV 的占位长度改写为实际长度
+
+    非 WAV 数据或长度已正确的 WAV 原样返回
+
+    Args:
+        data: 完整的音频数据
+
+    Returns:
+        bytes: 头部长度正确的音频数据
+    """
+    if data[:4] != b"RIFF" or struct.unpack("<I", data[4:8])[0] != STREAMING_SIZE:
+        return data
+
+    fmt_chunk, pcm = parse_wav(data)
+    return build_wav_header(fmt_chunk, len(pcm)) + pcm
+
@@ -0,0 +1,40 @@
+"""并发工具"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Mapping, Optional, TypeVar, Union
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def fan_out(
+    items: Mapping[str, T],
+    call: Callable[[T], Awaitable[R]],
+    timeout: Union[float, Callable[[T], Optional[float]], None] = None,
+) -> Dict[str, Union[R, Exception]]:
+    """
+    并发地对每一项执行调用，返回部分结果
+
+    每一项有各自的截止时间，单项失败或超时不影响其他项；
+    总耗时取决于最慢的一项，而不是各项耗时之和
+
+    Args:
+        items: {名称: 对象}，通常是 AdapterFactory.get_all() 的结果
+        call: 对单个对象执行的异步调用
+        timeout: 截止时间（秒），可以是统一的值，也可以按对象返回；None 表示不限制
+
+    Returns:
+        dict: {名称: 调用结果或异常}，顺序与 items 一致，超时的项为 TimeoutError
+    """
+    async def _run(item: T) -> R:
+        deadline = timeout(item) if callable(timeout) else timeout
+        try:
+            return await asyncio.wait_for(call(item), deadline)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"timed out after {deadline}s") from None
+
+    results = await asyncio.gather(
+        *(_run(item) for item in items.values()),
+        return_exceptions=True,
+    )
+    return dict(zip(items.keys(), results))
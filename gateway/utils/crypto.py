@@ -1,7 +1,17 @@
 """密钥哈希与验证工具"""
 
+import asyncio
 import hashlib
+import hmac
+import os
 import secrets
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from gateway.config import settings
 
 
 def hash_key(key: str) -> tuple[str, str]:
@@ -43,3 +53,170 @@ def verify_key(key: str, salt: str, stored_hash: str) -> bool:
         iterations=100000,
     )
     return secrets.compare_digest(computed_hash.hex(), stored_hash)
+
+
+def key_lookup_tag(key: str, secret: bytes) -> str:
+    """
+    计算密钥的查找标签
+
+    使用服务端密钥做 HMAC-SHA256，不可逆且不同部署间不可比对，
+    用于在存储中按密钥直接定位私人音色
+
+    Args:
+        key: 原始密钥
+        secret: 服务端查找密钥
+
+    Returns:
+        str: 十六进制标签
+    """
+    return hmac.new(secret, key.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+# 服务端查找密钥的字节数
+_SECRET_BYTES = 32
+
+
+def load_or_create_secret(secret_file: Path) -> bytes:
+    """
+    读取服务端查找密钥，不存在时生成并持久化
+
+    密钥先完整写入临时文件，再通过硬链接原子地放到目标路径：
+    多个 worker 同时启动时只有一个能链接成功，其余读取到的一定是完整内容
+
+    Args:
+        secret_file: 密钥文件路径
+
+    Returns:
+        bytes: 密钥内容
+
+    Raises:
+        ValueError: 已有的密钥文件内容无效
+    """
+    if not secret_file.exists():
+        secret = secrets.token_bytes(_SECRET_BYTES)
+        tmp_file = secret_file.with_name(f"{secret_file.name}.{secrets.token_hex(8)}.tmp")
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(secret.hex())
+                f.flush()
+                os.fsync(f.fileno())
+            os.link(tmp_file, secret_file)
+            return secret
+        except FileExistsError:
+            # 其他 worker 已抢先创建，读取它的密钥
+            pass
+        finally:
+            tmp_file.unlink(missing_ok=True)
+
+    return _read_secret(secret_file)
+
+
+def _read_secret(secret_file: Path) -> bytes:
+    content = secret_file.read_text(encoding="utf-8").strip()
+    try:
+        secret = bytes.fromhex(content)
+    except ValueError:
+        secret = b""
+    if len(secret) != _SECRET_BYTES:
+        raise ValueError(
+            f"密钥文件 {secret_file} 内容无效（应为 {_SECRET_BYTES} 字节的十六进制），"
+            f"请删除后重启或通过 metadata.key_lookup_secret 配置"
+        )
+    return secret
+
+
+class VerifiedKeyCache:
+    """
+    最近的密钥校验结果缓存
+
+    校验通过与不通过的结果都会缓存：不匹配的密钥（如逐个比对未打标签的旧音色时）
+    同样不必在有效期内重复计算 PBKDF2。
+    以进程内随机密钥对原始密钥做 HMAC 得到指纹，与 salt、哈希值一起作为 key，
+    内存中不保留原始密钥；按条数限制容量，过期后需重新校验
+    """
+
+    def __init__(self, ttl: float = 300.0, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._secret = secrets.token_bytes(32)
+        # (指纹, salt, 哈希值) -> (过期时间, 是否匹配)
+        self._entries: "OrderedDict[tuple[str, str, str], tuple[float, bool]]" = OrderedDict()
+
+    def _entry_key(self, key: str, salt: str, stored_hash: str) -> tuple[str, str, str]:
+        fingerprint = hmac.new(self._secret, key.encode("utf-8"), hashlib.sha256).hexdigest()
+        return fingerprint, salt, stored_hash
+
+    def get(self, key: str, salt: str, stored_hash: str) -> Optional[bool]:
+        """缓存的校验结果，未缓存或已过期时返回 None"""
+        entry_key = self._entry_key(key, salt, stored_hash)
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            return None
+        expires_at, valid = entry
+        if expires_at < time.monotonic():
+            del self._entries[entry_key]
+            return None
+        self._entries.move_to_end(entry_key)
+        return valid
+
+    def add(self, key: str, salt: str, stored_hash: str, valid: bool = True) -> None:
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        entry_key = self._entry_key(key, salt, stored_hash)
+        self._entries[entry_key] = (time.monotonic() + self.ttl, valid)
+        self._entries.move_to_end(entry_key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+verified_key_cache = VerifiedKeyCache(
+    ttl=settings.crypto_verify_cache_ttl,
+    max_size=settings.crypto_verify_cache_size,
+)
+
+# PBKDF2 专用线程池，限制并发计算占用的 CPU，避免阻塞事件循环
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.crypto_max_workers,
+            thread_name_prefix="crypto",
+        )
+    return _executor
+
+
+async def hash_key_async(key: str) -> tuple[str, str]:
+    """在专用线程池中执行 hash_key"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), hash_key, key)
+
+
+async def verify_key_async(key: str, salt: str, stored_hash: str) -> bool:
+    """
+    在专用线程池中执行 verify_key
+
+    近期校验过的（密钥, salt, 哈希值）直接返回缓存的结果，不再重复计算 PBKDF2
+    """
+    cached = verified_key_cache.get(key, salt, stored_hash)
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    valid = await loop.run_in_executor(_get_executor(), verify_key, key, salt, stored_hash)
+    verified_key_cache.add(key, salt, stored_hash, valid)
+    return valid
+
+
+def shutdown_executor() -> None:
+    """关闭密钥计算线程池（关闭服务时调用）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,297 @@
+"""进程内指标与 Prometheus 文本格式导出"""
+
+import asyncio
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, List, Sequence, Tuple, TypeVar
+
+R = TypeVar("R")
+
+# 默认耗时分桶（秒），覆盖从毫秒级元数据读写到分钟级长文本合成
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _GaugeValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # 最后一格对应 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Metric:
+    """
+    指标基类
+
+    每组标签值对应一个独立的值对象，更新时只做一次字典查找和一次加法，
+    不加锁：指标只在事件循环线程（或 GIL 保护下的单次加法）中更新
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """获取一组标签值对应的值对象，热点路径可以缓存返回值"""
+        child = self._values.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            child = self._values.setdefault(tuple(str(v) for v in values), self._new_value())
+        return child
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {_escape_help(self.documentation)}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, child in list(self._values.items()):
+            lines.extend(self._render_value(_labels(self.labelnames, values), child))
+        return lines
+
+    def _render_value(self, labels: str, child) -> List[str]:
+        return [f"{self.name}{labels} {_format(child.value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_value(self) -> _CounterValue:
+        return _CounterValue()
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_value(self) -> _GaugeValue:
+        return _GaugeValue()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def _render_value(self, labels: str, child: _HistogramValue) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts):
+            cumulative += count
+            le = _labels(("le",), (_format(bound),))
+            bucket_labels = f"{labels[:-1]},{le[1:]}" if labels else le
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{self.name}_sum{labels} {_format(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    """采集时调用函数取值的指标，用于导出已有服务内部的统计，不增加请求路径上的开销"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Dict[Tuple[str, ...], float]],
+        kind: str = "gauge",
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {_escape_help(self.documentation)}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, value in self.collect().items():
+            lines.append(f"{self.name}{_labels(self.labelnames, values)} {_format(value)}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                raise ValueError(f"指标 {metric.name} 已以不同类型或标签注册")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Dict[Tuple[str, ...], float]],
+        kind: str = "gauge",
+    ) -> CallbackMetric:
+        """
+        注册采集时取值的指标
+
+        Args:
+            collect: 返回 {标签值元组: 值} 的函数
+            kind: gauge 或 counter
+        """
+        metric = self.register(CallbackMetric(name, documentation, labelnames, collect, kind))
+        metric.collect = collect
+        return metric
+
+    def render(self) -> str:
+        """导出为 Prometheus 文本格式（0.0.4）"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# 全局注册表
+registry = Registry()
+
+BACKEND_CALLS = registry.counter(
+    "tts_backend_calls_total",
+    "后端适配器调用次数",
+    ("backend", "operation", "status"),
+)
+BACKEND_CALL_DURATION = registry.histogram(
+    "tts_backend_call_duration_seconds",
+    "后端适配器调用耗时（流式调用为取得第一个分块的耗时）",
+    ("backend", "operation"),
+)
+
+
+async def track_backend_call(backend_id: str, operation: str, call: Awaitable[R]) -> R:
+    """
+    记录一次后端调用的次数、结果与耗时
+
+    Args:
+        backend_id: 后端 ID
+        operation: 调用类型，如 status / list_voices / stream / segment
+        call: 调用的协程
+
+    Returns:
+        调用结果
+    """
+    started = time.perf_counter()
+    status = "error"
+    try:
+        result = await call
+        status = "success"
+        return result
+    except asyncio.CancelledError:
+        # 对冲落选或超时取消
+        status = "cancelled"
+        raise
+    finally:
+        BACKEND_CALLS.labels(backend_id, operation, status).inc()
+        BACKEND_CALL_DURATION.labels(backend_id, operation).observe(time.perf_counter() - started)
+
@@ -0,0 +1,65 @@
+"""客户端地址解析"""
+
+import ipaddress
+import logging
+from typing import Iterable, Optional, Tuple, Union
+
+from starlette.requests import HTTPConnection
+
+logger = logging.getLogger(__name__)
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_networks(entries: Iterable[str]) -> Tuple[IPNetwork, ...]:
+    """解析受信任代理列表，支持单个地址与 CIDR，无效条目记录警告后忽略"""
+    networks = []
+    for entry in entries:
+        try:
+            networks.append(ipaddress.ip_network(entry.strip(), strict=False))
+        except ValueError:
+            logger.warning(f"Ignoring invalid trusted proxy: {entry!r}")
+    return tuple(networks)
+
+
+def _is_trusted(address: str, trusted: Tuple[IPNetwork, ...]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+
+def _valid_ip(address: str) -> Optional[str]:
+    try:
+        return str(ipaddress.ip_address(address))
+    except ValueError:
+        return None
+
+
+def get_client_ip(connection: HTTPConnection, trusted: Tuple[IPNetwork, ...] = ()) -> str:
+    """
+    获取客户端 IP
+
+    只有直连地址属于受信任代理时才读取 X-Forwarded-For / X-Real-IP：
+    从 X-Forwarded-For 右侧开始跳过受信任代理，取第一个不受信任的地址，
+    客户端自行填写的左侧条目不会被采用，无法伪造任意数量的地址
+    """
+    peer = connection.client.host if connection.client else "unknown"
+    if not trusted or not _is_trusted(peer, trusted):
+        return peer
+
+    forwarded_for = connection.headers.get("X-Forwarded-For")
+    if forwarded_for:
+        client = peer
+        for hop in reversed(forwarded_for.split(",")):
+            address = _valid_ip(hop.strip())
+            if address is None:
+                break
+            client = address
+            if not _is_trusted(address, trusted):
+                break
+        return client
+
+    real_ip = _valid_ip(connection.headers.get("X-Real-IP", "").strip())
+    return real_ip or peer
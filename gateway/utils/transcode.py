@@ -0,0 +1,219 @@
+"""网关侧音频转码"""
+
+import asyncio
+import contextlib
+import shutil
+import struct
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional
+
+from gateway.config import settings
+from gateway.utils.audio import locate_wav_data
+
+# 输出格式对应的 MIME 类型（与 OpenAI 语音接口一致）
+MEDIA_TYPES = {
+    "wav": "audio/wav",
+    "pcm": "audio/pcm",
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+}
+
+# 需要 ffmpeg 编码的格式
+_ENCODED_FORMATS = ("mp3", "opus", "aac", "flac")
+
+# 从 ffmpeg 标准输出读取的块大小
+_READ_BYTES = 16 * 1024
+
+# WAV fmt 块中整数 PCM 的格式码（含 WAVE_FORMAT_EXTENSIBLE）
+_WAVE_FORMAT_PCM = (0x0001, 0xFFFE)
+
+
+class TranscodeError(Exception):
+    """转码失败"""
+    pass
+
+
+class UnsupportedFormatError(TranscodeError):
+    """当前环境不支持该输出格式"""
+    pass
+
+
+def media_type(fmt: str) -> str:
+    return MEDIA_TYPES.get(fmt, "application/octet-stream")
+
+
+@lru_cache(maxsize=8)
+def _which(path: str) -> Optional[str]:
+    return shutil.which(path)
+
+
+def ffmpeg_available() -> bool:
+    return _which(settings.transcode_ffmpeg_path) is not None
+
+
+def check_format(fmt: str) -> None:
+    """
+    检查输出格式是否可用
+
+    wav 与 pcm 由网关直接处理（后端输出不是 16 位 PCM 时 pcm 在转码时需要 ffmpeg）；
+    压缩格式需要 ffmpeg
+
+    Raises:
+        UnsupportedFormatError: 格式未知或未安装 ffmpeg
+    """
+    if fmt in ("wav", "pcm"):
+        return
+    if fmt not in _ENCODED_FORMATS:
+        raise UnsupportedFormatError(f"不支持的输出格式: {fmt}")
+    if not ffmpeg_available():
+        raise UnsupportedFormatError(
+            f"服务端未安装 ffmpeg，无法输出 {fmt}，请使用 wav 或 pcm"
+        )
+
+
+def transcode(stream: AsyncIterator[bytes], fmt: str) -> AsyncIterator[bytes]:
+    """
+    将后端输出的 WAV 流转换为目标格式
+
+    逐块输入、逐块输出，不等待完整音频：
+    - wav: 原样输出
+    - pcm: 输出 16 位小端 PCM（采样率与声道数与后端输出一致）；后端输出 16 位 PCM 时
+      直接去掉 WAV 头部，其他采样格式通过 ffmpeg 转换
+    - mp3/opus/aac/flac: 通过 ffmpeg 子进程管道编码
+
+    Args:
+        stream: WAV 音频分块
+        fmt: 目标格式
+
+    Returns:
+        目标格式的音频分块迭代器
+    """
+    if fmt == "wav":
+        return stream
+    if fmt == "pcm":
+        return _strip_wav_header(stream)
+    check_format(fmt)
+    return _ffmpeg_encode(stream, fmt)
+
+
+async def _strip_wav_header(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """缓冲到 data 块开始处，之后直接转发 PCM；不是 16 位 PCM 时交给 ffmpeg 转换"""
+    header = b""
+    async for chunk in stream:
+        if header is None:
+            yield chunk
+            continue
+
+        header += chunk
+        try:
+            fmt_chunk, data_offset, _ = locate_wav_data(header)
+        except ValueError:
+            # 头部尚未接收完整
+            continue
+
+        if not _is_s16le(fmt_chunk):
+            if not ffmpeg_available():
+                raise UnsupportedFormatError("后端输出的不是 16 位 PCM，转换为 pcm 需要服务端安装 ffmpeg")
+            async for pcm in _ffmpeg_encode(_prepend(header, stream), "pcm"):
+                yield pcm
+            return
+
+        pcm = header[data_offset:]
+        header = None
+        if pcm:
+            yield pcm
+
+    if header:
+        raise TranscodeError("音频数据不是有效的 WAV")
+
+
+def _is_s16le(fmt_chunk: bytes) -> bool:
+    """fmt 块是否为 16 位整数 PCM"""
+    if len(fmt_chunk) < 16:
+        return False
+    audio_format, _, _, _, _, bits = struct.unpack("<HHIIHH", fmt_chunk[:16])
+    return audio_format in _WAVE_FORMAT_PCM and bits == 16
+
+
+async def _prepend(head: bytes, stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """在流前补回已读取的内容"""
+    yield head
+    async for chunk in stream:
+        yield chunk
+
+
+def _encoder_args(fmt: str) -> List[str]:
+    """各格式的 ffmpeg 输出参数"""
+    args: Dict[str, List[str]] = {
+        "mp3": ["-c:a", "libmp3lame", "-b:a", settings.transcode_mp3_bitrate, "-write_xing", "0", "-f", "mp3"],
+        "opus": ["-c:a", "libopus", "-b:a", settings.transcode_opus_bitrate, "-f", "ogg"],
+        "aac": ["-c:a", "aac", "-b:a", settings.transcode_aac_bitrate, "-f", "adts"],
+        "flac": ["-c:a", "flac", "-f", "flac"],
+        "pcm": ["-c:a", "pcm_s16le", "-f", "s16le"],
+    }
+    return args[fmt]
+
+
+async def _ffmpeg_encode(stream: AsyncIterator[bytes], fmt: str) -> AsyncIterator[bytes]:
+    """
+    通过 ffmpeg 子进程编码
+
+    输入由独立任务写入标准输入，编码结果从标准输出读到即转发；
+    调用方提前停止迭代时结束子进程
+    """
+    process = await asyncio.create_subprocess_exec(
+        settings.transcode_ffmpeg_path,
+        "-hide_banner", "-loglevel", "error", "-nostdin",
+        # 尽快开始解码并及时输出，降低首包延迟
+        "-probesize", "32", "-analyzeduration", "0",
+        "-f", "wav", "-i", "pipe:0",
+        *_encoder_args(fmt),
+        "-flush_packets", "1",
+        "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def _feed() -> None:
+        try:
+            async for chunk in stream:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg 提前退出，错误信息由退出码与标准错误给出
+            return
+        except BaseException:
+            # 上游出错时结束 ffmpeg，避免输出被截断的音频
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+            raise
+        finally:
+            with contextlib.suppress(BrokenPipeError, ConnectionResetError):
+                process.stdin.close()
+
+    feeder = asyncio.create_task(_feed())
+    try:
+        while True:
+            chunk = await process.stdout.read(_READ_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+        # 上游错误优先于 ffmpeg 的退出码
+        await feeder
+        stderr = await process.stderr.read()
+        returncode = await process.wait()
+        if returncode != 0:
+            message = stderr.decode("utf-8", errors="replace").strip()
+            raise TranscodeError(f"{fmt} 编码失败（ffmpeg 退出码 {returncode}）: {message}")
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+        await asyncio.gather(feeder, return_exceptions=True)
+        if process.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+            await process.wait()
@@ -9,6 +9,11 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # 设置测试环境
 os.environ["TTS_GATEWAY_MOCK_MODE"] = "true"
+# 默认关闭合成结果缓存，避免用例之间互相影响；缓存用例自行构造实例
+# （直接修改配置实例，config.yaml 中开启的缓存不受环境变量影响）
+from gateway.config import settings  # noqa: E402
+
+settings.cache_enabled = False
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -115,6 +115,2061 @@ class TestAdapterFactory:
         assert adapter is not None
 
 
+class TestAdapterConnectionPool:
+    """测试适配器连接池"""
+
+    @pytest.mark.asyncio
+    async def test_client_is_shared(self):
+        """测试同一适配器复用同一个客户端"""
+        from gateway.adapters.qwen_adapter import QwenTTSAdapter
+
+        adapter = QwenTTSAdapter(base_url="http://localhost:8019")
+        await adapter.open()
+        client = adapter.client
+        assert adapter.client is client
+
+        await adapter.aclose()
+        assert client.is_closed
+
+    @pytest.mark.asyncio
+    async def test_requests_go_through_pool(self):
+        """测试请求经由共享客户端发出"""
+        import httpx
+        from gateway.adapters.indextts_adapter import IndexTTSAdapter
+
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request.url.path)
+            return httpx.Response(200, json={"status": "running", "service": "IndexTTS"})
+
+        adapter = IndexTTSAdapter(base_url="http://indextts")
+        adapter._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        status = await adapter.get_status()
+        await adapter.get_status()
+
+        assert status.online is True
+        assert calls == ["/", "/"]
+        await adapter.aclose()
+
+    @pytest.mark.asyncio
+    async def test_factory_shutdown_closes_clients(self):
+        """测试工厂关闭时释放连接池"""
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.adapters.qwen_adapter import QwenTTSAdapter
+
+        AdapterFactory.reset()
+        adapter = QwenTTSAdapter(base_url="http://localhost:8019")
+        AdapterFactory.register("pool-test", adapter)
+        AdapterFactory._initialized = True
+
+        await AdapterFactory.startup()
+        client = adapter.client
+        await AdapterFactory.shutdown()
+
+        assert client.is_closed
+        assert AdapterFactory._adapters == {}
+
+
+class TestFanOut:
+    """测试跨后端并发聚合"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_with_partial_results(self):
+        """测试并发执行，超时和出错的项不影响其他项"""
+        import time
+        from gateway.utils.concurrency import fan_out
+
+        async def call(delay):
+            if delay < 0:
+                raise RuntimeError("boom")
+            await asyncio.sleep(delay)
+            return delay
+
+        started = time.monotonic()
+        results = await fan_out({"a": 0.1, "b": 0.1, "slow": 10, "bad": -1}, call, timeout=0.3)
+        elapsed = time.monotonic() - started
+
+        assert elapsed < 0.5
+        assert list(results) == ["a", "b", "slow", "bad"]
+        assert results["a"] == 0.1 and results["b"] == 0.1
+        assert isinstance(results["slow"], TimeoutError)
+        assert isinstance(results["bad"], RuntimeError)
+
+    @pytest.mark.asyncio
+    async def test_list_voices_skips_slow_backend(self, reset_adapters):
+        """测试音色列表不被无响应的后端拖住"""
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.services.voice_service import VoiceService
+
+        slow = AdapterFactory.get("qwen3-tts")
+
+        async def hang():
+            await asyncio.sleep(10)
+
+        with patch.object(slow, "probe_timeout", 0.1), patch.object(slow, "list_voices", side_effect=hang):
+            response = await VoiceService().list_all_voices()
+
+        assert response.total > 0
+        assert {v.backend for v in response.voices} == {"indextts-2.0"}
+
+
+class TestVoiceCatalog:
+    """测试音色目录缓存"""
+
+    @pytest.fixture
+    def service(self, reset_adapters):
+        from gateway.services.voice_service import VoiceService
+        return VoiceService(catalog_ttl=60, catalog_refresh_interval=0)
+
+    @pytest.mark.asyncio
+    async def test_repeated_listing_uses_cache(self, service):
+        """测试重复查询不再请求后端"""
+        from gateway.adapters.factory import AdapterFactory
+
+        adapter = AdapterFactory.get("indextts-2.0")
+        with patch.object(adapter, "list_voices", wraps=adapter.list_voices) as list_voices:
+            for _ in range(5):
+                response = await service.list_all_voices()
+            assert list_voices.call_count == 1
+
+        assert response.total > 0
+        assert response.catalog_age is not None
+
+    @pytest.mark.asyncio
+    async def test_stale_served_while_refreshing(self, service):
+        """测试目录过期时先返回旧数据，后台刷新"""
+        from gateway.adapters.base import VoiceItem
+        from gateway.adapters.factory import AdapterFactory
+
+        adapter = AdapterFactory.get("indextts-2.0")
+        await service.list_voices_by_backend("indextts-2.0")
+        service.catalog_ttl = 0
+
+        release = asyncio.Event()
+
+        async def slow_list():
+            await release.wait()
+            return [VoiceItem(id="fresh", name="fresh")]
+
+        with patch.object(adapter, "list_voices", side_effect=slow_list):
+            stale = await service.list_voices_by_backend("indextts-2.0")
+            assert "fresh" not in {v.id for v in stale.voices}
+
+            release.set()
+            await asyncio.sleep(0.01)
+            fresh = await service.list_voices_by_backend("indextts-2.0")
+
+        assert [v.id for v in fresh.voices] == ["fresh"]
+
+    @pytest.mark.asyncio
+    async def test_backend_failure_keeps_catalog(self, service):
+        """测试后端故障时刷新失败，保留原有目录而不是替换为空列表"""
+        import httpx
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.adapters.indextts_adapter import IndexTTSAdapter
+
+        backend = IndexTTSAdapter(base_url="http://indextts")
+        backend._client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(503))
+        )
+        with pytest.raises(httpx.HTTPStatusError):
+            await backend.list_voices()
+
+        adapter = AdapterFactory.get("indextts-2.0")
+        before = await service.list_voices_by_backend("indextts-2.0")
+        service.catalog_ttl = 0
+
+        with patch.object(adapter, "list_voices", side_effect=backend.list_voices):
+            with pytest.raises(httpx.HTTPStatusError):
+                await service._refresh_catalog(adapter)
+            after = await service.list_voices_by_backend("indextts-2.0")
+            await asyncio.sleep(0.01)
+        await backend.aclose()
+
+        assert before.total > 0
+        assert [v.id for v in after.voices] == [v.id for v in before.voices]
+
+    @pytest.mark.asyncio
+    async def test_upload_invalidates_catalog(self, service, tmp_path):
+        """测试上传音色后立即出现在列表中"""
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.services.metadata_service import MetadataService
+
+        adapter = AdapterFactory.get("indextts-2.0")
+        await service.list_voices_by_backend("indextts-2.0")
+
+        with patch.object(adapter, "_voices", list(adapter._voices)), \
+                patch("gateway.services.voice_service.metadata_service", MetadataService(data_path=tmp_path)):
+            result = await service.upload_voice(b"RIFF", "a.wav", "new_voice", "indextts-2.0")
+            assert result["success"]
+            response = await service.list_voices_by_backend("indextts-2.0")
+
+        assert "new_voice" in {v.id for v in response.voices}
+
+
+class TestHealthMonitor:
+    """测试健康监控与熔断"""
+
+    def test_circuit_breaker_transitions(self):
+        """测试熔断器 closed -> open -> half_open -> closed"""
+        import time
+        from gateway.adapters.health import CircuitBreaker
+
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+        breaker.record_failure()
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow_request()
+
+        time.sleep(0.06)
+        # 只读查询不占用试探机会
+        assert breaker.available() and breaker.available()
+        assert breaker.state == "open"
+        assert breaker.allow_request()
+        assert breaker.state == "half_open"
+        # 每个恢复周期只放行一次试探
+        assert not breaker.available()
+        assert not breaker.allow_request()
+
+        breaker.record_failure()
+        assert breaker.state == "open"
+        time.sleep(0.06)
+        assert breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == "closed"
+        assert breaker.allow_request()
+
+    @pytest.mark.asyncio
+    async def test_probe_failures_open_circuit(self, reset_adapters):
+        """测试探测连续失败后熔断，路由跳过该后端"""
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.adapters.health import health_monitor
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.tts_service import TTSService
+        from gateway.adapters import BackendUnavailableError
+
+        adapter = AdapterFactory.get("indextts-2.0")
+        with patch.object(adapter, "get_status", side_effect=RuntimeError("down")):
+            for _ in range(health_monitor.failure_threshold):
+                await health_monitor.probe_all({"indextts-2.0": adapter})
+
+        assert health_monitor.get("indextts-2.0").describe()["circuit"] == "open"
+        assert (await AdapterFactory.auto_select()).backend_id == "qwen3-tts"
+
+        with pytest.raises(BackendUnavailableError):
+            await TTSService().generate_speech(TTSRequest(model="indextts-2.0", input="测试", voice="alloy"))
+
+    @pytest.mark.asyncio
+    async def test_status_served_from_cache(self, reset_adapters):
+        """测试后台监控运行时状态查询使用缓存"""
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.adapters.health import HealthMonitor
+
+        monitor = HealthMonitor(interval=60)
+        adapters = AdapterFactory.get_all()
+        await monitor.start(AdapterFactory.get_all)
+        try:
+            with patch.object(adapters["qwen3-tts"], "get_status", wraps=adapters["qwen3-tts"].get_status) as get_status:
+                for _ in range(3):
+                    healths = await monitor.get_statuses(adapters)
+                assert get_status.call_count == 1
+        finally:
+            await monitor.stop()
+
+        assert healths["qwen3-tts"].describe()["status"] == "online"
+        assert healths["qwen3-tts"].checked_at is not None
+
+    @pytest.mark.asyncio
+    async def test_healthy_adapter_check_keeps_trial(self, reset_adapters):
+        """测试查询健康适配器不占用半开状态的试探机会"""
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.adapters.health import health_monitor
+
+        health = await health_monitor.probe(AdapterFactory.get("qwen3-tts"))
+        # 恢复时间已过、尚未试探的熔断器
+        health.breaker.state = "open"
+
+        with patch.object(health_monitor, "get_status", return_value=health):
+            assert await AdapterFactory.get_healthy_adapter("qwen3-tts") is not None
+            assert await AdapterFactory.get_healthy_adapter("qwen3-tts") is not None
+        assert health.breaker.state == "open"
+        assert health_monitor.allow_request("qwen3-tts")
+        assert health.breaker.state == "half_open"
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_skips_circuit(self, tmp_path, reset_adapters):
+        """测试缓存命中不受熔断影响，也不占用半开状态的试探机会"""
+        import time
+        from gateway.adapters import BackendUnavailableError
+        from gateway.adapters.health import health_monitor
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.cache_service import SynthesisCache
+        from gateway.services.tts_service import TTSService
+
+        service = TTSService(cache=SynthesisCache(cache_dir=tmp_path))
+        request = TTSRequest(model="qwen3-tts", input="熔断时的缓存", voice="alloy")
+        await service.generate_speech(request)
+
+        breaker = health_monitor.get("qwen3-tts").breaker
+        breaker.state = "open"
+        breaker._next_trial_at = time.monotonic() + 60
+        _, metadata = await service.generate_speech(request)
+        assert metadata["cache"] == "HIT"
+        with pytest.raises(BackendUnavailableError):
+            await service.generate_speech(request, use_cache=False)
+
+        # 恢复时间已过：缓存命中不占用试探，试探留给实际请求后端的合成
+        breaker._next_trial_at = 0.0
+        await service.generate_speech(request)
+        assert breaker.state == "open"
+        await service.generate_speech(request, use_cache=False)
+        assert breaker.state == "closed"
+
+
+class TestReplicaPool:
+    """测试多副本负载均衡"""
+
+    def _make_pool(self, count=3, **kwargs):
+        from gateway.adapters.mock_adapter import MockAdapter
+        from gateway.adapters.pool import ReplicaPool
+        replicas = [MockAdapter(backend_id="indextts-2.0") for _ in range(count)]
+        for i, replica in enumerate(replicas):
+            replica.base_url = f"mock://gpu-{i}"
+        return ReplicaPool(replicas, **kwargs)
+
+    @pytest.mark.asyncio
+    async def test_least_outstanding_spreads_load(self):
+        """测试并发请求均匀分配到各副本"""
+        pool = self._make_pool()
+        calls = []
+
+        def slow(replica):
+            async def _generate(text, voice, **kwargs):
+                calls.append(replica.adapter.base_url)
+                await asyncio.sleep(0.05)
+                return b"audio"
+            return _generate
+
+        for replica in pool.replicas:
+            replica.adapter.generate_speech = slow(replica)
+
+        await asyncio.gather(*[pool.generate_speech("hi", "alloy") for _ in range(6)])
+
+        assert sorted(calls) == sorted([f"mock://gpu-{i}" for i in range(3)] * 2)
+        assert all(r.outstanding == 0 and r.latency > 0 for r in pool.replicas)
+
+    def test_weighted_round_robin(self):
+        """测试按权重轮询"""
+        pool = self._make_pool(count=2, weights=[2, 1], policy="weighted_round_robin")
+        picks = [pool.select().adapter.base_url for _ in range(6)]
+        assert picks.count("mock://gpu-0") == 4
+        assert picks.count("mock://gpu-1") == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_replica_skipped(self):
+        """测试连接失败的副本被跳过，探测恢复后重新启用"""
+        import httpx
+
+        pool = self._make_pool(count=2)
+        broken = pool.replicas[0]
+        with patch.object(broken.adapter, "generate_speech", side_effect=httpx.ConnectError("refused")):
+            with pytest.raises(httpx.ConnectError):
+                await pool.generate_speech("hi", "alloy")
+            assert not broken.healthy
+            for _ in range(3):
+                await pool.generate_speech("hi", "alloy")
+
+        status = await pool.get_status()
+        assert status.online and broken.healthy
+
+    @pytest.mark.asyncio
+    async def test_upload_to_all_replicas(self):
+        """测试上传音色同步到所有副本"""
+        pool = self._make_pool(count=2)
+        result = await pool.upload_voice(b"RIFF", "a.wav", "shared_voice")
+        assert result["success"]
+        for replica in pool.replicas:
+            assert "shared_voice" in {v.id for v in await replica.adapter.list_voices()}
+
+    @pytest.mark.asyncio
+    async def test_upload_rejects_mismatched_voice_ids(self):
+        """测试各副本返回的音色 ID 不一致时上传失败"""
+        pool = self._make_pool(count=2)
+        renamed = {"success": True, "voice_id": "shared_voice_2", "message": "ok"}
+
+        with patch.object(pool.replicas[1].adapter, "upload_voice", return_value=renamed):
+            result = await pool.upload_voice(b"RIFF", "a.wav", "shared_voice")
+
+        assert not result["success"]
+        assert "shared_voice_2" in result["message"]
+
+    def test_factory_builds_pool_from_urls(self, reset_adapters):
+        """测试配置多个 URL 时创建副本池"""
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.adapters.pool import ReplicaPool
+        from gateway.config import settings
+
+        with patch("gateway.adapters.factory.is_mock_mode", return_value=False), \
+                patch.object(settings, "indextts_urls", ["http://gpu-1:8080", "http://gpu-2:8080"]), \
+                patch.object(settings, "indextts_balance_policy", "p2c"):
+            AdapterFactory.initialize()
+            adapter = AdapterFactory.get("indextts-2.0")
+
+        assert isinstance(adapter, ReplicaPool)
+        assert adapter.policy == "p2c"
+        assert [r.adapter.base_url for r in adapter.replicas] == ["http://gpu-1:8080", "http://gpu-2:8080"]
+        assert not isinstance(AdapterFactory.get("qwen3-tts"), ReplicaPool)
+
+
+class TestAdmissionControl:
+    """测试后端准入控制"""
+
+    @pytest.mark.asyncio
+    async def test_limits_concurrency_in_fifo_order(self):
+        """测试并发数不超过上限，排队请求按到达顺序执行"""
+        from gateway.services.admission_service import AdmissionController
+
+        controller = AdmissionController("indextts-2.0", max_concurrency=2, max_queue=10)
+        order, peak = [], []
+
+        async def work(i):
+            async with controller.slot():
+                order.append(i)
+                peak.append(controller.active)
+                await asyncio.sleep(0.02)
+
+        tasks = []
+        for i in range(6):
+            tasks.append(asyncio.create_task(work(i)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+        assert order == list(range(6))
+        assert max(peak) == 2
+        stats = controller.stats()
+        assert stats["active"] == 0 and stats["queued"] == 0
+        assert stats["admitted_total"] == 6
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_queue_full_or_wait_exceeded(self):
+        """测试队列已满或排队超时时拒绝并给出重试时间"""
+        from gateway.services.admission_service import AdmissionController, AdmissionRejectedError
+
+        controller = AdmissionController("indextts-2.0", max_concurrency=1, max_queue=1, max_queue_wait=0.05)
+        await controller.acquire()
+
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejectedError) as rejected:
+            await controller.acquire()
+        assert rejected.value.retry_after >= 1
+
+        with pytest.raises(AdmissionRejectedError):
+            await waiting
+        assert controller.stats()["rejected_total"] == 2
+
+        controller.release()
+        assert controller.active == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        """测试排队中被取消的请求不占用名额"""
+        from gateway.services.admission_service import AdmissionController
+
+        controller = AdmissionController("indextts-2.0", max_concurrency=1, max_queue=5)
+        await controller.acquire()
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+
+        controller.release()
+        assert controller.active == 0
+        await asyncio.wait_for(controller.acquire(), 0.1)
+
+    @pytest.mark.asyncio
+    async def test_limit_scales_with_healthy_replicas(self):
+        """测试总上限为每副本上限乘以健康副本数"""
+        from gateway.services.admission_service import AdmissionController
+
+        healthy = 2
+        controller = AdmissionController("indextts-2.0", max_concurrency=1, max_queue=5, replicas=lambda: healthy)
+        await controller.acquire()
+        await controller.acquire()
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert not waiting.done()
+
+        # 一个副本故障后上限收缩，释放的名额不再转交
+        healthy = 1
+        controller.release()
+        await asyncio.sleep(0)
+        assert not waiting.done() and controller.active == 1
+
+        # 副本恢复后排队的请求获得名额
+        healthy = 2
+        controller.release()
+        await asyncio.wait_for(waiting, 0.1)
+        assert controller.active == 1
+
+    def test_overload_returns_503_with_retry_after(self):
+        """测试满载时接口返回 503 与 Retry-After"""
+        from fastapi.testclient import TestClient
+        from gateway.main import app
+        from gateway.services.admission_service import AdmissionRejectedError
+
+        rejection = AdmissionRejectedError("busy", retry_after=7)
+        with patch("gateway.api.v1.audio.tts_service.stream_speech", side_effect=rejection):
+            response = TestClient(app).post(
+                "/v1/audio/speech", json={"model": "indextts-2.0", "input": "测试", "voice": "alloy"}
+            )
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "7"
+
+
+class TestBatchSynthesis:
+    """测试批量合成"""
+
+    @pytest.mark.asyncio
+    async def test_bounded_concurrency_and_per_item_errors(self):
+        """测试并发数受限，单条失败不影响其他条目"""
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.tts_service import TTSService
+
+        service = TTSService()
+        active, peak = 0, 0
+
+        async def fake_generate(request, use_cache=True):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            if request.input == "bad":
+                raise ValueError("boom")
+            return request.input.encode(), {"model_used": "mock"}
+
+        requests = [TTSRequest(input=text) for text in ("a", "bad", "c", "d", "e")]
+        with patch.object(service, "generate_speech", side_effect=fake_generate):
+            results = dict([item async for item in service.generate_batch(requests, concurrency=2)])
+
+        assert peak == 2
+        assert sorted(results) == [0, 1, 2, 3, 4]
+        assert isinstance(results[1], ValueError)
+        assert results[3][0] == b"d"
+
+    def test_endpoint_streams_ndjson(self):
+        """测试批量接口逐行返回 base64 音频与错误"""
+        import base64
+        import json
+        from fastapi.testclient import TestClient
+        from gateway.adapters import BackendUnavailableError
+        from gateway.main import app
+
+        async def fake_batch(requests, concurrency, use_cache=True):
+            yield 1, BackendUnavailableError("down")
+            yield 0, (b"RIFF", {"model_used": "mock", "cache": "MISS"})
+
+        with patch("gateway.api.v1.audio.tts_service.generate_batch", side_effect=fake_batch):
+            response = TestClient(app).post(
+                "/v1/audio/speech/batch",
+                json={"items": [{"input": "一"}, {"input": "二"}]},
+            )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[0] == {"index": 1, "success": False, "status": 503, "error": "down"}
+        assert lines[1]["success"] and base64.b64decode(lines[1]["audio"]) == b"RIFF"
+
+    def test_unknown_model_is_client_error(self, reset_adapters):
+        """测试未知模型在批量结果与单条请求中都返回 400"""
+        import json
+        from fastapi.testclient import TestClient
+        from gateway.main import app
+
+        client = TestClient(app)
+        response = client.post(
+            "/v1/audio/speech/batch",
+            json={"items": [{"input": "一", "model": "no-such-model"}]},
+        )
+        line = json.loads(response.text.splitlines()[0])
+        assert line["status"] == 400 and "未知的模型" in line["error"]
+
+        response = client.post("/v1/audio/speech", json={"input": "一", "model": "no-such-model"})
+        assert response.status_code == 400
+
+    def test_failed_items_refund_quota(self):
+        """测试批量中失败的条目在结果返回时退还配额"""
+        from fastapi.testclient import TestClient
+        from gateway.adapters import BackendUnavailableError
+        from gateway.api.v1 import audio
+        from gateway.main import app
+        from gateway.services.quota_service import QuotaService
+
+        async def fake_batch(requests, concurrency, use_cache=True):
+            yield 0, BackendUnavailableError("down")
+            yield 1, (b"RIFF", {"model_used": "mock", "cache": "MISS"})
+
+        quota = QuotaService(enabled=True, limits={("ip", "minute"): 10})
+        with patch.object(audio, "quota_service", quota), \
+                patch("gateway.api.v1.audio.tts_service.generate_batch", side_effect=fake_batch):
+            client = TestClient(app)
+            response = client.post(
+                "/v1/audio/speech/batch",
+                json={"items": [{"input": "一二三"}, {"input": "四五"}]},
+            )
+            assert response.status_code == 200
+            assert response.headers["X-Quota-Cost"] == "5"
+
+            # 失败条目的 3 个字已退还，只有成功的 2 个字被计入
+            response = client.post("/v1/audio/speech", json={"input": "测" * 8})
+        assert response.status_code == 200
+        assert response.headers["X-Quota-Remaining-Minute"] == "0"
+
+    def test_rejects_oversized_batch(self):
+        """测试超过条数上限时返回 400"""
+        from fastapi.testclient import TestClient
+        from gateway.config import settings
+        from gateway.main import app
+
+        items = [{"input": "测试"}] * (settings.batch_max_items + 1)
+        response = TestClient(app).post("/v1/audio/speech/batch", json={"items": items})
+        assert response.status_code == 400
+
+
+class TestAsyncJobs:
+    """测试异步合成任务"""
+
+    async def _wait_finished(self, service, job_id):
+        for _ in range(200):
+            job = await service.get(job_id)
+            if job.finished:
+                return job
+            await asyncio.sleep(0.01)
+        raise AssertionError("任务未完成")
+
+    @pytest.mark.asyncio
+    async def test_job_runs_in_background(self, tmp_path, reset_adapters):
+        """测试任务在后台完成并写入音频存储"""
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.audio_store import AudioStore
+        from gateway.services.job_service import JOB_FAILED, JOB_SUCCEEDED, JobService, JobStore
+        from gateway.services.tts_service import TTSService
+
+        service = JobService(
+            tts=TTSService(store=AudioStore(tmp_path)), workers=1, store=JobStore(tmp_path / "jobs.db")
+        )
+        await service.start()
+        try:
+            ok = await service.submit(TTSRequest(model="indextts-2.0", input="你好"))
+            bad = await service.submit(TTSRequest(model="unknown-model", input="你好"))
+
+            job = await self._wait_finished(service, ok.id)
+            assert job.status == JOB_SUCCEEDED
+            assert job.duration and job.duration > 0
+            store = service.tts.store
+            assert store.path(store.get(job.audio_id)).read_bytes()[:4] == b"RIFF"
+
+            failed = await self._wait_finished(service, bad.id)
+            assert failed.status == JOB_FAILED and failed.error
+        finally:
+            await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_failed_job_refunds_quota(self, tmp_path, reset_adapters):
+        """测试任务失败时退还提交时扣除的配额"""
+        from starlette.requests import Request
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.audio_store import AudioStore
+        from gateway.services.job_service import JOB_FAILED, JobService, JobStore
+        from gateway.services.quota_service import QuotaService
+        from gateway.services.tts_service import TTSService
+
+        quota = QuotaService(enabled=True, limits={("ip", "minute"): 10})
+        connection = Request({"type": "http", "client": ("1.2.3.4", 1), "headers": []})
+        request = TTSRequest(model="unknown-model", input="一二三四五六")
+        charge = await quota.charge(connection, [request])
+
+        service = JobService(
+            tts=TTSService(store=AudioStore(tmp_path)), workers=1, store=JobStore(tmp_path / "jobs.db")
+        )
+        await service.start()
+        try:
+            job = await service.submit(request, charge)
+            assert (await self._wait_finished(service, job.id)).status == JOB_FAILED
+        finally:
+            await service.stop()
+
+        # 6 个字已退还，可以再扣除 10 个字
+        assert (await quota.charge(connection, [TTSRequest(input="一" * 10)])).headers()[
+            "X-Quota-Remaining-Minute"
+        ] == "0"
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_queue_full(self, tmp_path):
+        """测试排队任务达到上限时拒绝提交"""
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.job_service import JobQueueFullError, JobService, JobStore
+
+        async def slow_stream(request):
+            await asyncio.sleep(10)
+
+        tts = MagicMock()
+        tts.stream_speech = slow_stream
+        service = JobService(tts=tts, workers=1, max_queue=1, store=JobStore(tmp_path / "jobs.db"))
+        await service.start()
+        try:
+            await service.submit(TTSRequest(input="一"))
+            await asyncio.sleep(0)
+            await service.submit(TTSRequest(input="二"))
+            with pytest.raises(JobQueueFullError):
+                await service.submit(TTSRequest(input="三"))
+        finally:
+            await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_job_visible_from_other_worker(self, tmp_path, reset_adapters):
+        """测试任务状态保存在共享存储中，其他 worker 进程可以查询"""
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.audio_store import AudioStore
+        from gateway.services.job_service import JOB_SUCCEEDED, JobService, JobStore
+        from gateway.services.tts_service import TTSService
+
+        service = JobService(
+            tts=TTSService(store=AudioStore(tmp_path)), workers=1, store=JobStore(tmp_path / "jobs.db")
+        )
+        other = JobService(workers=1, store=JobStore(tmp_path / "jobs.db"))
+        await service.start()
+        try:
+            request = TTSRequest(model="indextts-2.0", input="你好").model_copy(update={"save_name": "alice/clip"})
+            job = await service.submit(request)
+            await self._wait_finished(service, job.id)
+        finally:
+            await service.stop()
+
+        seen = await other.get(job.id)
+        assert seen.status == JOB_SUCCEEDED and seen.audio_id
+        assert seen.request.save_name == "alice/clip"
+
+    @pytest.mark.asyncio
+    async def test_orphaned_jobs_recovered(self, tmp_path):
+        """测试接手本机已退出进程遗留的任务：排队中的重新执行，执行中的标记为失败"""
+        import socket
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.job_service import JOB_FAILED, JOB_RUNNING, Job, JobService, JobStore
+
+        store = JobStore(tmp_path / "jobs.db")
+        dead = f"{socket.gethostname()}:999999999"
+        queued, running = Job(TTSRequest(input="一")), Job(TTSRequest(input="二"))
+        queued.worker = running.worker = dead
+        running.status = JOB_RUNNING
+        await store.put(queued)
+        await store.put(running)
+
+        executed = []
+
+        async def fake_stream(request):
+            executed.append(request.input)
+            raise RuntimeError("stop")
+
+        tts = MagicMock()
+        tts.stream_speech = fake_stream
+        service = JobService(tts=tts, workers=1, store=store)
+        await service.start()
+        try:
+            await self._wait_finished(service, queued.id)
+        finally:
+            await service.stop()
+
+        assert executed == ["一"]
+        assert (await store.get(queued.id)).worker == service.worker_id
+        assert (await store.get(running.id)).status == JOB_FAILED
+
+class TestAudioStore:
+    """测试内容寻址音频存储"""
+
+    @staticmethod
+    async def _save(store, chunks, fmt="wav", name=None):
+        writer = store.writer(fmt)
+        for chunk in chunks:
+            await writer.write(chunk)
+        return await writer.commit(name)
+
+    @pytest.mark.asyncio
+    async def test_streamed_wav_finalized_and_deduplicated(self, tmp_path):
+        """测试流式写入的 WAV 头部被补全，相同内容只保存一份"""
+        import struct
+        from gateway.services.audio_store import AudioStore
+        from gateway.utils.audio import build_wav_header, parse_wav
+
+        fmt_chunk = struct.pack("<HHIIHH", 1, 1, 16000, 32000, 2, 16)
+        pcm = b"\x01\x02" * 16000
+
+        chunks = [build_wav_header(fmt_chunk), pcm[:1000], pcm[1000:]]
+
+        store = AudioStore(tmp_path)
+        first = await self._save(store, chunks, name="greeting")
+        second = await self._save(store, chunks)
+
+        assert first.audio_id == second.audio_id
+        assert first.duration == pytest.approx(1.0)
+        data = store.path(first).read_bytes()
+        assert parse_wav(data) == (fmt_chunk, pcm)
+        assert struct.unpack("<I", data[4:8])[0] == len(data) - 8
+        assert not list((tmp_path / "tmp").iterdir())
+
+        # 其他进程（另一个实例）保存后立即可按 ID 与名称找到
+        other = AudioStore(tmp_path)
+        assert other.resolve("greeting").audio_id == first.audio_id
+        third = await self._save(store, [b"RIFF-other"], name="later")
+        assert other.resolve("later").audio_id == third.audio_id
+        assert other.get(third.audio_id) is not None
+
+    @pytest.mark.asyncio
+    async def test_retention_evicts_oldest(self, tmp_path):
+        """测试总大小超过上限时删除最早保存的音频及其名称"""
+        from gateway.services import audio_store as audio_store_module
+        from gateway.services.audio_store import AudioStore
+
+        store = AudioStore(tmp_path, max_bytes=250)
+        with patch.object(audio_store_module, "_SWEEP_INTERVAL", 0):
+            old = await self._save(store, [b"a" * 100], fmt="mp3", name="old")
+            await asyncio.sleep(0.01)
+            kept = await self._save(store, [b"b" * 100], fmt="mp3")
+            await asyncio.sleep(0.01)
+            new = await self._save(store, [b"c" * 100], fmt="mp3")
+
+        assert store.get(old.audio_id) is None and store.resolve("old") is None
+        assert not store.path(old).exists()
+        assert store.get(kept.audio_id) is not None
+        assert store.path(new).exists()
+
+    @pytest.mark.asyncio
+    async def test_save_audio_option(self, tmp_path, reset_adapters):
+        """测试 save_audio 在输出音频的同时保存"""
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.audio_store import AudioStore
+        from gateway.services.tts_service import TTSService
+
+        service = TTSService(store=AudioStore(tmp_path))
+        request = TTSRequest(model="indextts-2.0", input="你好", save_audio=True, save_name="clip")
+        audio, metadata = await service.generate_speech(request)
+
+        record = service.store.resolve("clip")
+        assert record.audio_id == metadata["audio_id"]
+        assert service.store.path(record).read_bytes() == audio
+
+    def test_serves_range_and_etag(self, tmp_path):
+        """测试下载支持 Range 与 If-None-Match"""
+        from fastapi.testclient import TestClient
+        from gateway.main import app
+        from gateway.services.audio_store import AudioStore
+
+        store = AudioStore(tmp_path)
+        record = asyncio.run(self._save(store, [b"RIFF0123456789"], name="clip"))
+        with patch("gateway.api.v1.audio.audio_store", store):
+            client = TestClient(app)
+            ranged = client.get(f"/v1/audio/files/{record.audio_id}", headers={"Range": "bytes=4-7"})
+            cached = client.get("/v1/audio/files/clip", headers={"If-None-Match": f'"{record.audio_id}"'})
+            missing = client.get("/v1/audio/files/../../etc/passwd")
+
+        assert ranged.status_code == 206
+        assert ranged.content == b"0123"
+        assert ranged.headers["content-type"] == "audio/wav"
+        assert ranged.headers["etag"] == f'"{record.audio_id}"'
+        assert cached.status_code == 304
+        assert missing.status_code == 404
+
+    def test_save_name_scoped_to_private_key(self, tmp_path, reset_adapters):
+        """测试 save_name 需要密钥，且只能用同一密钥下载"""
+        from fastapi.testclient import TestClient
+        from gateway.api.v1.audio import tts_service
+        from gateway.main import app
+        from gateway.services.audio_store import AudioStore
+
+        store = AudioStore(tmp_path)
+        body = {"model": "indextts-2.0", "input": "你好", "save_audio": True, "save_name": "clip"}
+        with patch("gateway.api.v1.audio.audio_store", store), patch.object(tts_service, "store", store):
+            client = TestClient(app)
+            anonymous = client.post("/v1/audio/speech", json=body)
+            saved = client.post("/v1/audio/speech", json=body, headers={"X-Private-Key": "alice-key"})
+            owner = client.get("/v1/audio/files/clip", headers={"X-Private-Key": "alice-key"})
+            other = client.get("/v1/audio/files/clip", headers={"X-Private-Key": "bob-key"})
+            no_key = client.get("/v1/audio/files/clip")
+
+        assert anonymous.status_code == 400
+        assert saved.status_code == 200 and saved.headers["X-Audio-Name"] == "clip"
+        assert owner.status_code == 200 and owner.content == saved.content
+        assert other.status_code == 404
+        assert no_key.status_code == 404
+
+
+class TestTranscode:
+    """测试网关侧转码"""
+
+    @staticmethod
+    def _fake_ffmpeg(tmp_path, body):
+        """生成一个替代 ffmpeg 的脚本"""
+        import sys
+        script = tmp_path / "fake-ffmpeg"
+        script.write_text(f"#!{sys.executable}\nimport sys\n{body}\n")
+        script.chmod(0o755)
+        return str(script)
+
+    @pytest.mark.asyncio
+    async def test_pcm_strips_header_across_chunks(self):
+        """测试 pcm 输出去掉跨分块到达的 WAV 头部"""
+        import struct
+        from gateway.utils.audio import build_wav_header
+        from gateway.utils.transcode import transcode
+
+        wav = build_wav_header(struct.pack("<HHIIHH", 1, 1, 24000, 48000, 2, 16)) + b"\x01\x02" * 100
+
+        async def chunks():
+            for i in range(0, len(wav), 7):
+                yield wav[i:i + 7]
+
+        pcm = b"".join([chunk async for chunk in transcode(chunks(), "pcm")])
+        assert pcm == b"\x01\x02" * 100
+
+    @pytest.mark.asyncio
+    async def test_pcm_converts_other_sample_formats(self, tmp_path):
+        """测试后端输出不是 16 位 PCM 时 pcm 通过 ffmpeg 转换，未安装 ffmpeg 时报错"""
+        import struct
+        from gateway.config import settings
+        from gateway.utils.audio import build_wav_header
+        from gateway.utils.transcode import UnsupportedFormatError, transcode
+
+        wav = build_wav_header(struct.pack("<HHIIHH", 3, 1, 24000, 96000, 4, 32)) + b"\x00" * 40
+
+        async def chunks():
+            yield wav[:10]
+            yield wav[10:]
+
+        args = tmp_path / "args"
+        ffmpeg = self._fake_ffmpeg(
+            tmp_path,
+            f"open({str(args)!r}, 'w').write(' '.join(sys.argv)); "
+            "sys.stdout.buffer.write(b'S16' if sys.stdin.buffer.read().startswith(b'RIFF') else b'')",
+        )
+        with patch.object(settings, "transcode_ffmpeg_path", ffmpeg):
+            pcm = b"".join([chunk async for chunk in transcode(chunks(), "pcm")])
+        assert pcm == b"S16"
+        assert "pcm_s16le" in args.read_text()
+
+        with patch.object(settings, "transcode_ffmpeg_path", "/nonexistent/ffmpeg"):
+            with pytest.raises(UnsupportedFormatError, match="ffmpeg"):
+                async for _ in transcode(chunks(), "pcm"):
+                    pass
+
+    @pytest.mark.asyncio
+    async def test_ffmpeg_pipe_streams_and_reports_errors(self, tmp_path):
+        """测试通过子进程管道编码，编码失败时抛出错误"""
+        from gateway.config import settings
+        from gateway.utils.transcode import TranscodeError, transcode
+
+        async def chunks():
+            for part in (b"RIFF", b"-payload-", b"end"):
+                yield part
+
+        copy = self._fake_ffmpeg(tmp_path, "sys.stdout.buffer.write(sys.stdin.buffer.read())")
+        with patch.object(settings, "transcode_ffmpeg_path", copy):
+            encoded = b"".join([chunk async for chunk in transcode(chunks(), "mp3")])
+        assert encoded == b"RIFF-payload-end"
+
+        fail = self._fake_ffmpeg(tmp_path, "sys.stdin.buffer.read(); sys.stderr.write('bad codec'); sys.exit(1)")
+        with patch.object(settings, "transcode_ffmpeg_path", fail):
+            with pytest.raises(TranscodeError, match="bad codec"):
+                async for _ in transcode(chunks(), "opus"):
+                    pass
+
+    def test_compressed_format_without_ffmpeg(self):
+        """测试未安装 ffmpeg 时请求压缩格式返回 400"""
+        from fastapi.testclient import TestClient
+        from gateway.config import settings
+        from gateway.main import app
+
+        with patch.object(settings, "transcode_ffmpeg_path", "/nonexistent/ffmpeg"):
+            response = TestClient(app).post(
+                "/v1/audio/speech", json={"input": "测试", "response_format": "aac"}
+            )
+        assert response.status_code == 400
+        assert "ffmpeg" in response.json()["detail"]
+
+
+class TestMetrics:
+    """测试 Prometheus 指标导出"""
+
+    def test_render_counter_and_histogram(self):
+        """测试文本格式：标签转义、直方图累计分桶与 +Inf"""
+        from gateway.utils.metrics import Registry
+
+        registry = Registry()
+        calls = registry.counter("calls_total", "调用次数", ("backend",))
+        latency = registry.histogram("latency_seconds", "耗时", ("backend",), buckets=(0.1, 1.0))
+        calls.labels('a"b').inc()
+        calls.labels('a"b').inc(2)
+        for value in (0.05, 0.5, 5.0):
+            latency.labels("x").observe(value)
+        registry.callback("queued", "排队数", ("backend",), lambda: {("x",): 3})
+
+        text = registry.render()
+        assert "# TYPE calls_total counter" in text
+        assert 'calls_total{backend="a\\"b"} 3' in text
+        assert 'latency_seconds_bucket{backend="x",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{backend="x",le="1"} 2' in text
+        assert 'latency_seconds_bucket{backend="x",le="+Inf"} 3' in text
+        assert 'latency_seconds_count{backend="x"} 3' in text
+        assert 'latency_seconds_sum{backend="x"} 5.55' in text
+        assert 'queued{backend="x"} 3' in text
+
+    def test_metrics_endpoint(self):
+        """测试合成请求后 /metrics 导出合成与 HTTP 指标"""
+        from fastapi.testclient import TestClient
+        from gateway.config import settings
+        from gateway.main import app
+
+        client = TestClient(app)
+        assert client.post("/v1/audio/speech", json={"input": "测试"}).status_code == 200
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert "tts_synthesis_requests_total{" in response.text
+        assert 'route="/v1/audio/speech"' in response.text
+
+        with patch.object(settings, "metrics_enabled", False):
+            assert client.get("/metrics").status_code == 404
+
+
+class TestRateLimit:
+    """测试限流令牌桶存储与客户端地址解析"""
+
+    @pytest.mark.asyncio
+    async def test_bucket_store_refills_and_stays_bounded(self):
+        """测试令牌回填、超出容量时淘汰，以及空闲桶被定期清理"""
+        from gateway.services.rate_limit_store import MemoryBucketStore
+
+        store = MemoryBucketStore(capacity=2, refill_rate=1.0, max_entries=160)
+        assert await store.acquire("a", now=0.0) == (True, 1.0)
+        assert await store.acquire("a", now=0.0) == (True, 0.0)
+        allowed, remaining = await store.acquire("a", now=0.5)
+        assert not allowed and store.retry_after(remaining) == pytest.approx(0.5)
+        assert (await store.acquire("a", now=1.0))[0]
+
+        for i in range(10000):
+            await store.acquire(f"10.0.{i // 256}.{i % 256}", now=1.0)
+        assert len(store) <= 160
+
+        # 空闲超过回填时间后，每秒清理一个分片
+        for second in range(2, 40):
+            await store.acquire("b", now=float(second))
+        assert len(store) == 1
+
+    @pytest.mark.asyncio
+    async def test_sqlite_store_shared_between_workers(self, tmp_path):
+        """测试两个 worker 使用同一个 SQLite 文件时共享限额"""
+        from gateway.services.rate_limit_store import SQLiteBucketStore
+
+        db_file = tmp_path / "rate_limit.db"
+        worker_a = SQLiteBucketStore(db_file, capacity=3, refill_rate=0.001)
+        worker_b = SQLiteBucketStore(db_file, capacity=3, refill_rate=0.001)
+
+        results = await asyncio.gather(*[
+            (worker_a if i % 2 else worker_b).acquire("1.2.3.4") for i in range(6)
+        ])
+        assert sum(allowed for allowed, _ in results) == 3
+        assert (await worker_a.acquire("5.6.7.8"))[0]
+
+    def test_sqlite_limiter_sweep_keeps_day_quota(self, tmp_path):
+        """测试限流与按天的配额共用 SQLite 文件时，限流的清理不会重置配额"""
+        import time
+        from gateway.services.rate_limit_store import SQLiteBucketStore
+
+        db_file = tmp_path / "rate_limit.db"
+        limiter = SQLiteBucketStore(db_file, capacity=60, refill_rate=1.0)
+        day_quota = SQLiteBucketStore(db_file, capacity=1000, refill_rate=1000 / 86400, table="quota_ip_day")
+
+        now = time.time()
+        assert day_quota._take("quota:ip:day:1.2.3.4", 900, now)[0]
+        # 限流存储的空闲时间为 60 秒，61 秒后清理
+        limiter._take("1.2.3.4", 1, now + 61)
+        assert not day_quota._take("quota:ip:day:1.2.3.4", 900, now + 62)[0]
+
+    @pytest.mark.asyncio
+    async def test_redis_store_with_stand_in_client(self):
+        """测试 Redis 存储通过脚本原子判定（使用本地替身客户端）"""
+        from gateway.services.rate_limit_store import RedisBucketStore
+
+        class StandInRedis:
+            """按与 Lua 脚本相同的规则在本地执行的替身"""
+
+            def __init__(self):
+                self.data = {}
+                self.calls = []
+
+            async def eval(self, script, numkeys, key, capacity, rate, cost, ttl_ms):
+                self.calls.append((numkeys, key, ttl_ms))
+                tokens = self.data.get(key, float(capacity))
+                allowed = 1 if tokens >= cost else 0
+                if allowed:
+                    tokens -= cost
+                self.data[key] = tokens
+                return [allowed, str(tokens)]
+
+        client = StandInRedis()
+        store = RedisBucketStore(client, capacity=2, refill_rate=1.0, prefix="test:")
+        assert await store.acquire("1.2.3.4") == (True, 1.0)
+        assert await store.acquire("1.2.3.4") == (True, 0.0)
+        assert await store.acquire("1.2.3.4") == (False, 0.0)
+        assert client.calls[0] == (1, "test:1.2.3.4", 2000)
+
+    @pytest.mark.asyncio
+    async def test_quota_charges_characters_times_backend_cost(self):
+        """测试配额按字数乘以后端成本系数扣除，密钥配额与 IP 配额同时生效"""
+        from starlette.requests import Request
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.quota_service import QuotaExceededError, QuotaService
+
+        def connection(private_key=None):
+            headers = [(b"x-private-key", private_key.encode())] if private_key else []
+            return Request({"type": "http", "client": ("1.2.3.4", 1), "headers": headers})
+
+        quota = QuotaService(
+            enabled=True,
+            limits={("ip", "minute"): 30, ("ip", "day"): 0, ("key", "minute"): 8},
+            backend_costs={"indextts-2.0": 2.0},
+        )
+        request = TTSRequest(model="indextts-2.0", input="你好世界")
+        charge = await quota.charge(connection(), [request])
+        assert charge.headers() == {"X-Quota-Cost": "8", "X-Quota-Remaining-Minute": "22"}
+
+        # 密钥配额先耗尽时拒绝，已扣除的 IP 配额被退还
+        await quota.charge(connection("secret"), [request])
+        with pytest.raises(QuotaExceededError) as exc_info:
+            await quota.charge(connection("secret"), [request])
+        assert int(exc_info.value.headers["Retry-After"]) >= 1
+        assert (await quota.charge(connection(), [TTSRequest(model="qwen3-tts", input="abcd")])).headers() == {
+            "X-Quota-Cost": "4", "X-Quota-Remaining-Minute": "10",
+        }
+
+        # 单次请求超过窗口额度时直接拒绝
+        with pytest.raises(QuotaExceededError, match="拆分"):
+            await quota.charge(connection(), [TTSRequest(model="qwen3-tts", input="x" * 31)])
+
+    def test_quota_exceeded_returns_429(self):
+        """测试超出合成配额时返回 429，未超出时响应带配额头"""
+        from fastapi.testclient import TestClient
+        from gateway.api.v1 import audio
+        from gateway.main import app
+        from gateway.services.quota_service import QuotaService
+
+        quota = QuotaService(enabled=True, limits={("ip", "minute"): 5})
+        with patch.object(audio, "quota_service", quota):
+            client = TestClient(app)
+            response = client.post("/v1/audio/speech", json={"input": "测试"})
+            assert response.status_code == 200
+            assert response.headers["X-Quota-Remaining-Minute"] == "3"
+
+            response = client.post("/v1/audio/speech", json={"input": "测试测试"})
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+
+    def test_asgi_middlewares_add_headers_to_streaming_response(self):
+        """测试 ASGI 中间件在流式响应开始时追加响应头，超出限额时返回 429"""
+        from fastapi import FastAPI
+        from fastapi.responses import StreamingResponse
+        from fastapi.testclient import TestClient
+        from gateway.middleware import LoggingMiddleware, RateLimitMiddleware
+        from gateway.services.rate_limit_store import MemoryBucketStore
+
+        app = FastAPI()
+
+        @app.get("/stream")
+        async def stream():
+            async def chunks():
+                for part in (b"a", b"b", b"c"):
+                    yield part
+            return StreamingResponse(chunks())
+
+        app.add_middleware(RateLimitMiddleware, requests_per_minute=60, store=MemoryBucketStore(1, 0.001))
+        app.add_middleware(LoggingMiddleware)
+        client = TestClient(app)
+
+        response = client.get("/stream")
+        assert response.content == b"abc"
+        assert response.headers["X-RateLimit-Remaining"] == "0"
+        assert response.headers["X-Response-Time"].endswith("ms")
+
+        response = client.get("/stream")
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert "X-Response-Time" in response.headers
+
+    def test_forwarded_for_only_from_trusted_proxy(self):
+        """测试只有受信任代理转发的请求才采用 X-Forwarded-For"""
+        from starlette.requests import Request
+        from gateway.utils.network import get_client_ip, parse_networks
+
+        def request(peer, forwarded_for):
+            return Request({
+                "type": "http",
+                "client": (peer, 1234),
+                "headers": [(b"x-forwarded-for", forwarded_for.encode())],
+            })
+
+        trusted = parse_networks(["10.0.0.0/8", "not-an-ip"])
+        assert get_client_ip(request("203.0.113.9", "1.2.3.4"), trusted) == "203.0.113.9"
+        # 客户端伪造的最左侧条目被忽略，取最右侧的不受信任地址
+        assert get_client_ip(request("10.0.0.1", "1.2.3.4, 198.51.100.7, 10.0.0.2"), trusted) == "198.51.100.7"
+        assert get_client_ip(request("10.0.0.1", "garbage"), trusted) == "10.0.0.1"
+
+        # 默认配置信任本机反向代理（deploy/nginx 的部署方式）
+        from gateway.config import Settings
+        default = parse_networks(Settings.model_fields["trusted_proxies"].default)
+        assert get_client_ip(request("127.0.0.1", "198.51.100.7"), default) == "198.51.100.7"
+        assert get_client_ip(request("::1", "198.51.100.7"), default) == "198.51.100.7"
+
+
+class TestResilience:
+    """测试重试与对冲"""
+
+    def test_is_retryable(self):
+        """测试只重试连接失败与 502/503/504"""
+        import httpx
+        from gateway.services.resilience import is_retryable
+
+        def status_error(code):
+            request = httpx.Request("POST", "http://backend")
+            response = httpx.Response(code, request=request)
+            try:
+                raise Exception("wrapped") from httpx.HTTPStatusError("err", request=request, response=response)
+            except Exception as e:
+                return e
+
+        assert is_retryable(httpx.ConnectError("refused"))
+        assert is_retryable(httpx.ReadTimeout("slow"))
+        assert is_retryable(status_error(503))
+        assert not is_retryable(status_error(400))
+        assert not is_retryable(Exception("bad voice"))
+
+    @pytest.mark.asyncio
+    async def test_retries_transient_errors_within_budget(self):
+        """测试临时错误重试成功，预算耗尽后不再重试"""
+        import httpx
+        from gateway.adapters.mock_adapter import MockAdapter
+        from gateway.services.resilience import ResiliencePolicy, RetryBudget
+
+        adapter = MockAdapter()
+        attempts = []
+
+        async def flaky(target):
+            attempts.append(target)
+            if len(attempts) % 2 == 1:
+                raise httpx.ConnectError("refused")
+            return b"audio"
+
+        policy = ResiliencePolicy(max_attempts=3, base_delay=0, budget=RetryBudget(ratio=0, min_retries=1))
+        assert await policy.call("segment", adapter, flaky) == b"audio"
+        assert len(attempts) == 2
+
+        with pytest.raises(httpx.ConnectError):
+            await policy.call("segment", adapter, flaky)
+        assert len(attempts) == 3
+
+    @pytest.mark.asyncio
+    async def test_hedge_to_alternate(self):
+        """测试超过阈值后对冲，取先完成的结果并取消另一个"""
+        from gateway.adapters.mock_adapter import MockAdapter
+        from gateway.services.resilience import ResiliencePolicy
+
+        slow, fast = MockAdapter(backend_id="slow"), MockAdapter(backend_id="fast")
+        policy = ResiliencePolicy(hedge_enabled=True, hedge_min_delay=0.01, hedge_min_samples=1)
+        policy.tracker("slow:segment").observe(0.01)
+        cancelled = asyncio.Event()
+
+        async def call(target):
+            if target is slow:
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+            return target.backend_id
+
+        assert await asyncio.wait_for(policy.call("segment", slow, call, alternate=fast), 1) == "fast"
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    @pytest.mark.asyncio
+    async def test_stream_retried_before_first_chunk(self, reset_adapters):
+        """测试流式合成在输出前失败时重试"""
+        import httpx
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.resilience import ResiliencePolicy
+        from gateway.services.tts_service import TTSService
+
+        adapter = AdapterFactory.get("indextts-2.0")
+        original = adapter.stream_speech
+        calls = []
+
+        async def flaky_stream(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise httpx.ConnectError("refused")
+            async for chunk in original(**kwargs):
+                yield chunk
+
+        service = TTSService(resilience=ResiliencePolicy(max_attempts=2, base_delay=0))
+        with patch.object(adapter, "stream_speech", side_effect=flaky_stream):
+            audio, _ = await service.generate_speech(
+                TTSRequest(model="indextts-2.0", input="测试", voice="alloy"), use_cache=False
+            )
+
+        assert audio[:4] == b"RIFF"
+        assert len(calls) == 2
+
+    def test_hedge_only_within_replica_pool(self):
+        """测试只对冲到同一后端的其他副本，不对冲到其他后端"""
+        from gateway.adapters.mock_adapter import MockAdapter
+        from gateway.adapters.pool import ReplicaPool
+        from gateway.services.resilience import ResiliencePolicy
+        from gateway.services.tts_service import TTSService
+
+        service = TTSService(resilience=ResiliencePolicy(hedge_enabled=True))
+        pool = ReplicaPool([MockAdapter(backend_id="indextts-2.0") for _ in range(2)])
+
+        assert service._hedge_target(pool) is pool
+        assert service._hedge_target(MockAdapter(backend_id="indextts-2.0")) is None
+
+
+class TestStreaming:
+    """测试流式合成"""
+
+    @pytest.mark.asyncio
+    async def test_indextts_stream_forwards_chunks(self):
+        """测试 IndexTTS 流式转发后端分块"""
+        import httpx
+        from gateway.adapters.indextts_adapter import IndexTTSAdapter
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, content=b"RIFF" + b"\x00" * 1024)
+
+        adapter = IndexTTSAdapter(base_url="http://indextts")
+        adapter._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        chunks = [c async for c in adapter.stream_speech(text="测试", voice="alloy")]
+        assert b"".join(chunks) == b"RIFF" + b"\x00" * 1024
+        await adapter.aclose()
+
+    @pytest.mark.asyncio
+    async def test_indextts_stream_error_detail(self):
+        """测试 IndexTTS 流式请求错误详情"""
+        import httpx
+        from gateway.adapters.indextts_adapter import IndexTTSAdapter
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(400, json={"detail": "voice not found"})
+
+        adapter = IndexTTSAdapter(base_url="http://indextts")
+        adapter._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        with pytest.raises(Exception, match="voice not found"):
+            async for _ in adapter.stream_speech(text="测试", voice="missing"):
+                pass
+        await adapter.aclose()
+
+    @pytest.mark.asyncio
+    async def test_service_stream_speech(self, reset_adapters):
+        """测试服务层流式合成"""
+        from gateway.services.tts_service import TTSService
+        from gateway.schemas.request import TTSRequest
+
+        service = TTSService()
+        request = TTSRequest(model="indextts-2.0", input="测试文本", voice="alloy")
+
+        audio_stream, metadata = await service.stream_speech(request)
+        audio_data = b"".join([chunk async for chunk in audio_stream])
+
+        assert audio_data[:4] == b"RIFF"
+        assert metadata["model_used"] == "indextts-2.0"
+
+
+class TestSegmentation:
+    """测试长文本分段合成"""
+
+    def test_split_text_on_sentences(self):
+        """测试按中英文句末标点切分"""
+        from gateway.services.tts_service import split_text
+
+        chunks = split_text("你好。今天天气不错！Is it 3.14 ok? Yes.", 16)
+        assert chunks == ["你好。今天天气不错！", "Is it 3.14 ok?", "Yes."]
+
+    def test_split_text_keeps_words_whole(self):
+        """测试英文超长句按空格切分"""
+        from gateway.services.tts_service import split_text
+
+        chunks = split_text("the quick brown fox jumps over the lazy dog", 12)
+        assert all(len(c) <= 12 for c in chunks)
+        assert " ".join(chunks) == "the quick brown fox jumps over the lazy dog"
+
+    def test_split_text_bounds_chunk_length(self):
+        """测试超长句子被切到长度上限以内"""
+        from gateway.services.tts_service import split_text
+
+        text = "这是一个没有句号的超长句子" * 20
+        chunks = split_text(text, 50)
+        assert all(len(c) <= 50 for c in chunks)
+        assert "".join(chunks) == text
+
+    @pytest.mark.asyncio
+    async def test_generate_long_text_in_segments(self, reset_adapters):
+        """测试长文本分段并发合成并按顺序拼接"""
+        import io
+        import wave
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.services.tts_service import TTSService
+        from gateway.schemas.request import TTSRequest
+
+        adapter = AdapterFactory.get("indextts-2.0")
+        calls = []
+        original = adapter.generate_speech
+
+        async def tracking_generate(text, voice, **kwargs):
+            calls.append(text)
+            return await original(text=text, voice=voice, **kwargs)
+
+        with patch.object(adapter, "generate_speech", side_effect=tracking_generate):
+            service = TTSService()
+            request = TTSRequest(
+                model="indextts-2.0",
+                input="第一句话。" * 30 + "最后一句。",
+                voice="alloy",
+            )
+            audio_data, _ = await service.generate_speech(request)
+
+        assert len(calls) > 1
+        assert "".join(calls) == request.input
+        with wave.open(io.BytesIO(audio_data)) as wav_file:
+            assert wav_file.getnframes() > 0
+
+    @pytest.mark.asyncio
+    async def test_each_segment_takes_admission_slot(self, reset_adapters):
+        """测试分段合成的每段各占一个准入名额"""
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.config import settings
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.admission_service import AdmissionService
+        from gateway.services.tts_service import TTSService
+
+        adapter = AdapterFactory.get("indextts-2.0")
+        original = adapter.generate_speech
+        service = TTSService(admission=AdmissionService())
+        controller = service.admission.get("indextts-2.0")
+        active = []
+
+        async def tracking_generate(text, voice, **kwargs):
+            active.append(controller.active)
+            await asyncio.sleep(0.01)
+            return await original(text=text, voice=voice, **kwargs)
+
+        with patch.object(adapter, "generate_speech", side_effect=tracking_generate), \
+                patch.object(settings, "indextts_segment_concurrency", 3):
+            request = TTSRequest(model="indextts-2.0", input="第一句话。" * 60, voice="alloy")
+            await service.generate_speech(request, use_cache=False)
+
+        assert max(active) == 3
+        assert controller.active == 0
+        assert controller.stats()["admitted_total"] == len(active)
+
+    @pytest.mark.asyncio
+    async def test_stream_long_text_in_segments(self, reset_adapters):
+        """测试长文本流式输出：先输出 WAV 头，再依次输出各段 PCM"""
+        from gateway.services.tts_service import TTSService
+        from gateway.schemas.request import TTSRequest
+        from gateway.utils.audio import STREAMING_SIZE
+
+        service = TTSService()
+        request = TTSRequest(
+            model="indextts-2.0",
+            input="第一句话。" * 30,
+            voice="alloy",
+        )
+        audio_stream, _ = await service.stream_speech(request)
+        chunks = [chunk async for chunk in audio_stream]
+
+        assert len(chunks) > 2
+        assert chunks[0][:4] == b"RIFF"
+        assert chunks[0][-4:] == STREAMING_SIZE.to_bytes(4, "little")
+
+
+class TestSynthesisCache:
+    """测试合成结果缓存"""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        from gateway.services.cache_service import SynthesisCache
+        return SynthesisCache(cache_dir=tmp_path, memory_max_bytes=100)
+
+    def test_make_key_is_canonical(self):
+        """测试参数顺序不影响缓存 key"""
+        from gateway.services.cache_service import SynthesisCache
+
+        key1 = SynthesisCache.make_key("indextts-2.0", "你好", "alloy", {"speed": 1.0, "top_k": 20})
+        key2 = SynthesisCache.make_key("indextts-2.0", "你好", "alloy", {"top_k": 20, "speed": 1.0})
+        key3 = SynthesisCache.make_key("qwen3-tts", "你好", "alloy", {"speed": 1.0, "top_k": 20})
+        assert key1 == key2
+        assert key1 != key3
+
+    @pytest.mark.asyncio
+    async def test_memory_lru_eviction(self, cache):
+        """测试内存层按字节数淘汰最久未使用的条目"""
+        cache.disk_enabled = False
+        await cache.set("a", b"x" * 40)
+        await cache.set("b", b"y" * 40)
+        await cache.get("a")
+        await cache.set("c", b"z" * 40)
+
+        assert await cache.get("a") == b"x" * 40
+        assert await cache.get("b") is None
+        assert await cache.get("c") == b"z" * 40
+
+    @pytest.mark.asyncio
+    async def test_disk_tier_hit_after_memory_eviction(self, cache):
+        """测试内存淘汰后仍可从磁盘层命中"""
+        await cache.set("a", b"x" * 80)
+        await cache.set("b", b"y" * 80)
+
+        assert "a" not in cache._memory
+        assert await cache.get("a") == b"x" * 80
+
+    @pytest.mark.asyncio
+    async def test_service_cache_hit(self, tmp_path, reset_adapters):
+        """测试相同请求第二次命中缓存且不再调用后端"""
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.services.cache_service import SynthesisCache
+        from gateway.services.tts_service import TTSService
+        from gateway.schemas.request import TTSRequest
+
+        service = TTSService(cache=SynthesisCache(cache_dir=tmp_path))
+        request = TTSRequest(model="indextts-2.0", input="缓存测试", voice="alloy")
+
+        first, metadata = await service.generate_speech(request)
+        assert metadata["cache"] == "MISS"
+
+        adapter = AdapterFactory.get("indextts-2.0")
+        with patch.object(adapter, "generate_speech", new=AsyncMock()) as backend:
+            audio_stream, metadata = await service.stream_speech(request)
+            second = b"".join([chunk async for chunk in audio_stream])
+            backend.assert_not_called()
+
+        assert metadata["cache"] == "HIT"
+        assert second == first
+
+    @pytest.mark.asyncio
+    async def test_stream_populates_cache(self, tmp_path, reset_adapters):
+        """测试流式合成完成后写入缓存"""
+        from gateway.services.cache_service import SynthesisCache
+        from gateway.services.tts_service import TTSService
+        from gateway.schemas.request import TTSRequest
+
+        service = TTSService(cache=SynthesisCache(cache_dir=tmp_path))
+        request = TTSRequest(model="qwen3-tts", input="流式缓存", voice="alloy")
+
+        audio_stream, _ = await service.stream_speech(request)
+        streamed = b"".join([chunk async for chunk in audio_stream])
+
+        cached, metadata = await service.generate_speech(request)
+        assert metadata["cache"] == "HIT"
+        assert cached == streamed
+
+    @pytest.mark.asyncio
+    async def test_cache_bypass(self, tmp_path, reset_adapters):
+        """测试显式跳过缓存"""
+        from gateway.services.cache_service import SynthesisCache
+        from gateway.services.tts_service import TTSService
+        from gateway.schemas.request import TTSRequest
+
+        service = TTSService(cache=SynthesisCache(cache_dir=tmp_path))
+        request = TTSRequest(model="qwen3-tts", input="跳过缓存", voice="alloy")
+
+        _, metadata = await service.generate_speech(request, use_cache=False)
+        assert metadata["cache"] == "BYPASS"
+
+    def test_bypass_sampling_ignores_defaults(self, tmp_path):
+        """测试 bypass_sampling 只跳过采样参数与默认值不同的请求"""
+        from gateway.services.cache_service import SynthesisCache
+        from gateway.services.tts_service import TTSService
+        from gateway.schemas.request import TTSRequest
+
+        service = TTSService(cache=SynthesisCache(cache_dir=tmp_path))
+        default = TTSRequest(model="indextts-2.0", input="测试")
+        sampled = TTSRequest(model="indextts-2.0", input="测试", temperature=0.7)
+
+        with patch("gateway.services.tts_service.settings.cache_bypass_sampling", True):
+            assert service._is_cacheable(service._prepare_kwargs(default, "indextts-2.0"), True)
+            assert not service._is_cacheable(service._prepare_kwargs(sampled, "indextts-2.0"), True)
+
+
+class TestRequestCoalescing:
+    """测试相同请求合并"""
+
+    @pytest.fixture
+    def slow_backend(self, reset_adapters):
+        """将 IndexTTS Mock 替换为带延迟、可计数的后端"""
+        from gateway.adapters.factory import AdapterFactory
+
+        adapter = AdapterFactory.get("indextts-2.0")
+        state = {"calls": 0, "cancelled": 0, "error": None}
+
+        async def slow_generate(text, voice, **kwargs):
+            state["calls"] += 1
+            try:
+                await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                state["cancelled"] += 1
+                raise
+            if state["error"]:
+                raise state["error"]
+            return b"RIFF-audio-" + text.encode("utf-8")
+
+        with patch.object(adapter, "generate_speech", side_effect=slow_generate):
+            yield state
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_requests_share_backend_call(self, slow_backend):
+        """测试并发相同请求只调用一次后端"""
+        from gateway.services.tts_service import TTSService
+        from gateway.schemas.request import TTSRequest
+
+        service = TTSService()
+        request = TTSRequest(model="indextts-2.0", input="合并测试", voice="alloy")
+
+        results = await asyncio.gather(
+            *[service.generate_speech(request) for _ in range(5)]
+        )
+
+        assert slow_backend["calls"] == 1
+        assert all(audio == "RIFF-audio-合并测试".encode() for audio, _ in results)
+        assert sum(1 for _, metadata in results if metadata.get("coalesced")) == 4
+        assert service._inflight == {}
+
+    @pytest.mark.asyncio
+    async def test_error_propagates_to_all_waiters(self, slow_backend):
+        """测试后端错误传递给所有等待者"""
+        from gateway.services.tts_service import TTSService
+        from gateway.schemas.request import TTSRequest
+
+        slow_backend["error"] = RuntimeError("backend down")
+        service = TTSService()
+        request = TTSRequest(model="indextts-2.0", input="错误测试", voice="alloy")
+
+        results = await asyncio.gather(
+            *[service.generate_speech(request) for _ in range(3)],
+            return_exceptions=True,
+        )
+
+        assert slow_backend["calls"] == 1
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    @pytest.mark.asyncio
+    async def test_leader_disconnect_keeps_followers(self, slow_backend):
+        """测试发起者取消后，其他等待者仍能拿到结果"""
+        from gateway.services.tts_service import TTSService
+        from gateway.schemas.request import TTSRequest
+
+        service = TTSService()
+        request = TTSRequest(model="indextts-2.0", input="断开测试", voice="alloy")
+
+        leader = asyncio.create_task(service.generate_speech(request))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(service.generate_speech(request))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        audio, _ = await follower
+        assert audio == "RIFF-audio-断开测试".encode()
+        assert slow_backend["calls"] == 1
+        assert slow_backend["cancelled"] == 0
+
+    @pytest.mark.asyncio
+    async def test_all_disconnect_cancels_backend(self, slow_backend):
+        """测试所有等待者都取消后，后端调用被取消"""
+        from gateway.services.tts_service import TTSService
+        from gateway.schemas.request import TTSRequest
+
+        service = TTSService()
+        request = TTSRequest(model="indextts-2.0", input="全部断开", voice="alloy")
+
+        tasks = [asyncio.create_task(service.generate_speech(request)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert slow_backend["cancelled"] == 1
+        assert service._inflight == {}
+
+    @pytest.mark.asyncio
+    async def test_replay_buffer_bounded(self, reset_adapters):
+        """测试缓存的分块超过上限后不再合并，已读分块随即释放"""
+        from gateway.adapters.factory import AdapterFactory
+        from gateway.config import settings
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.tts_service import TTSService
+
+        adapter = AdapterFactory.get("indextts-2.0")
+
+        async def long_stream(text, voice, **kwargs):
+            for _ in range(20):
+                await asyncio.sleep(0)
+                yield b"x" * 100
+
+        service = TTSService()
+        request = TTSRequest(model="indextts-2.0", input="长音频", voice="alloy")
+        with patch.object(adapter, "stream_speech", side_effect=long_stream), \
+                patch.object(settings, "coalesce_replay_max_bytes", 250):
+            stream, _ = await service.stream_speech(request, use_cache=False)
+            flight = next(iter(service._inflight.values()))
+            buffered, total = [], 0
+            async for chunk in stream:
+                total += len(chunk)
+                buffered.append(flight.buffered)
+                if total == 1000:
+                    # 已停止合并，新的相同请求单独合成
+                    assert service._inflight.get(flight.key) is not flight
+
+        assert total == 2000
+        assert max(buffered) <= 300
+        assert flight.chunks == []
+
+    @pytest.mark.asyncio
+    async def test_disabled_coalescing_passes_chunks_through(self, slow_backend):
+        """测试关闭合并时不创建共享的合成任务"""
+        from gateway.config import settings
+        from gateway.schemas.request import TTSRequest
+        from gateway.services.tts_service import TTSService
+
+        service = TTSService()
+        request = TTSRequest(model="indextts-2.0", input="不合并", voice="alloy")
+        with patch.object(settings, "coalesce_enabled", False):
+            results = await asyncio.gather(
+                *[service.generate_speech(request, use_cache=False) for _ in range(2)]
+            )
+
+        assert slow_backend["calls"] == 2
+        assert not any(metadata.get("coalesced") for _, metadata in results)
+        assert service._inflight == {}
+
+
+class TestMetadataService:
+    """测试音色元数据服务"""
+
+    @pytest.fixture
+    def service(self, tmp_path):
+        from gateway.services.metadata_service import MetadataService
+        return MetadataService(data_path=tmp_path)
+
+    @pytest.mark.asyncio
+    async def test_save_and_query(self, service):
+        """测试保存后可按 ID、后端、可见性查询"""
+        await service.save_voice_metadata("v1", backend="qwen3-tts", visibility="public")
+        await service.save_voice_metadata("v2", backend="indextts-2.0", visibility="public")
+
+        assert (await service.get_voice_metadata("v1"))["backend"] == "qwen3-tts"
+        assert {v["id"] for v in await service.list_public_voices()} == {"v1", "v2"}
+        assert [v["id"] for v in await service.list_voices_by_backend("indextts-2.0")] == ["v2"]
+        assert await service.get_all_voice_ids_with_visibility() == {"v1": "public", "v2": "public"}
+
+    @pytest.mark.asyncio
+    async def test_reads_do_not_reparse_file(self, service):
+        """测试读取走内存索引，不重复解析文件"""
+        await service.save_voice_metadata("v1", backend="qwen3-tts")
+
+        with patch.object(service.store, "_load_metadata", wraps=service.store._load_metadata) as load:
+            for _ in range(10):
+                await service.get_voice_metadata("v1")
+                await service.list_public_voices()
+            load.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_reload_on_external_change(self, service):
+        """测试文件被其他进程修改后重新加载"""
+        import json
+        from gateway.services.metadata_service import MetadataService
+
+        await service.save_voice_metadata("v1", backend="qwen3-tts")
+
+        other_worker = MetadataService(data_path=service.data_path)
+        await other_worker.save_voice_metadata("v2", backend="indextts-2.0")
+
+        assert await service.get_voice_metadata("v2") is not None
+        with open(service.store.metadata_file, encoding="utf-8") as f:
+            assert set(json.load(f)["voices"]) == {"v1", "v2"}
+
+    @pytest.mark.asyncio
+    async def test_delete_updates_index(self, service):
+        """测试删除后索引同步更新"""
+        await service.save_voice_metadata("v1", backend="qwen3-tts")
+
+        assert await service.delete_metadata("v1") is True
+        assert await service.delete_metadata("v1") is False
+        assert await service.get_voice_metadata("v1") is None
+        assert await service.list_voices_by_backend("qwen3-tts") == []
+
+    @pytest.mark.asyncio
+    async def test_burst_writes_coalesced(self, service):
+        """测试并发写入合并为一次原子落盘"""
+        import json
+
+        with patch.object(service.store, "_save_metadata", wraps=service.store._save_metadata) as save:
+            await asyncio.gather(*[
+                service.save_voice_metadata(f"v{i}", backend="indextts-2.0")
+                for i in range(20)
+            ])
+            assert save.call_count == 1
+
+        raw = service.store.metadata_file.read_text(encoding="utf-8")
+        assert "\n" not in raw
+        assert len(json.loads(raw)["voices"]) == 20
+        assert not list(service.data_path.glob("*.tmp"))
+
+    @pytest.mark.asyncio
+    async def test_flush_merges_external_writes(self, service):
+        """测试落盘时保留合并窗口内其他进程写入的音色"""
+        from gateway.services.metadata_service import MetadataService
+        from gateway.services.metadata_store import JsonFileMetadataStore
+
+        service.store.flush_delay = 0.05
+        other_worker = MetadataService(
+            data_path=service.data_path,
+            store=JsonFileMetadataStore(service.store.metadata_file, flush_delay=0),
+        )
+
+        pending = asyncio.create_task(service.save_voice_metadata("mine", backend="qwen3-tts"))
+        await asyncio.sleep(0.01)
+        await other_worker.save_voice_metadata("theirs", backend="qwen3-tts")
+        await pending
+
+        reader = MetadataService(data_path=service.data_path)
+        assert await reader.get_voice_metadata("mine") is not None
+        assert await reader.get_voice_metadata("theirs") is not None
+
+    @pytest.mark.asyncio
+    async def test_private_lookup_verifies_key_once(self, service):
+        """测试按密钥查询私人音色只做一次 PBKDF2 校验"""
+        from gateway.utils.crypto import verify_key_async
+
+        for i in range(5):
+            await service.save_voice_metadata(f"mine{i}", backend="qwen3-tts", visibility="private", private_key="k1")
+            await service.save_voice_metadata(f"other{i}", backend="qwen3-tts", visibility="private", private_key="k2")
+
+        with patch("gateway.services.metadata_service.verify_key_async", wraps=verify_key_async) as verify:
+            voices = await service.list_private_voices_by_key("k1")
+            assert verify.call_count == 1
+            assert await service.list_private_voices_by_key("nope") == []
+            assert verify.call_count == 1
+
+        assert {v["id"] for v in voices} == {f"mine{i}" for i in range(5)}
+        assert await service.verify_voice_access("mine0", "k1") is True
+        assert await service.verify_voice_access("mine0", "k2") is False
+
+    @pytest.mark.asyncio
+    async def test_legacy_private_voice_backfilled(self, service):
+        """测试没有查找标签的旧私人音色仍可访问并补写标签"""
+        from gateway.utils.crypto import hash_key, verify_key_async
+
+        salt, key_hash = hash_key("k1")
+        await service.store.put({
+            "id": "legacy", "backend": "qwen3-tts", "visibility": "private",
+            "key_salt": salt, "key_hash": key_hash,
+        })
+
+        assert [v["id"] for v in await service.list_private_voices_by_key("k1")] == ["legacy"]
+        assert (await service.get_voice_metadata("legacy"))["key_tag"] == service.key_tag("k1")
+
+        with patch("gateway.services.metadata_service.verify_key_async", wraps=verify_key_async) as verify:
+            assert [v["id"] for v in await service.list_private_voices_by_key("k1")] == ["legacy"]
+            assert verify.call_count == 1
+
+        # 全部补写标签后不再查询未打标签的音色
+        with patch.object(service.store, "list_untagged_private", wraps=service.store.list_untagged_private) as scan:
+            await service.list_private_voices_by_key("k1")
+            await service.list_private_voices_by_key("k2")
+            assert scan.call_count <= 1
+
+    @pytest.mark.asyncio
+    async def test_untagged_mismatch_verified_once(self, service):
+        """测试不匹配的密钥与未打标签的旧音色只比对一次，之后命中校验缓存"""
+        from gateway.utils import crypto
+
+        for voice_id in ("legacy1", "legacy2"):
+            salt, key_hash = crypto.hash_key("k1")
+            await service.store.put({
+                "id": voice_id, "backend": "qwen3-tts", "visibility": "private",
+                "key_salt": salt, "key_hash": key_hash,
+            })
+
+        with patch.object(crypto, "verify_key", wraps=crypto.verify_key) as verify:
+            for _ in range(3):
+                assert await service.list_private_voices_by_key("nope") == []
+            assert verify.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_untagged_lookup_skips_public_voices(self, service):
+        """测试未打标签音色的查询只返回设置了密钥的私人音色"""
+        from gateway.utils.crypto import hash_key
+
+        salt, key_hash = hash_key("k1")
+        await service.store.put({"id": "pub", "backend": "qwen3-tts", "visibility": "public"})
+        await service.store.put({"id": "nokey", "backend": "qwen3-tts", "visibility": "private"})
+        await service.store.put({
+            "id": "legacy", "backend": "qwen3-tts", "visibility": "private",
+            "key_salt": salt, "key_hash": key_hash,
+        })
+        assert [v["id"] for v in await service.store.list_untagged_private()] == ["legacy"]
+
+
+class TestCryptoExecutor:
+    """测试密钥计算线程池与校验缓存"""
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        from gateway.utils.crypto import verified_key_cache
+        verified_key_cache.clear()
+        yield
+        verified_key_cache.clear()
+
+    @pytest.mark.asyncio
+    async def test_runs_off_event_loop(self):
+        """测试 PBKDF2 在独立线程中执行"""
+        import threading
+        from gateway.utils import crypto
+
+        threads = []
+        original = crypto.hash_key
+
+        def record(*args):
+            threads.append(threading.current_thread().name)
+            return original(*args)
+
+        with patch.object(crypto, "hash_key", side_effect=record):
+            salt, key_hash = await crypto.hash_key_async("k1")
+
+        assert threads[0].startswith("crypto")
+        assert await crypto.verify_key_async("k1", salt, key_hash) is True
+        assert await crypto.verify_key_async("k2", salt, key_hash) is False
+
+    @pytest.mark.asyncio
+    async def test_verified_key_cached(self):
+        """测试校验结果（通过与不通过）在有效期内不重复计算"""
+        from gateway.utils import crypto
+
+        salt, key_hash = crypto.hash_key("k1")
+        with patch.object(crypto, "verify_key", wraps=crypto.verify_key) as verify:
+            for _ in range(3):
+                assert await crypto.verify_key_async("k1", salt, key_hash) is True
+            assert verify.call_count == 1
+
+            # 错误密钥的结果同样缓存
+            for _ in range(2):
+                assert await crypto.verify_key_async("bad", salt, key_hash) is False
+            assert verify.call_count == 2
+
+    def test_cache_bounded_and_expires(self):
+        """测试缓存条数上限与过期"""
+        from gateway.utils.crypto import VerifiedKeyCache
+
+        cache = VerifiedKeyCache(ttl=300, max_size=2)
+        for key in ("a", "b", "c"):
+            cache.add(key, "salt", "hash")
+        cache.add("d", "salt", "hash", valid=False)
+        assert cache.get("b", "salt", "hash") is None
+        assert cache.get("c", "salt", "hash") is True
+        assert cache.get("d", "salt", "hash") is False
+        assert cache.get("c", "other-salt", "hash") is None
+
+        with patch("gateway.utils.crypto.time.monotonic", return_value=float("inf")):
+            assert cache.get("c", "salt", "hash") is None
+
+    def test_lookup_secret_created_once_across_workers(self, tmp_path):
+        """测试多个 worker 同时创建查找密钥时读到同一个完整密钥，内容无效时报错"""
+        from concurrent.futures import ThreadPoolExecutor
+        from gateway.utils.crypto import load_or_create_secret
+
+        secret_file = tmp_path / ".key_lookup_secret"
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            secrets = list(pool.map(lambda _: load_or_create_secret(secret_file), range(32)))
+        assert len(secrets[0]) == 32
+        assert len(set(secrets)) == 1
+        assert list(tmp_path.iterdir()) == [secret_file]
+
+        secret_file.write_text("")
+        with pytest.raises(ValueError, match="内容无效"):
+            load_or_create_secret(secret_file)
+
+
+class TestSQLiteMetadataStore:
+    """测试 SQLite 元数据存储"""
+
+    @pytest.fixture
+    def service(self, tmp_path):
+        from gateway.services.metadata_service import MetadataService
+        from gateway.services.metadata_store import SQLiteMetadataStore
+        store = SQLiteMetadataStore(tmp_path / "voices.db")
+        return MetadataService(data_path=tmp_path, store=store)
+
+    @pytest.mark.asyncio
+    async def test_save_and_query(self, service):
+        """测试保存后可按 ID、后端、可见性查询"""
+        await service.save_voice_metadata("v1", backend="qwen3-tts", visibility="public")
+        await service.save_voice_metadata("v2", backend="indextts-2.0", visibility="private", private_key="secret")
+
+        assert (await service.get_voice_metadata("v1"))["backend"] == "qwen3-tts"
+        assert [v["id"] for v in await service.list_public_voices()] == ["v1"]
+        assert [v["id"] for v in await service.list_voices_by_backend("indextts-2.0")] == ["v2"]
+        assert await service.get_all_voice_ids_with_visibility() == {"v1": "public", "v2": "private"}
+        assert [v["id"] for v in await service.list_private_voices_by_key("secret")] == ["v2"]
+        assert await service.store.list_untagged_private() == []
+
+        assert await service.delete_metadata("v1") is True
+        assert await service.delete_metadata("v1") is False
+
+    def test_uses_wal_and_indexes(self, service):
+        """测试启用 WAL 并建立查询索引"""
+        conn = service.store._conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(voices)")}
+        assert {
+            "idx_voices_visibility", "idx_voices_backend", "idx_voices_key_tag", "idx_voices_untagged_private",
+        } <= indexes
+
+    @pytest.mark.asyncio
+    async def test_migrates_legacy_json_once(self, tmp_path):
+        """测试从 voice_metadata.json 一次性迁移"""
+        import json
+        from gateway.services.metadata_store import SQLiteMetadataStore
+
+        legacy = tmp_path / "voice_metadata.json"
+        legacy.write_text(json.dumps({
+            "version": "1.0",
+            "voices": {"old": {"id": "old", "backend": "qwen3-tts", "visibility": "public"}},
+        }), encoding="utf-8")
+
+        store = SQLiteMetadataStore(tmp_path / "voices.db", legacy_json_file=legacy)
+        assert (await store.get("old"))["backend"] == "qwen3-tts"
+        await store.delete("old")
+
+        reopened = SQLiteMetadataStore(tmp_path / "voices.db", legacy_json_file=legacy)
+        assert await reopened.get("old") is None
+
+
 class TestTTSService:
     """测试 TTS 服务"""
 